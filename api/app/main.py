@@ -1,8 +1,20 @@
 import os
-from fastapi import FastAPI, HTTPException
+import time
+from datetime import datetime, timezone
+from typing import List
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from google.cloud import aiplatform
-from app.services.feature_store_client import FeatureStoreClient
+from app.services.feature_backend import build_feature_backend
+from app.services.drift_monitor import DriftMonitor
+from app.services.model_bundle import read_manifest
+from app.services.prediction_log import PredictionLogWriter, build_sink
+from app.services.admission import AdmissionController, Rejected
+from app.services.freshness import FreshnessTracker
+from app.services import codec
+from app.services.shadow import BundleChallenger, EndpointChallenger, ShadowScorer
 
 app = FastAPI(title="FraudShield V3: Real-Time Hybrid API")
 
@@ -10,11 +22,45 @@ app = FastAPI(title="FraudShield V3: Real-Time Hybrid API")
 PROJECT_ID = ""
 REGION = ""
 FEATURE_STORE_ID = "fraudshield_feature_store_dev"
+# Online features: "vertex" (Feature Store above) or "local" (mmap table the pipeline writes on this host)
+FEATURE_BACKEND = os.getenv("FEATURE_BACKEND", "vertex")
+LOCAL_FEATURE_STORE_PATH = os.getenv("LOCAL_FEATURE_STORE_PATH", "/var/lib/fraudshield/features.fsl")
 ENDPOINT_NAME = "fraudshield-hybrid-endpoint"
+# Bundle deployed behind the endpoint; only its manifest (drift baseline) is read here
+MODEL_BUNDLE_URI = os.getenv(
+    "MODEL_BUNDLE_URI",
+    f"gs://fraudshield-artifacts-dev-{PROJECT_ID}/v3_hybrid_model/model_bundle.fsb"
+)
+# Prediction log: "bigquery" (table id) or a local stand-in - "jsonl"/"parquet" (directory), "sqlite" (file)
+PREDICTION_LOG_SINK = os.getenv("PREDICTION_LOG_SINK", "bigquery")
+PREDICTION_LOG_TARGET = os.getenv("PREDICTION_LOG_TARGET", f"{PROJECT_ID}.fraudshield.predictions")
+PREDICTION_LOG_OVERFLOW = os.getenv("PREDICTION_LOG_OVERFLOW", "drop")  # or "spill"
+PREDICTION_LOG_SPILL_DIR = os.getenv("PREDICTION_LOG_SPILL_DIR", "/tmp/prediction_log_spill")
+# Admission control for /v3/score
+SCORE_BUDGET_MS = float(os.getenv("SCORE_BUDGET_MS", "250"))
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", "64"))              # Queued + running requests per instance
+TENANT_RATE = float(os.getenv("TENANT_RATE", "200"))             # Requests/s per tenant (token bucket)
+TENANT_BURST = int(os.getenv("TENANT_BURST", "400"))
+TENANT_MAX_INFLIGHT = int(os.getenv("TENANT_MAX_INFLIGHT", "32"))
+MAX_STALE_SECONDS = float(os.getenv("MAX_STALE_SECONDS", "300")) # Oldest cached features served when degraded
+# Shadow scoring: a challenger endpoint (display name) or an embedded bundle (path / gs://); unset = off
+SHADOW_ENDPOINT_NAME = os.getenv("SHADOW_ENDPOINT_NAME")
+SHADOW_BUNDLE_URI = os.getenv("SHADOW_BUNDLE_URI")
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.05"))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
 
 # Global Clients
 fs_client = None
 endpoint = None
+drift_monitor = None
+global_model_version = None  # Of MODEL_BUNDLE_URI; results from per-tenant models carry other versions
+prediction_log = None
+shadow = None
+admission = AdmissionController(
+    budget_ms=SCORE_BUDGET_MS, max_inflight=MAX_INFLIGHT, tenant_rate=TENANT_RATE,
+    tenant_burst=TENANT_BURST, tenant_max_inflight=TENANT_MAX_INFLIGHT,
+)
+freshness = FreshnessTracker()
 
 class TransactionRequest(BaseModel):
     transaction_id: str
@@ -22,13 +68,17 @@ class TransactionRequest(BaseModel):
     card_id: str
     amount: float
 
+class BatchRequest(BaseModel):
+    transactions: List[TransactionRequest]
+
 @app.on_event("startup")
 def startup_event():
-    global fs_client, endpoint
+    global fs_client, endpoint, drift_monitor, global_model_version, prediction_log, shadow
     print("Initializing V3 Services...")
     
     # 1. Connect to Feature Store
-    fs_client = FeatureStoreClient(PROJECT_ID, REGION, FEATURE_STORE_ID)
+    fs_client = build_feature_backend(FEATURE_BACKEND, PROJECT_ID, REGION, FEATURE_STORE_ID,
+                                      path=LOCAL_FEATURE_STORE_PATH)
     
     # 2. Connect to Vertex Endpoint
     aiplatform.init(project=PROJECT_ID, location=REGION)
@@ -39,35 +89,288 @@ def startup_event():
     else:
         print("WARNING: Endpoint not found. Prediction will fail.")
 
-@app.post("/v3/score")
-def score(txn: TransactionRequest):
-    if not endpoint:
-        raise HTTPException(status_code=503, detail="Model Endpoint unavailable")
+    # 3. In-process drift monitor, baselined on the training distributions
+    try:
+        manifest = read_manifest(MODEL_BUNDLE_URI)
+        drift_monitor = DriftMonitor(manifest["baseline"])
+        global_model_version = manifest["model_version"]
+        print(f"Drift monitor baselined on model {global_model_version} (tenants routed to their own models skipped)")
+    except Exception as e:
+        print(f"WARNING: Drift monitor disabled (no baseline from {MODEL_BUNDLE_URI}): {e}")
 
-    # 1. Fetch Real-Time Features (The "Velocity")
-    # This hits the data your Dataflow job is currently writing
-    velocity = fs_client.get_streaming_features(txn.card_id)
-    
-    # 2. Construct Feature Vector
-    # Order MUST match training: [amount, txn_count_10m, txn_sum_10m]
-    vector = [
-        txn.amount,
-        velocity["txn_count_10m"],
-        velocity["txn_sum_10m"]
-    ]
-    
-    # 3. Call Hybrid Model (The "Brain")
+    # 4. Background prediction log (batched writes, never on the request path)
+    try:
+        sink = build_sink(PREDICTION_LOG_SINK, PREDICTION_LOG_TARGET, PROJECT_ID)
+        prediction_log = PredictionLogWriter(
+            [sink],
+            overflow=PREDICTION_LOG_OVERFLOW,
+            spill_dir=PREDICTION_LOG_SPILL_DIR if PREDICTION_LOG_OVERFLOW == "spill" else None,
+        )
+        print(f"Logging predictions to {PREDICTION_LOG_SINK}:{PREDICTION_LOG_TARGET}")
+    except Exception as e:
+        print(f"WARNING: Prediction logging disabled: {e}")
+
+    # 5. Shadow scoring of a challenger model (off the request path)
+    try:
+        challenger = None
+        if SHADOW_ENDPOINT_NAME:
+            shadow_endpoints = aiplatform.Endpoint.list(filter=f'display_name="{SHADOW_ENDPOINT_NAME}"')
+            if shadow_endpoints:
+                challenger = EndpointChallenger(shadow_endpoints[0])
+            else:
+                print(f"WARNING: Shadow endpoint {SHADOW_ENDPOINT_NAME} not found.")
+        elif SHADOW_BUNDLE_URI:
+            challenger = BundleChallenger(SHADOW_BUNDLE_URI)
+        if challenger:
+            if not challenger.routed and global_model_version is None:
+                print("WARNING: Global model version unknown; tenants on their own models are shadowed "
+                      "against the global challenger too")
+            shadow = ShadowScorer(challenger, sample_rate=SHADOW_SAMPLE_RATE, champion_version=global_model_version)
+            print(f"Shadow scoring {SHADOW_SAMPLE_RATE:.0%} of requests on challenger {challenger.name}")
+    except Exception as e:
+        print(f"WARNING: Shadow scoring disabled: {e}")
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Flush whatever is still buffered before the process exits
+    if prediction_log:
+        prediction_log.close()
+    if shadow:
+        shadow.close()
+
+@app.middleware("http")
+async def admission_gate(request: Request, call_next):
+    # Runs on arrival, before the request waits for a worker thread: stamp the
+    # start of its latency budget and shed it here if the instance is saturated
+    if request.url.path not in ("/v3/score", "/v3/score/batch"):
+        return await call_next(request)
+    request.state.arrival = time.monotonic()
+    try:
+        admission.enter()
+    except Rejected as r:
+        return JSONResponse(status_code=r.status_code, content={"detail": r.reason},
+                            headers={"Retry-After": str(r.retry_after)})
+    try:
+        return await call_next(request)
+    finally:
+        admission.exit()
+
+def _admit(tenant_id, arrival, cost=1):
+    try:
+        return admission.admit(tenant_id, arrival, cost)
+    except Rejected as r:
+        raise HTTPException(status_code=r.status_code, detail=r.reason,
+                            headers={"Retry-After": str(r.retry_after)})
+
+def _predict(vectors, skip_iso, tenant_ids):
+    """Calls the hybrid model endpoint; returns (predictions, seconds)."""
     try:
-        # Vertex Endpoint expects a list of instances
-        prediction = endpoint.predict(instances=[vector])
-        result = prediction.predictions[0] # The dict returned by predictor.py
+        # Vertex Endpoint expects a list of instances; tenant_ids route each to its tenant's model
+        parameters = {"tenant_ids": tenant_ids}
+        if skip_iso:
+            parameters["skip_iso"] = True
+        t0 = time.monotonic()
+        prediction = endpoint.predict(instances=vectors, parameters=parameters)
+        return prediction.predictions, time.monotonic() - t0 # The dicts returned by predictor.py
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
 
+def _record(txn, vector, velocity, result, model_seconds, degraded):
+    """
+    Shadow, drift and prediction-log bookkeeping for one scored transaction (all
+    non-blocking). model_seconds is None when the call scored a whole batch.
+    """
+    # Mirror a sample to the challenger; returns immediately
+    if shadow:
+        shadow.submit(txn.transaction_id, txn.tenant_id, vector, result,
+                      model_seconds * 1000 if model_seconds is not None else None,
+                      degraded=degraded)
+
+    components = result.get("components", {})
+    # Only full-path traffic the global model scored: tenant bundles carry their own baselines,
+    # and skip_iso (xgb-only) or stale-feature scores aren't on the baseline's scale
+    if drift_monitor and not degraded and result.get("model_version") == global_model_version:
+        drift_monitor.observe(txn.tenant_id, {
+            "score": result.get("score"),
+            "xgb": components.get("xgb"),
+            "iso": components.get("iso"),
+            "amount": vector[0],
+            "txn_count_10m": vector[1],
+            "txn_sum_10m": vector[2],
+        })
+
+    if prediction_log:
+        prediction_log.enqueue({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "transaction_id": txn.transaction_id,
+            "tenant_id": txn.tenant_id,
+            "card_id": txn.card_id,
+            "amount": txn.amount,
+            "txn_count_10m": int(velocity["txn_count_10m"]),
+            "txn_sum_10m": float(velocity["txn_sum_10m"]),
+            "score": result.get("score"),
+            "risk_band": result.get("risk_band"),
+            "xgb_score": components.get("xgb"),
+            "iso_score": components.get("iso"),
+            "model_version": result.get("model_version"),
+        })
+
+def score_transaction(txn, arrival):
+    if not endpoint:
+        raise HTTPException(status_code=503, detail="Model Endpoint unavailable")
+
+    # 0. Admission: tenant limits, latency budget, degraded modes
+    ticket = _admit(txn.tenant_id, arrival)
+
+    try:
+        # 1. Fetch Real-Time Features (The "Velocity")
+        # This hits the data your Dataflow job is currently writing
+        cached = (fs_client.cached_features(txn.tenant_id, txn.card_id, MAX_STALE_SECONDS)
+                  if ticket.stale_features else None)
+        if cached:
+            velocity = cached[0]
+            admission.count("stale_features_served")
+        else:
+            if ticket.stale_features:
+                admission.count("stale_features_miss")
+            t0 = time.monotonic()
+            velocity = fs_client.get_streaming_features(txn.tenant_id, txn.card_id)
+            admission.observe("features", time.monotonic() - t0)
+        # How old the features are at score time (event watermark, window end, write)
+        feature_lags = freshness.observe(velocity)
+
+        # 2. Construct Feature Vector
+        # Order MUST match training: [amount, txn_count_10m, txn_sum_10m]
+        vector = [
+            txn.amount,
+            velocity["txn_count_10m"],
+            velocity["txn_sum_10m"]
+        ]
+
+        # 3. Call Hybrid Model (The "Brain")
+        predictions, model_seconds = _predict([vector], ticket.skip_iso, [txn.tenant_id])
+        admission.observe("model_skip_iso" if ticket.skip_iso else "model", model_seconds)
+        result = predictions[0]
+    finally:
+        admission.release(ticket, arrival)
+
+    _record(txn, vector, velocity, result, model_seconds, degraded=bool(ticket.modes))
+
     # 4. Return Combined Intelligence
     return {
         "transaction_id": txn.transaction_id,
         "tenant_id": txn.tenant_id,
         "velocity_features": velocity,
-        "risk_assessment": result
+        "risk_assessment": result,
+        "feature_freshness": feature_lags,
+        "degraded": ticket.modes
     }
+
+def score_transactions(txns, arrival):
+    """Batch scoring: one ticket per tenant, one Feature Store round trip, one endpoint call."""
+    if not endpoint:
+        raise HTTPException(status_code=503, detail="Model Endpoint unavailable")
+    if not txns:
+        return {"results": []}
+
+    # 0. Admission per tenant, one token per transaction; all-or-nothing
+    per_tenant = {}
+    for txn in txns:
+        per_tenant[txn.tenant_id] = per_tenant.get(txn.tenant_id, 0) + 1
+    tickets = []
+    try:
+        for tenant_id, n in per_tenant.items():
+            tickets.append(_admit(tenant_id, arrival, cost=n))
+    except HTTPException:
+        # All-or-nothing: the tenants already admitted get their tokens back
+        for ticket in tickets:
+            admission.cancel(ticket)
+        raise
+    stale = any(t.stale_features for t in tickets)
+    skip_iso = any(t.skip_iso for t in tickets)
+    modes = [m for m, on in (("stale_features", stale), ("skip_iso", skip_iso)) if on]
+
+    try:
+        # 1. Features: cached ones when degraded, the rest in one streaming read
+        velocities = {}
+        if stale:
+            for txn in txns:
+                cached = fs_client.cached_features(txn.tenant_id, txn.card_id, MAX_STALE_SECONDS)
+                if cached:
+                    velocities[(txn.tenant_id, txn.card_id)] = cached[0]
+        missing = [(txn.tenant_id, txn.card_id) for txn in txns if (txn.tenant_id, txn.card_id) not in velocities]
+        if missing:
+            t0 = time.monotonic()
+            velocities.update(fs_client.get_streaming_features_batch(missing))
+            admission.observe("features", time.monotonic() - t0)
+
+        # 2-3. Vectors in request order, one model call
+        vectors = []
+        for txn in txns:
+            velocity = velocities[(txn.tenant_id, txn.card_id)]
+            vectors.append([txn.amount, velocity["txn_count_10m"], velocity["txn_sum_10m"]])
+        predictions, _ = _predict(vectors, skip_iso, [txn.tenant_id for txn in txns])
+    finally:
+        for ticket in tickets:
+            admission.release(ticket, arrival)
+
+    results = []
+    for txn, vector, result in zip(txns, vectors, predictions):
+        velocity = velocities[(txn.tenant_id, txn.card_id)]
+        # The batch call's latency isn't any one transaction's: no champion latency sample
+        _record(txn, vector, velocity, result, None, degraded=bool(modes))
+        results.append({
+            "transaction_id": txn.transaction_id,
+            "tenant_id": txn.tenant_id,
+            "velocity_features": velocity,
+            "risk_assessment": result,
+            "feature_freshness": freshness.observe(velocity),
+            "degraded": modes
+        })
+    return {"results": results}
+
+# JSON (pydantic-validated) by default; msgpack in and/or out via Content-Type / Accept
+@app.post("/v3/score", openapi_extra=codec.openapi_body(TransactionRequest))
+async def score(request: Request):
+    txn = codec.decode_transaction(await request.body(), request.headers.get("content-type"), TransactionRequest)
+    payload = await run_in_threadpool(score_transaction, txn, request.state.arrival)
+    return codec.encode(payload, request.headers.get("accept"), request.headers.get("content-type"))
+
+@app.post("/v3/score/batch", openapi_extra=codec.openapi_body(BatchRequest))
+async def score_batch(request: Request):
+    txns = codec.decode_batch(await request.body(), request.headers.get("content-type"), BatchRequest)
+    if len(txns) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} transactions per batch")
+    payload = await run_in_threadpool(score_transactions, txns, request.state.arrival)
+    return codec.encode(payload, request.headers.get("accept"), request.headers.get("content-type"))
+
+@app.get("/v3/monitoring/drift")
+def drift():
+    """Rolling per-tenant PSI of scores and features against the training baseline."""
+    if not drift_monitor:
+        raise HTTPException(status_code=503, detail="Drift monitor unavailable (no model baseline)")
+    return drift_monitor.snapshot()
+
+@app.get("/v3/monitoring/prediction-log")
+def prediction_log_stats():
+    """Buffer depth and enqueue/flush/drop/spill counters of the prediction log writer."""
+    if not prediction_log:
+        raise HTTPException(status_code=503, detail="Prediction logging disabled")
+    return prediction_log.snapshot()
+
+@app.get("/v3/monitoring/freshness")
+def freshness_stats():
+    """Feature age at score time: histograms of score time minus the traced feature timestamps."""
+    return freshness.snapshot()
+
+@app.get("/v3/monitoring/shadow")
+def shadow_stats():
+    """Challenger vs champion: score deltas, band disagreement, latency percentiles."""
+    if not shadow:
+        raise HTTPException(status_code=503, detail="Shadow scoring disabled")
+    return shadow.snapshot()
+
+@app.get("/v3/monitoring/admission")
+def admission_stats():
+    """Admission decisions (overall and per tenant), pressure and admitted-request latency."""
+    return admission.snapshot()
@@ -0,0 +1,201 @@
+import math
+import threading
+import time
+from collections import deque
+
+
+class Rejected(Exception):
+    """Request refused before doing any work; maps to an HTTP status with a Retry-After hint."""
+
+    def __init__(self, status_code, reason, retry_after):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now, cost=1):
+        """Takes `cost` tokens; returns 0 if granted, else the seconds until they are available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # A batch larger than the burst is let through on a full bucket and drives it negative
+        need = min(cost, self.burst)
+        if self.tokens >= need:
+            self.tokens -= cost
+            return 0.0
+        return (need - self.tokens) / self.rate
+
+    def refund(self, cost):
+        self.tokens = min(self.burst, self.tokens + cost)
+
+
+class Ticket:
+    """An admitted request: its deadline and the degraded modes it must run in."""
+
+    __slots__ = ("tenant", "cost", "deadline", "stale_features", "skip_iso")
+
+    def __init__(self, tenant, cost, deadline, stale_features, skip_iso):
+        self.tenant = tenant
+        self.cost = cost
+        self.deadline = deadline
+        self.stale_features = stale_features
+        self.skip_iso = skip_iso
+
+    @property
+    def modes(self):
+        return [m for m, on in (("stale_features", self.stale_features), ("skip_iso", self.skip_iso)) if on]
+
+
+class AdmissionController:
+    """
+    Admission control for /v3/score.
+
+    Every request gets a latency budget counted from its arrival (so time spent
+    queued for a worker thread is charged to it). Per tenant, a token bucket
+    caps the request rate and a counter caps concurrency; both answer 429.
+
+    Degraded modes are applied in order as pressure (global in-flight / capacity)
+    rises, or when the remaining budget cannot cover the full path at the
+    current expected stage latencies:
+      1. serve cached (possibly stale) velocity features instead of a Feature Store read
+      2. skip the IsolationForest branch of the ensemble
+      3. reject early with 503 and a Retry-After hint
+    Expected stage latencies are EWMAs of observed ones. Every decision is counted.
+    """
+
+    def __init__(self, budget_ms=250, max_inflight=64, tenant_rate=200.0, tenant_burst=400,
+                 tenant_max_inflight=32, stale_at=0.7, skip_iso_at=0.85, clock=time.monotonic):
+        self.budget = budget_ms / 1000
+        self.max_inflight = max_inflight
+        self.tenant_rate = tenant_rate
+        self.tenant_burst = tenant_burst
+        self.tenant_max_inflight = tenant_max_inflight
+        self.stale_at = stale_at
+        self.skip_iso_at = skip_iso_at
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.buckets = {}
+        self.tenant_inflight = {}
+        # Seconds; seeded with typical values until real observations arrive
+        self.expected = {"features": 0.015, "model": 0.060, "model_skip_iso": 0.040}
+        self.latencies = deque(maxlen=4096)
+        self.decisions = {
+            "admitted": 0, "full": 0, "stale_features": 0, "skip_iso": 0,
+            "stale_features_served": 0, "stale_features_miss": 0,
+            "shed_overload": 0, "shed_budget": 0, "throttled_rate": 0, "throttled_concurrency": 0,
+        }
+        self.tenant_decisions = {}
+
+    def _count(self, decision, tenant=None):
+        self.decisions[decision] += 1
+        if tenant is not None:
+            per_tenant = self.tenant_decisions.setdefault(tenant, {})
+            per_tenant[decision] = per_tenant.get(decision, 0) + 1
+
+    def count(self, decision):
+        with self.lock:
+            self._count(decision)
+
+    def _retry_after(self):
+        # Roughly how long the current backlog takes to drain, at least 1s
+        per_request = self.expected["features"] + self.expected["model"]
+        return max(1, math.ceil(self.inflight * per_request / self.max_inflight))
+
+    # --- global gate (called on arrival, before the request waits for a worker) ---
+    def enter(self):
+        with self.lock:
+            if self.inflight >= self.max_inflight:
+                self._count("shed_overload")
+                raise Rejected(503, "Overloaded", self._retry_after())
+            self.inflight += 1
+
+    def exit(self):
+        with self.lock:
+            self.inflight -= 1
+
+    # --- per-request decision (called by the handler) ---
+    def admit(self, tenant, arrival, cost=1):
+        """
+        cost is the number of transactions (batch requests spend one token per transaction).
+        Tokens are taken last, so a request refused for any other reason doesn't spend them.
+        """
+        now = self.clock()
+        deadline = arrival + self.budget
+        with self.lock:
+            if self.tenant_inflight.get(tenant, 0) >= self.tenant_max_inflight:
+                self._count("throttled_concurrency", tenant)
+                raise Rejected(429, f"Tenant '{tenant}' over its concurrency limit", 1)
+
+            pressure = self.inflight / self.max_inflight
+            remaining = deadline - now
+            e = self.expected
+            stale = pressure >= self.stale_at or remaining < e["features"] + e["model"]
+            skip_iso = pressure >= self.skip_iso_at or remaining < (0 if stale else e["features"]) + e["model"]
+            if remaining < e["model_skip_iso"]:
+                self._count("shed_budget", tenant)
+                raise Rejected(503, "Latency budget exhausted before scoring", self._retry_after())
+
+            bucket = self.buckets.get(tenant)
+            if bucket is None:
+                bucket = self.buckets[tenant] = TokenBucket(self.tenant_rate, self.tenant_burst, now)
+            wait = bucket.take(now, cost)
+            if wait:
+                self._count("throttled_rate", tenant)
+                raise Rejected(429, f"Tenant '{tenant}' over its request rate", max(1, math.ceil(wait)))
+
+            self.tenant_inflight[tenant] = self.tenant_inflight.get(tenant, 0) + 1
+            self._count("admitted", tenant)
+            if stale:
+                self._count("stale_features", tenant)
+            if skip_iso:
+                self._count("skip_iso", tenant)
+            if not (stale or skip_iso):
+                self._count("full", tenant)
+        return Ticket(tenant, cost, deadline, stale, skip_iso)
+
+    def observe(self, stage, seconds, alpha=0.1):
+        """Folds an observed stage latency into its expected value."""
+        with self.lock:
+            self.expected[stage] += alpha * (seconds - self.expected[stage])
+
+    def release(self, ticket, arrival):
+        with self.lock:
+            self.tenant_inflight[ticket.tenant] -= 1
+            self.latencies.append(self.clock() - arrival)
+
+    def cancel(self, ticket):
+        """Undoes an admission that never ran (e.g. another tenant of its batch was refused)."""
+        with self.lock:
+            self.tenant_inflight[ticket.tenant] -= 1
+            self.buckets[ticket.tenant].refund(ticket.cost)
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            decisions = dict(self.decisions)
+            tenants = {t: dict(d) for t, d in self.tenant_decisions.items()}
+            inflight = self.inflight
+            expected = dict(self.expected)
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else None
+
+        return {
+            "budget_ms": self.budget * 1000,
+            "inflight": inflight,
+            "max_inflight": self.max_inflight,
+            "pressure": inflight / self.max_inflight,
+            "expected_stage_ms": {k: v * 1000 for k, v in expected.items()},
+            "admitted_latency_ms": {"p50": pct(0.50), "p99": pct(0.99), "samples": len(latencies)},
+            "decisions": decisions,
+            "tenants": tenants,
+        }
@@ -0,0 +1,102 @@
+import msgpack
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
+from pydantic import ValidationError
+
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack")
+
+
+def _media(value):
+    return value.split(";", 1)[0].strip().lower()
+
+
+def is_msgpack(content_type):
+    return _media(content_type or "") in MSGPACK_TYPES
+
+
+def wants_msgpack(accept, content_type):
+    """msgpack if the client asks for it; with no preference, answer in the request's encoding."""
+    media = [_media(part) for part in (accept or "").split(",") if part.strip()]
+    if any(m in MSGPACK_TYPES for m in media):
+        return True
+    return (not media or media == ["*/*"]) and is_msgpack(content_type)
+
+
+class Transaction:
+    """Attribute-compatible stand-in for TransactionRequest, built without pydantic."""
+
+    __slots__ = ("transaction_id", "tenant_id", "card_id", "amount")
+
+    def __init__(self, transaction_id, tenant_id, card_id, amount):
+        self.transaction_id = transaction_id
+        self.tenant_id = tenant_id
+        self.card_id = card_id
+        self.amount = amount
+
+
+def _fast_transaction(obj):
+    """
+    Checks the four fields by hand instead of running model validation.
+    Accepts what TransactionRequest accepts from well-formed clients (strict
+    types: no numeric strings).
+    """
+    if type(obj) is not dict:
+        raise ValueError("expected a map of transaction fields")
+    try:
+        tx_id, tenant, card, amount = obj["transaction_id"], obj["tenant_id"], obj["card_id"], obj["amount"]
+    except KeyError as e:
+        raise ValueError(f"field {e} missing")
+    if type(tx_id) is not str or type(tenant) is not str or type(card) is not str:
+        raise ValueError("transaction_id, tenant_id and card_id must be strings")
+    if type(amount) is not float and type(amount) is not int:
+        raise ValueError("amount must be a number")
+    return Transaction(tx_id, tenant, card, float(amount))
+
+
+def decode_transaction(body, content_type, model):
+    """One transaction: msgpack fast path, else JSON through pydantic."""
+    try:
+        if is_msgpack(content_type):
+            return _fast_transaction(msgpack.unpackb(body, raw=False))
+        return model.model_validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+    except (ValueError, TypeError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+        # TypeError: an unhashable map key (map/array), on msgpack builds without strict_map_key
+        raise HTTPException(status_code=422, detail=f"Invalid transaction: {e}")
+
+
+def decode_batch(body, content_type, batch_model):
+    """{"transactions": [...]}: msgpack fast path, else JSON through pydantic."""
+    try:
+        if is_msgpack(content_type):
+            obj = msgpack.unpackb(body, raw=False)
+            items = obj.get("transactions") if type(obj) is dict else None
+            if type(items) is not list:
+                raise ValueError("expected {'transactions': [...]}")
+            return [_fast_transaction(item) for item in items]
+        return batch_model.model_validate_json(body).transactions
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+    except (ValueError, TypeError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid batch: {e}")
+
+
+def encode(payload, accept, content_type):
+    """
+    Payloads are plain dicts/lists/str/numbers, so both encoders take them as
+    is (no jsonable_encoder pass).
+    """
+    if wants_msgpack(accept, content_type):
+        return Response(msgpack.packb(payload, use_bin_type=True), media_type=MSGPACK)
+    return JSONResponse(payload)
+
+
+def openapi_body(schema_model):
+    """OpenAPI requestBody for an endpoint that reads its body itself."""
+    schema = schema_model.model_json_schema()
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": schema},
+        MSGPACK: {"schema": schema},
+    }}}
@@ -0,0 +1,122 @@
+import math
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+GLOBAL = "__all__"
+OTHER = "__other__"
+
+
+def psi(expected, actual, eps=1e-4):
+    """Population Stability Index between two histograms over the same bins."""
+    e_total, a_total = sum(expected), sum(actual)
+    value = 0.0
+    for e, a in zip(expected, actual):
+        e = max(e / e_total, eps)
+        a = max(a / a_total, eps)
+        value += (a - e) * math.log(a / e)
+    return value
+
+
+class DriftMonitor:
+    """
+    Rolling per-tenant histograms of the scores and input features, compared
+    against the training baseline stored in the model bundle.
+
+    Each tenant owns a ring of `num_slots` time slots of `slot_seconds` each;
+    every slot is one flat int64 array holding the bins of all metrics. An
+    observation is a bisect per metric and an increment, and a slot is zeroed
+    in place when the ring wraps onto it, so memory is fixed at
+    max_tenants x num_slots x total_bins counters.
+    """
+
+    def __init__(self, baseline, slot_seconds=60, num_slots=15, max_tenants=500,
+                 min_count=200, psi_threshold=0.2, clock=time.monotonic):
+        self.metrics = list(baseline)
+        self.edges = {m: list(baseline[m]["edges"]) for m in self.metrics}
+        self.baseline = {m: list(baseline[m]["counts"]) for m in self.metrics}
+
+        # Metric m occupies bins [offset[m], offset[m] + len(edges[m]) + 1) of a slot
+        self.offsets = {}
+        total = 0
+        for m in self.metrics:
+            self.offsets[m] = total
+            total += len(self.edges[m]) + 1
+        self.total_bins = total
+        self._zeros = array("q", bytes(8 * total))
+
+        self.slot_seconds = slot_seconds
+        self.num_slots = num_slots
+        self.max_tenants = max_tenants
+        self.min_count = min_count
+        self.psi_threshold = psi_threshold
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.tenants = {}
+
+    def _ring(self, tenant):
+        ring = self.tenants.get(tenant)
+        if ring is None:
+            # Bound memory: tenants beyond the cap share one ring
+            if len(self.tenants) >= self.max_tenants and tenant not in (GLOBAL, OTHER):
+                return self._ring(OTHER)
+            ring = {
+                "epochs": [-1] * self.num_slots,
+                "slots": [array("q", self._zeros) for _ in range(self.num_slots)],
+            }
+            self.tenants[tenant] = ring
+        return ring
+
+    def observe(self, tenant, values):
+        """Records one request; values maps metric name -> number (unknown names are ignored)."""
+        epoch = int(self.clock() // self.slot_seconds)
+        idx = epoch % self.num_slots
+        bins = [self.offsets[m] + bisect_right(self.edges[m], v)
+                for m, v in values.items() if m in self.offsets and v is not None]
+        with self.lock:
+            for key in (tenant, GLOBAL):
+                ring = self._ring(key)
+                slot = ring["slots"][idx]
+                if ring["epochs"][idx] != epoch:
+                    slot[:] = self._zeros
+                    ring["epochs"][idx] = epoch
+                for b in bins:
+                    slot[b] += 1
+
+    def _window(self, ring, epoch):
+        counts = array("q", self._zeros)
+        for i in range(self.num_slots):
+            if epoch - ring["epochs"][i] < self.num_slots:
+                for b, c in enumerate(ring["slots"][i]):
+                    counts[b] += c
+        return counts
+
+    def snapshot(self):
+        """PSI per tenant and metric over the rolling window, plus the list of alerts."""
+        epoch = int(self.clock() // self.slot_seconds)
+        with self.lock:
+            windows = {t: self._window(r, epoch) for t, r in self.tenants.items()}
+
+        tenants, alerts = {}, []
+        for tenant, counts in windows.items():
+            metrics = {}
+            for m in self.metrics:
+                lo = self.offsets[m]
+                hist = list(counts[lo:lo + len(self.edges[m]) + 1])
+                n = sum(hist)
+                value = psi(self.baseline[m], hist) if n >= self.min_count else None
+                drifted = value is not None and value > self.psi_threshold
+                metrics[m] = {"count": n, "psi": value, "drift": drifted, "histogram": hist}
+                if drifted:
+                    alerts.append({"tenant_id": tenant, "metric": m, "psi": value})
+            tenants[tenant] = metrics
+
+        return {
+            "window_seconds": self.slot_seconds * self.num_slots,
+            "psi_threshold": self.psi_threshold,
+            "min_count": self.min_count,
+            "bin_edges": self.edges,
+            "tenants": tenants,
+            "alerts": alerts,
+        }
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class FeatureBackend:
+    """
+    Online velocity-feature reads for the scoring path. Implementations:
+
+      FeatureStoreClient      - Vertex AI Feature Store (remote, entity id = card id)
+      LocalFeatureStoreClient - memory-mapped table on this host (entity id = tenant#card)
+
+    Every read returns { 'txn_count_10m': int, 'txn_sum_10m': float,
+    'feature_time', 'last_event_time', 'written_at': epoch seconds or None },
+    with zeros for a card the backend has never seen (cold start).
+    """
+
+    name = None
+
+    def __init__(self, cache_size=100_000):
+        # Last features read per entity (LRU); served instead of a fresh read under load
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_lock = threading.Lock()
+
+    def entity_key(self, tenant_id, card_id):
+        return f"{tenant_id}#{card_id}"
+
+    @staticmethod
+    def _empty():
+        return {"txn_count_10m": 0, "txn_sum_10m": 0.0,
+                "feature_time": None, "last_event_time": None, "written_at": None}
+
+    def cached_features(self, tenant_id, card_id, max_age=None):
+        """Last features read for the card and their age in seconds, or None."""
+        key = self.entity_key(tenant_id, card_id)
+        with self.cache_lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return None
+            self.cache.move_to_end(key)
+        features, fetched_at = entry
+        age = time.monotonic() - fetched_at
+        if max_age is not None and age > max_age:
+            return None
+        return features, age
+
+    def _remember(self, key, features):
+        with self.cache_lock:
+            self.cache[key] = (features, time.monotonic())
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def get_streaming_features(self, tenant_id, card_id):
+        raise NotImplementedError
+
+    def get_streaming_features_batch(self, entities):
+        """
+        Features for many (tenant_id, card_id) pairs; returns {(tenant_id, card_id): features}
+        covering every requested pair. Backends with a bulk read override this.
+        """
+        return {entity: self.get_streaming_features(*entity) for entity in dict.fromkeys(entities)}
+
+
+def build_feature_backend(kind, project_id=None, region=None, fs_id=None, path=None):
+    if kind == "vertex":
+        from app.services.feature_store_client import FeatureStoreClient
+        return FeatureStoreClient(project_id, region, fs_id)
+    if kind == "local":
+        from app.services.local_feature_store import LocalFeatureStoreClient
+        return LocalFeatureStoreClient(path)
+    raise ValueError(f"Unknown feature backend '{kind}'")
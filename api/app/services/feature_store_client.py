@@ -1,9 +1,17 @@
 from google.cloud import aiplatform
-from google.cloud.aiplatform_v1 import FeaturestoreOnlineServingServiceClient, ReadFeatureValuesRequest
+from google.cloud.aiplatform_v1 import (
+    FeaturestoreOnlineServingServiceClient, ReadFeatureValuesRequest, StreamingReadFeatureValuesRequest
+)
 from google.cloud.aiplatform_v1.types import FeatureSelector, IdMatcher
+from app.services.feature_backend import FeatureBackend
 
-class FeatureStoreClient:
-    def __init__(self, project_id, region, fs_id):
+class FeatureStoreClient(FeatureBackend):
+    """Vertex AI Feature Store backend: entity type "cards", keyed by card id."""
+
+    name = "vertex"
+
+    def __init__(self, project_id, region, fs_id, cache_size=100_000):
+        super().__init__(cache_size)
         self.project_id = project_id
         self.region = region
         self.fs_id = fs_id
@@ -15,17 +23,45 @@ class FeatureStoreClient:
         # Full path to the Feature Store
         self.fs_path = f"projects/{project_id}/locations/{region}/featurestores/{fs_id}"
 
-    def get_streaming_features(self, card_id: str):
+    def entity_key(self, tenant_id, card_id):
+        # Cards are global entities in Vertex; the tenant is not part of the id
+        return card_id
+
+    FEATURE_IDS = ["txn_count_10m", "txn_sum_10m", "last_event_us", "written_at_us"]
+
+    def _parse(self, descriptors, data):
+        # Parse response (Vertex returns typed values)
+        # Default to 0 if feature is missing (cold start)
+        features = self._empty()
+
+        # Values come back in the order of the header's feature descriptors
+        for descriptor, feature in zip(descriptors, data):
+            fid = descriptor.id.split("/")[-1]
+            value = feature.value
+            if fid == "txn_count_10m":
+                features["txn_count_10m"] = value.int64_value
+                if value.metadata.generate_time:
+                    features["feature_time"] = value.metadata.generate_time.timestamp()
+            elif fid == "txn_sum_10m":
+                features["txn_sum_10m"] = value.double_value
+            elif fid == "last_event_us" and value.int64_value:
+                features["last_event_time"] = value.int64_value / 1e6
+            elif fid == "written_at_us" and value.int64_value:
+                features["written_at"] = value.int64_value / 1e6
+        return features
+
+    def get_streaming_features(self, tenant_id: str, card_id: str):
         """
         Fetches real-time velocity features for a card.
-        Returns: { 'txn_count_10m': int, 'txn_sum_10m': float }
+        Returns: { 'txn_count_10m': int, 'txn_sum_10m': float,
+                   'feature_time', 'last_event_time', 'written_at': epoch seconds or None }
+        The three timestamps trace freshness: the window end the pipeline wrote
+        as feature_time, the newest event in that window, and the write itself.
         """
         entity_type_path = f"{self.fs_path}/entityTypes/cards"
         
         # Select features to read
-        feature_selector = FeatureSelector(
-            id_matcher=IdMatcher(ids=["txn_count_10m", "txn_sum_10m"])
-        )
+        feature_selector = FeatureSelector(id_matcher=IdMatcher(ids=self.FEATURE_IDS))
 
         try:
             response = self.client.read_feature_values(
@@ -35,23 +71,46 @@ class FeatureStoreClient:
                     feature_selector=feature_selector
                 )
             )
-            
-            # Parse response (Vertex returns typed values)
-            # Default to 0 if feature is missing (cold start)
-            data = response.entity_view.data
-            count = 0
-            total = 0.0
-            
-            # Helper to extract value based on type
-            for feature in data:
-                fid = feature.id.split("/")[-1]
-                if fid == "txn_count_10m":
-                    count = feature.value.int64_value
-                elif fid == "txn_sum_10m":
-                    total = feature.value.double_value
-            
-            return {"txn_count_10m": count, "txn_sum_10m": total}
+            features = self._parse(response.header.feature_descriptors, response.entity_view.data)
+            self._remember(card_id, features)
+            return features
 
         except Exception as e:
             print(f"Error fetching features for {card_id}: {e}")
-            return {"txn_count_10m": 0, "txn_sum_10m": 0.0}
+            # Stale beats zeros for a card we have seen before
+            cached = self.cached_features(tenant_id, card_id)
+            return cached[0] if cached else self._empty()
+
+    def get_streaming_features_batch(self, entities):
+        """
+        Features for many cards in one streaming read (one round trip instead of
+        one per card). Returns {(tenant_id, card_id): features} covering every requested pair.
+        """
+        entities = list(dict.fromkeys(entities))
+        unique_ids = list(dict.fromkeys(card_id for _, card_id in entities))
+        results = {}
+        try:
+            stream = self.client.streaming_read_feature_values(
+                request=StreamingReadFeatureValuesRequest(
+                    entity_type=f"{self.fs_path}/entityTypes/cards",
+                    entity_ids=unique_ids,
+                    feature_selector=FeatureSelector(id_matcher=IdMatcher(ids=self.FEATURE_IDS))
+                )
+            )
+            descriptors = None
+            # First message carries the header, each following one an entity
+            for response in stream:
+                if response.header.feature_descriptors:
+                    descriptors = response.header.feature_descriptors
+                if response.entity_view.entity_id and descriptors is not None:
+                    features = self._parse(descriptors, response.entity_view.data)
+                    results[response.entity_view.entity_id] = features
+                    self._remember(response.entity_view.entity_id, features)
+        except Exception as e:
+            print(f"Error fetching features for {len(unique_ids)} cards: {e}")
+
+        for tenant_id, card_id in entities:
+            if card_id not in results:
+                cached = self.cached_features(tenant_id, card_id)
+                results[card_id] = cached[0] if cached else self._empty()
+        return {(tenant_id, card_id): results[card_id] for tenant_id, card_id in entities}
@@ -0,0 +1,82 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds (seconds); must match LAG_BUCKETS in streaming/pipeline.py
+LAG_BUCKETS = [0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800]
+
+# Lag name -> (later timestamp, earlier timestamp) among score_time and the traced feature times
+LAGS = {
+    "feature_age": ("score_time", "feature_time"),        # score - window end written as feature_time
+    "event_age": ("score_time", "last_event_time"),       # score - newest event in the window (watermark)
+    "since_write": ("score_time", "written_at"),          # score - pipeline write (serving + cache staleness)
+    "pipeline_lag": ("written_at", "last_event_time"),    # event -> write, as seen by the reader
+}
+
+
+class FreshnessTracker:
+    """
+    Histograms of how old the velocity features are when a transaction is
+    scored, from the timestamps the pipeline writes next to the features.
+    Buckets match the pipeline's per-stage lag histograms so the two line up.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.counts = {name: [0] * (len(LAG_BUCKETS) + 1) for name in LAGS}
+        self.sums = dict.fromkeys(LAGS, 0.0)
+        self.untraced = 0
+
+    def observe(self, features, score_time=None):
+        """Records the lags for one scored request; returns them (seconds) for the response."""
+        stamps = {
+            "score_time": score_time if score_time is not None else self.clock(),
+            "feature_time": features.get("feature_time"),
+            "last_event_time": features.get("last_event_time"),
+            "written_at": features.get("written_at"),
+        }
+        lags = {}
+        for name, (later, earlier) in LAGS.items():
+            if stamps[later] is not None and stamps[earlier] is not None:
+                lags[name] = stamps[later] - stamps[earlier]
+
+        with self.lock:
+            if not lags:
+                self.untraced += 1
+            for name, seconds in lags.items():
+                # Early panes are written before their window ends, so feature_age can be negative
+                self.counts[name][bisect_left(LAG_BUCKETS, max(seconds, 0.0))] += 1
+                self.sums[name] += seconds
+        return lags
+
+    def _quantile(self, counts, q):
+        total = sum(counts)
+        if not total:
+            return None
+        target, running = q * total, 0
+        for i, c in enumerate(counts):
+            running += c
+            if running >= target:
+                # Past the last bucket there is no upper bound: None, with the overflow counted separately
+                return LAG_BUCKETS[i] if i < len(LAG_BUCKETS) else None
+
+    def snapshot(self):
+        with self.lock:
+            counts = {name: list(c) for name, c in self.counts.items()}
+            sums = dict(self.sums)
+            untraced = self.untraced
+
+        lags = {}
+        for name, c in counts.items():
+            n = sum(c)
+            lags[name] = {
+                "count": n,
+                "mean_s": sums[name] / n if n else None,
+                # Bucket upper bounds, so these are conservative; None past the last bucket
+                "p50_le_s": self._quantile(c, 0.50),
+                "p99_le_s": self._quantile(c, 0.99),
+                "over_last_bucket": c[-1],
+                "histogram": c,
+            }
+        return {"bucket_upper_bounds_s": LAG_BUCKETS, "untraced": untraced, "lags": lags}
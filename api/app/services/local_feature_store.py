@@ -0,0 +1,145 @@
+import hashlib
+import mmap
+import os
+import struct
+import time
+
+from app.services.feature_backend import FeatureBackend
+
+# Table layout; must match streaming/local_feature_store.py (the pipeline owns the format)
+MAGIC = b"FSLFS001"
+VERSION = 1
+HEADER_SIZE = 4096
+RECORD_SIZE = 128
+KEY_SIZE = 62
+MAX_SPINS = 10_000
+
+_HEADER = struct.Struct("<8sIIQIQ")          # magic, version, record_size, capacity, key_size, count
+_SEQ = struct.Struct("<Q")
+_KEY = struct.Struct(f"<QH{KEY_SIZE}s")       # key_hash, key_len, key (at record offset 8)
+_VALUES = struct.Struct("<qdqqq")            # count, sum, feature_time_us, last_event_us, written_at_us
+_VALUES_OFFSET = 8 + _KEY.size
+
+
+def key_hash(key: bytes):
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+class LocalFeatureStoreClient(FeatureBackend):
+    """
+    Embedded backend: reads the memory-mapped hash table the streaming pipeline
+    writes on this host (--feature_backend local), keyed by tenant#card.
+
+    Read-only and lock-free: every API worker process maps the file and checks
+    each record's sequence counter, retrying while the writer is mid-update. A
+    lookup is a hash and a few struct reads (microseconds), so there is no
+    point caching it: cached_features() is just a fresh read.
+
+    Until the pipeline has created the file (or while it holds no valid header)
+    every card reads as a cold start; opening is retried at most once per
+    `reopen_interval` seconds. At the same interval the path is stat'ed, and a
+    table the pipeline recreated (new inode or size) is mapped in its place.
+
+    A slot whose sequence counter stays odd (a writer died mid-write) reads as
+    missing after MAX_SPINS retries, and the probe moves on past it.
+    """
+
+    name = "local"
+
+    def __init__(self, path, reopen_interval=1.0):
+        super().__init__(cache_size=0)
+        self.path = path
+        self.reopen_interval = reopen_interval
+        # (mmap, capacity) swapped as one reference, so a lookup never mixes two mappings
+        self.table = None
+        self.identity = None  # (st_dev, st_ino, st_size) of the mapped file
+        self.next_open = 0.0
+        self._open()
+
+    def _open(self):
+        self.next_open = time.monotonic() + self.reopen_interval
+        try:
+            with open(self.path, "rb") as f:
+                st = os.fstat(f.fileno())
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"WARNING: Local feature table {self.path} not readable yet: {e}")
+            return
+        # A short file or a foreign/zero header reads like a missing table: cold starts, retried later
+        if len(mm) < HEADER_SIZE:
+            magic = version = record_size = capacity = key_size = None
+        else:
+            magic, version, record_size, capacity, key_size, _ = _HEADER.unpack_from(mm, 0)
+        if (magic != MAGIC or version != VERSION or record_size != RECORD_SIZE or key_size != KEY_SIZE
+                or not capacity or capacity & (capacity - 1) or len(mm) < HEADER_SIZE + capacity * RECORD_SIZE):
+            mm.close()
+            print(f"WARNING: {self.path} is not a v{VERSION} FraudShield local feature table yet, retrying")
+            return
+        # The previous mapping is unmapped once no in-flight lookup references it
+        self.table = (mm, capacity)
+        self.identity = (st.st_dev, st.st_ino, st.st_size)
+        print(f"Reading features from {self.path} ({capacity:,} slots)")
+
+    def _check(self):
+        """Remaps if the file at `path` is not the one mapped (first open, or recreated)."""
+        self.next_open = time.monotonic() + self.reopen_interval
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self.table is None:
+                print(f"WARNING: Local feature table {self.path} not readable yet")
+            return  # Keep serving the mapped table if the path was only removed
+        if self.table is None or (st.st_dev, st.st_ino, st.st_size) != self.identity:
+            self._open()
+
+    @staticmethod
+    def _read(mm, off, fields, at):
+        """Seqlock read of one struct inside the record at `off`; None if it never settles."""
+        for _ in range(MAX_SPINS):
+            seq = _SEQ.unpack_from(mm, off)[0]
+            if seq & 1:
+                continue  # Being written
+            values = fields.unpack_from(mm, off + at)
+            if _SEQ.unpack_from(mm, off)[0] == seq:
+                return values
+        return None
+
+    def lookup(self, key: bytes):
+        """Raw (count, sum, feature_time_us, last_event_us, written_at_us) for a key, or None."""
+        if self.table is None:
+            return None
+        mm, capacity = self.table
+        mask = capacity - 1
+        h = key_hash(key)
+        i = h & mask
+        for _ in range(capacity):
+            off = HEADER_SIZE + i * RECORD_SIZE
+            slot = self._read(mm, off, _KEY, 8)
+            if slot is not None:
+                if slot[0] == 0:
+                    return None
+                if slot[0] == h and slot[2][:slot[1]] == key:
+                    return self._read(mm, off, _VALUES, _VALUES_OFFSET)
+            # A slot that never settled isn't the end of the chain: keep probing
+            i = (i + 1) & mask
+        return None
+
+    def get_streaming_features(self, tenant_id, card_id):
+        if time.monotonic() >= self.next_open:
+            self._check()
+        if self.table is None:
+            return self._empty()
+        values = self.lookup(self.entity_key(tenant_id, card_id).encode())
+        if values is None:
+            return self._empty()
+        count, total, feature_time_us, last_event_us, written_at_us = values
+        return {
+            "txn_count_10m": count,
+            "txn_sum_10m": total,
+            "feature_time": feature_time_us / 1e6,
+            "last_event_time": last_event_us / 1e6 if last_event_us else None,
+            "written_at": written_at_us / 1e6,
+        }
+
+    def cached_features(self, tenant_id, card_id, max_age=None):
+        return self.get_streaming_features(tenant_id, card_id), 0.0
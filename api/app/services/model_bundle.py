@@ -0,0 +1,73 @@
+import hashlib
+import io
+import json
+import struct
+
+# Must match models/ensemble_cpr/bundle.py
+MAGIC = b"FSBNDL01"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sQ")
+
+
+def _manifest(uri, header, read_manifest_bytes):
+    """Checks the header and the manifest's format_version; returns the manifest."""
+    magic, manifest_len = header
+    if magic != MAGIC:
+        raise ValueError(f"{uri} is not a FraudShield model bundle")
+    manifest = json.loads(read_manifest_bytes(manifest_len))
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"{uri}: unsupported bundle format_version {manifest.get('format_version')}")
+    return manifest
+
+
+def read_manifest(uri: str):
+    """
+    Reads only the manifest of a model bundle (local path or gs://), without
+    downloading the model payloads: a ranged read for the fixed header, then
+    one for the manifest itself.
+    """
+    if uri.startswith("gs://"):
+        from google.cloud import storage
+
+        bucket, name = uri[len("gs://"):].split("/", 1)
+        blob = storage.Client().bucket(bucket).blob(name)
+        read = lambda start, length: blob.download_as_bytes(start=start, end=start + length - 1)
+    else:
+        def read(start, length):
+            with open(uri, "rb") as f:
+                f.seek(start)
+                return f.read(length)
+
+    return _manifest(uri, _HEADER.unpack(read(0, _HEADER.size)), lambda n: read(_HEADER.size, n))
+
+
+def load_bundle(uri: str):
+    """
+    Reads a whole bundle (local path or gs://), verifies each section's SHA-256
+    and deserializes the models. Returns (manifest, xgb_model, iso_model).
+    Used for embedded (in-process) challenger models.
+    """
+    import joblib
+    import xgboost as xgb
+
+    if uri.startswith("gs://"):
+        from google.cloud import storage
+
+        bucket, name = uri[len("gs://"):].split("/", 1)
+        data = storage.Client().bucket(bucket).blob(name).download_as_bytes()
+    else:
+        with open(uri, "rb") as f:
+            data = f.read()
+
+    manifest = _manifest(uri, _HEADER.unpack_from(data, 0), lambda n: data[_HEADER.size:_HEADER.size + n])
+    sections = {}
+    for name, meta in manifest["sections"].items():
+        payload = data[meta["offset"]:meta["offset"] + meta["length"]]
+        if hashlib.sha256(payload).hexdigest() != meta["sha256"]:
+            raise ValueError(f"Checksum mismatch for section '{name}' in {uri}")
+        sections[name] = payload
+
+    xgb_model = xgb.XGBClassifier()
+    xgb_model.load_model(bytearray(sections["xgb"]))
+    iso_model = joblib.load(io.BytesIO(sections["iso"]))
+    return manifest, xgb_model, iso_model
@@ -0,0 +1,371 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Column order of the `predictions` table (see infra/terraform)
+COLUMNS = [
+    "timestamp", "transaction_id", "tenant_id", "card_id", "amount",
+    "txn_count_10m", "txn_sum_10m", "score", "risk_band", "xgb_score", "iso_score", "model_version",
+]
+
+
+# --- Sinks ---
+class JsonlFileSink:
+    """Newline-delimited JSON, rotated by size."""
+
+    def __init__(self, directory, max_bytes=128 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fh = None
+        self.written = 0
+
+    def _rotate(self):
+        if self.fh:
+            self.fh.close()
+        path = os.path.join(self.directory, f"predictions-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl")
+        self.fh = open(path, "a", buffering=1024 * 1024)
+        self.written = 0
+
+    def write(self, records):
+        if self.fh is None or self.written >= self.max_bytes:
+            self._rotate()
+        chunk = "".join(json.dumps(r) + "\n" for r in records)
+        self.fh.write(chunk)
+        self.fh.flush()
+        self.written += len(chunk)
+
+    def close(self):
+        if self.fh:
+            self.fh.close()
+
+
+class ParquetFileSink:
+    """Parquet files (one row group per flush), rotated by row count."""
+
+    def __init__(self, directory, max_rows=1_000_000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa, self.pq = pa, pq
+        self.schema = pa.schema([
+            ("timestamp", pa.string()), ("transaction_id", pa.string()), ("tenant_id", pa.string()),
+            ("card_id", pa.string()), ("amount", pa.float64()), ("txn_count_10m", pa.int64()),
+            ("txn_sum_10m", pa.float64()), ("score", pa.float64()), ("risk_band", pa.string()),
+            ("xgb_score", pa.float64()), ("iso_score", pa.float64()), ("model_version", pa.string()),
+        ])
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_rows = max_rows
+        self.writer = None
+        self.rows = 0
+
+    def write(self, records):
+        if self.writer is None or self.rows >= self.max_rows:
+            self.close()
+            path = os.path.join(self.directory, f"predictions-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.parquet")
+            self.writer = self.pq.ParquetWriter(path, self.schema)
+            self.rows = 0
+        self.writer.write_table(self.pa.Table.from_pylist(records, schema=self.schema))
+        self.rows += len(records)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+
+class BigQuerySink:
+    """BigQuery streaming inserts; transaction_id doubles as the insert id for de-duplication."""
+
+    def __init__(self, table_id, project_id=None):
+        from google.cloud import bigquery
+
+        self.client = bigquery.Client(project=project_id or None)
+        self.table_id = table_id
+
+    def write(self, records):
+        errors = self.client.insert_rows_json(
+            self.table_id, records, row_ids=[r["transaction_id"] for r in records]
+        )
+        if errors:
+            raise RuntimeError(f"BigQuery insert errors: {errors[:3]}")
+
+    def close(self):
+        self.client.close()
+
+
+class LocalTableSink:
+    """
+    Local stand-in for the BigQuery table: same columns in a SQLite table, so the
+    logging path (and queries against it) can be exercised without GCP.
+    """
+
+    def __init__(self, path, table="predictions"):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.table = table
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(COLUMNS)})")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_ts ON {table} (timestamp)")
+        self.insert = f"INSERT INTO {table} VALUES ({', '.join('?' * len(COLUMNS))})"
+
+    def write(self, records):
+        with self.conn:
+            self.conn.executemany(self.insert, [tuple(r.get(c) for c in COLUMNS) for r in records])
+
+    def close(self):
+        self.conn.close()
+
+
+def build_sink(kind, target, project_id=None):
+    if kind == "bigquery":
+        return BigQuerySink(target, project_id)
+    if kind == "jsonl":
+        return JsonlFileSink(target)
+    if kind == "parquet":
+        return ParquetFileSink(target)
+    if kind == "sqlite":
+        return LocalTableSink(target)
+    raise ValueError(f"Unknown prediction log sink '{kind}'")
+
+
+# --- Writer ---
+class PredictionLogWriter:
+    """
+    Takes prediction records off the request path. enqueue() appends to a
+    bounded deque and returns; a background thread flushes batches to the sinks
+    when batch_size records are waiting or every flush_interval seconds.
+
+    When the buffer is full the overflow policy decides:
+      "drop"  - discard the record and count it
+      "spill" - append it to a local JSONL spill file, replayed once the buffer drains
+    Batches that a sink rejects are spilled for that sink alone (when a spill_dir
+    is configured), so the replay doesn't duplicate rows in the sinks that took
+    them; without a spill_dir they are counted as failed. A failing sink is
+    backed off (doubling from flush_interval up to max_backoff): batches for it
+    go straight to its spill file and its spill isn't replayed until the
+    backoff expires. "spilled" and "replayed" count each record once: a replay
+    that fails again re-spills it without counting it twice.
+
+    Several worker processes can share one spill_dir: each writes its own
+    spill-<target>-<pid>.jsonl, claims a file by renaming it to a name it owns
+    before replaying it, and only adopts the live files of processes that have
+    exited.
+    """
+
+    def __init__(self, sinks, max_queue=50_000, batch_size=500, flush_interval=1.0,
+                 overflow="drop", spill_dir=None, max_backoff=60.0):
+        if overflow not in ("drop", "spill"):
+            raise ValueError("overflow must be 'drop' or 'spill'")
+        if overflow == "spill" and not spill_dir:
+            raise ValueError("overflow='spill' needs a spill_dir")
+        self.sinks = sinks
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.overflow = overflow
+        self.spill_dir = spill_dir
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+        self.queue = deque()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()  # Spill files and stats (enqueue() runs on request threads)
+        self.spill_fhs = {}  # target ("all" or "sink<i>") -> open spill file
+        self.retry_at = [0.0] * len(sinks)  # Per sink: monotonic time before which it isn't retried
+        self.backoff = [0.0] * len(sinks)
+        self.stats = {"enqueued": 0, "dropped": 0, "spilled": 0, "replayed": 0, "flushed": 0,
+                      "failed": 0, "batches": 0, "sink_errors": 0, "writer_errors": 0}
+        self.thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+        self.thread.start()
+
+    def enqueue(self, record):
+        """Never blocks on I/O unless the buffer is full and the policy is 'spill'."""
+        if len(self.queue) >= self.max_queue:
+            if self.overflow == "spill":
+                self._spill([record])
+            else:
+                with self.lock:
+                    self.stats["dropped"] += 1
+            return False
+        self.queue.append(record)
+        with self.lock:
+            self.stats["enqueued"] += 1
+        if len(self.queue) >= self.batch_size and not self.wakeup.is_set():
+            self.wakeup.set()
+        return True
+
+    # --- spill files ---
+    # spill-<target>-<pid>.jsonl            live, appended to by <pid>
+    #   .<ms>.replay                         closed, waiting to be replayed by any process
+    #   .<ms>.replay.<pid>.claimed           being replayed by <pid>
+    def _spill_path(self, target):
+        return os.path.join(self.spill_dir, f"spill-{target}-{os.getpid()}.jsonl")
+
+    def _spill(self, records, target="all", count=True):
+        with self.lock:
+            fh = self.spill_fhs.get(target)
+            if fh is None:
+                fh = self.spill_fhs[target] = open(self._spill_path(target), "a")
+            fh.write("".join(json.dumps(r) + "\n" for r in records))
+            if count:
+                self.stats["spilled"] += len(records)
+
+    @staticmethod
+    def _alive(pid):
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @staticmethod
+    def _claim(path, new_path):
+        """Atomic rename; False if another process got there first."""
+        try:
+            os.rename(path, new_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _adopt_orphans(self):
+        """Queues for replay the spill files of processes that exited without replaying them."""
+        stamp = int(time.time() * 1000)
+        for path in glob.glob(os.path.join(self.spill_dir, "spill-*-*.jsonl")):
+            pid = int(os.path.basename(path)[:-len(".jsonl")].rsplit("-", 1)[1])
+            if not self._alive(pid):
+                self._claim(path, f"{path}.{stamp}.replay")
+        for path in glob.glob(os.path.join(self.spill_dir, "*.claimed")):
+            replay, pid, _ = path.rsplit(".", 2)
+            # Ours too: only this thread replays, so one of ours here is from a replay that failed
+            if int(pid) == os.getpid() or not self._alive(int(pid)):
+                self._claim(path, replay)
+
+    def _replay_spill(self):
+        """Re-sends spilled records once the in-memory buffer has room again."""
+        with self.lock:
+            stamp = int(time.time() * 1000)
+            for target in [t for t in self.spill_fhs if not self._backing_off(t)]:
+                self.spill_fhs.pop(target).close()
+                os.replace(self._spill_path(target), f"{self._spill_path(target)}.{stamp}.replay")
+        self._adopt_orphans()
+
+        for replay in sorted(glob.glob(os.path.join(self.spill_dir, "*.replay"))):
+            target = os.path.basename(replay).split("-", 2)[1]
+            if self._backing_off(target):
+                continue  # Left for whichever process retries the sink first
+            claimed = f"{replay}.{os.getpid()}.claimed"
+            if not self._claim(replay, claimed):
+                continue
+            sinks = None if target == "all" else [int(target[len("sink"):])]
+            records = []
+            with open(claimed) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass  # Torn last line of a process that died mid-write
+            delivered = 0
+            for i in range(0, len(records), self.batch_size):
+                batch = records[i:i + self.batch_size]
+                if self._write(batch, sinks, replay=True):
+                    delivered += len(batch)
+            with self.lock:
+                self.stats["replayed"] += delivered
+            os.unlink(claimed)
+
+    # --- worker ---
+    def _backing_off(self, target):
+        return target != "all" and time.monotonic() < self.retry_at[int(target[len("sink"):])]
+
+    def _reject(self, batch, i, replay):
+        if self.spill_dir:
+            # A replayed record was counted when it was first spilled
+            self._spill(batch, f"sink{i}", count=not replay)
+        else:
+            with self.lock:
+                self.stats["failed"] += len(batch)
+
+    def _write(self, batch, sinks=None, replay=False):
+        """
+        Writes to every sink (or the given sink indexes); a rejected batch is spilled
+        for that sink only. True if every target sink took it.
+        """
+        now = time.monotonic()
+        ok = True
+        for i in range(len(self.sinks)) if sinks is None else sinks:
+            sink = self.sinks[i]
+            if now < self.retry_at[i]:
+                ok = False
+                self._reject(batch, i, replay)
+                continue
+            try:
+                sink.write(batch)
+                self.backoff[i] = 0.0
+            except Exception as e:
+                ok = False
+                self.backoff[i] = min(max(self.backoff[i] * 2, self.flush_interval), self.max_backoff)
+                self.retry_at[i] = now + self.backoff[i]
+                with self.lock:
+                    self.stats["sink_errors"] += 1
+                print(f"Prediction log sink {type(sink).__name__} failed ({len(batch)} records), "
+                      f"retrying in {self.backoff[i]:.0f}s: {e}")
+                self._reject(batch, i, replay)
+        with self.lock:
+            if ok:
+                self.stats["flushed"] += len(batch)
+            self.stats["batches"] += 1
+        return ok
+
+    def _drain(self):
+        while self.queue:
+            batch = []
+            while self.queue and len(batch) < self.batch_size:
+                batch.append(self.queue.popleft())
+            self._write(batch)
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self._drain()
+                if self.spill_dir and len(self.queue) < self.max_queue // 2:
+                    self._replay_spill()
+            except Exception as e:
+                # Keep flushing: one I/O error must not stop the log for the life of the process
+                with self.lock:
+                    self.stats["writer_errors"] += 1
+                print(f"Prediction log writer error: {e}")
+        self._drain()
+
+    def flush(self):
+        """Blocks until everything enqueued so far has been handed to the sinks."""
+        self.wakeup.set()
+        while self.queue and self.thread.is_alive():
+            time.sleep(0.005)
+
+    def close(self):
+        self.stopping.set()
+        self.wakeup.set()
+        self.thread.join()
+        for sink in self.sinks:
+            sink.close()
+        for fh in self.spill_fhs.values():
+            fh.close()
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+        now = time.monotonic()
+        return {**stats, "queue_depth": len(self.queue), "max_queue": self.max_queue,
+                "overflow": self.overflow, "sink_backoff_s": [max(t - now, 0.0) for t in self.retry_at]}
@@ -0,0 +1,195 @@
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+BANDS = ["LOW", "MEDIUM", "HIGH"]
+
+
+def band_for(score, thresholds):
+    if score > thresholds["HIGH"]:
+        return "HIGH"
+    if score > thresholds["MEDIUM"]:
+        return "MEDIUM"
+    return "LOW"
+
+
+# --- Challengers ---
+class EndpointChallenger:
+    """A challenger deployed behind its own Vertex endpoint."""
+
+    routed = True  # Scores each tenant with the challenger's bundle for that tenant
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.name = endpoint.display_name
+
+    def score(self, vector, tenant_id):
+        # Routed like the champion call, so a tenant with its own model is compared against it
+        return self.endpoint.predict(instances=[vector], parameters={"tenant_ids": [tenant_id]}).predictions[0]
+
+
+class BundleChallenger:
+    """A challenger bundle scored in-process (no network hop, shares the API's CPU)."""
+
+    routed = False  # One bundle for every tenant: only comparable with the global champion
+
+    def __init__(self, uri):
+        from app.services.model_bundle import load_bundle
+
+        self.manifest, self.xgb_model, self.iso_model = load_bundle(uri)
+        self.name = self.manifest["model_version"]
+        self.weights = self.manifest["ensemble_weights"]
+        self.thresholds = self.manifest["band_thresholds"]
+
+    def score(self, vector, tenant_id):
+        import numpy as np
+
+        # Must match models/ensemble_cpr/ensemble.py
+        inputs = np.asarray([vector], dtype=np.float64)
+        prob_xgb = float(self.xgb_model.predict_proba(inputs)[0, 1])
+        raw_iso = float(self.iso_model.decision_function(inputs)[0])
+        prob_iso = min(max(1 - ((raw_iso + 1) / 2), 0.0), 1.0)
+        score = self.weights["xgb"] * prob_xgb + self.weights["iso"] * prob_iso
+        return {
+            "score": score,
+            "risk_band": band_for(score, self.thresholds),
+            "model_version": self.name,
+            "components": {"xgb": prob_xgb, "iso": prob_iso},
+        }
+
+
+# --- Shadow scorer ---
+class ShadowScorer:
+    """
+    Mirrors a sample of scored requests to a challenger on background threads
+    and compares its output with the champion's.
+
+    submit() only samples and hands off to a small pool; when `max_pending`
+    shadow calls are already outstanding the request is skipped (and counted),
+    so a slow challenger can never back up into champion latency. Sampling
+    hashes the transaction id, so a retried transaction is shadowed (or not)
+    consistently.
+
+    A challenger that isn't routed per tenant is only compared with results
+    from the global champion (`champion_version`); tenants scored by their own
+    bundles are skipped and counted.
+    """
+
+    def __init__(self, challenger, sample_rate=0.05, max_pending=64, workers=2, window=4096,
+                 champion_version=None):
+        self.challenger = challenger
+        self.champion_version = champion_version
+        self.sample_rate = sample_rate
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shadow")
+        self.lock = threading.Lock()
+        self.pending = 0
+
+        self.counts = {"sampled": 0, "scored": 0, "errors": 0, "skipped_busy": 0, "skipped_degraded": 0,
+                       "skipped_tenant_model": 0}
+        self.disagreements = 0
+        self.confusion = {c: dict.fromkeys(BANDS, 0) for c in BANDS}  # champion band -> challenger band
+        self.tenant_disagreements = {}
+        self.delta_sum = 0.0
+        self.deltas = deque(maxlen=window)              # challenger - champion score
+        self.challenger_ms = deque(maxlen=window)
+        self.champion_ms = deque(maxlen=window)
+
+    def sampled(self, transaction_id):
+        digest = hashlib.blake2b(transaction_id.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") < self.sample_rate * 2 ** 64
+
+    def submit(self, transaction_id, tenant_id, vector, champion, champion_ms, degraded=False):
+        if not self.sampled(transaction_id):
+            return False
+        with self.lock:
+            if (not self.challenger.routed and self.champion_version is not None
+                    and champion.get("model_version") != self.champion_version):
+                self.counts["skipped_tenant_model"] += 1
+                return False
+            if degraded:
+                # Under load the champion comes first; don't spend capacity on shadows
+                self.counts["skipped_degraded"] += 1
+                return False
+            if self.pending >= self.max_pending:
+                self.counts["skipped_busy"] += 1
+                return False
+            self.pending += 1
+            self.counts["sampled"] += 1
+        self.pool.submit(self._run, tenant_id, vector, champion, champion_ms)
+        return True
+
+    def _run(self, tenant_id, vector, champion, champion_ms):
+        try:
+            t0 = time.perf_counter()
+            result = self.challenger.score(vector, tenant_id)
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+
+            # A malformed challenger response fails here, before anything is recorded
+            delta = result["score"] - champion["score"]
+            challenger_band, champion_band = result["risk_band"], champion["risk_band"]
+            if challenger_band not in BANDS or champion_band not in BANDS:
+                raise ValueError(f"unknown risk band {challenger_band!r} / {champion_band!r}")
+            with self.lock:
+                self.counts["scored"] += 1
+                self.delta_sum += delta
+                self.deltas.append(delta)
+                self.challenger_ms.append(elapsed_ms)
+                if champion_ms is not None:  # None for transactions scored in a batch call
+                    self.champion_ms.append(champion_ms)
+                self.confusion[champion_band][challenger_band] += 1
+                if challenger_band != champion_band:
+                    self.disagreements += 1
+                    self.tenant_disagreements[tenant_id] = self.tenant_disagreements.get(tenant_id, 0) + 1
+        except Exception as e:
+            with self.lock:
+                self.counts["errors"] += 1
+            print(f"Shadow scoring failed on {self.challenger.name}: {e}")
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    @staticmethod
+    def _percentiles(values, ps=(0.50, 0.90, 0.99)):
+        values = sorted(values)
+        if not values:
+            return dict.fromkeys((f"p{int(p * 100)}" for p in ps))
+        return {f"p{int(p * 100)}": values[min(len(values) - 1, int(p * len(values)))] for p in ps}
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(self.counts)
+            scored = counts["scored"]
+            deltas = list(self.deltas)
+            challenger_ms = list(self.challenger_ms)
+            champion_ms = list(self.champion_ms)
+            confusion = {c: dict(row) for c, row in self.confusion.items()}
+            disagreements = self.disagreements
+            tenants = dict(self.tenant_disagreements)
+            delta_sum = self.delta_sum
+            pending = self.pending
+
+        return {
+            "challenger": self.challenger.name,
+            "sample_rate": self.sample_rate,
+            "pending": pending,
+            **counts,
+            "band_disagreement_rate": disagreements / scored if scored else None,
+            "band_confusion": confusion,
+            "tenant_disagreements": tenants,
+            "score_delta": {
+                "mean": delta_sum / scored if scored else None,
+                "abs": self._percentiles([abs(d) for d in deltas]),
+            },
+            # Champion latency is the single-transaction endpoint call in the request path, over the
+            # sampled requests that made one (batch calls carry no per-transaction latency)
+            "latency_ms": {
+                "challenger": self._percentiles(challenger_ms),
+                "champion": self._percentiles(champion_ms),
+            },
+        }
+
+    def close(self):
+        self.pool.shutdown(wait=True)
@@ -0,0 +1 @@
+# Puts api/ on sys.path so tests import the app package as the service does
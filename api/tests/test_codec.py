@@ -0,0 +1,72 @@
+from typing import List
+
+import msgpack
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from app.services import codec
+
+
+# Same shapes as app.main (which needs GCP clients at import)
+class TransactionRequest(BaseModel):
+    transaction_id: str
+    tenant_id: str
+    card_id: str
+    amount: float
+
+
+class BatchRequest(BaseModel):
+    transactions: List[TransactionRequest]
+
+
+app = FastAPI()
+
+
+@app.post("/score")
+async def score(request: Request):
+    txn = codec.decode_transaction(await request.body(), request.headers.get("content-type"), TransactionRequest)
+    return codec.encode({"transaction_id": txn.transaction_id, "amount": txn.amount},
+                        request.headers.get("accept"), request.headers.get("content-type"))
+
+
+@app.post("/score/batch")
+async def score_batch(request: Request):
+    txns = codec.decode_batch(await request.body(), request.headers.get("content-type"), BatchRequest)
+    return codec.encode({"count": len(txns)}, request.headers.get("accept"), request.headers.get("content-type"))
+
+
+client = TestClient(app)
+TXN = {"transaction_id": "tx1", "tenant_id": "tenant_001", "card_id": "CARD_1", "amount": 12.5}
+
+
+def test_json_and_msgpack_round_trip():
+    assert client.post("/score", json=TXN).json() == {"transaction_id": "tx1", "amount": 12.5}
+
+    response = client.post("/score", content=msgpack.packb(TXN), headers={"content-type": codec.MSGPACK})
+    assert response.headers["content-type"] == codec.MSGPACK
+    assert msgpack.unpackb(response.content) == {"transaction_id": "tx1", "amount": 12.5}
+
+
+def test_malformed_json_is_422():
+    for path in ("/score", "/score/batch"):
+        response = client.post(path, content=b'{"transaction_id": "tx1", "amount": ', headers={"content-type": "application/json"})
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["type"] == "json_invalid"
+
+
+def test_invalid_fields_are_422():
+    response = client.post("/score", json={**TXN, "amount": "lots"})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["amount"]
+
+    response = client.post("/score/batch", content=msgpack.packb({"transactions": [{"amount": 1}]}),
+                           headers={"content-type": codec.MSGPACK})
+    assert response.status_code == 422
+
+
+def test_unhashable_msgpack_key_is_422():
+    # {[]: 1} and {"transactions": [{{}: 1}]}
+    for path, body in (("/score", b"\x81\x90\x01"), ("/score/batch", b"\x81\xactransactions\x91\x81\x80\x01")):
+        response = client.post(path, content=body, headers={"content-type": codec.MSGPACK})
+        assert response.status_code == 422
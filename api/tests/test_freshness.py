@@ -0,0 +1,33 @@
+import json
+
+from app.services.freshness import LAG_BUCKETS, FreshnessTracker
+
+
+def test_lags_land_in_buckets():
+    tracker = FreshnessTracker()
+    lags = tracker.observe({"feature_time": 90.0, "last_event_time": 85.0, "written_at": 95.0}, score_time=100.0)
+    assert lags == {"feature_age": 10.0, "event_age": 15.0, "since_write": 5.0, "pipeline_lag": 10.0}
+
+    snapshot = tracker.snapshot()
+    assert snapshot["lags"]["feature_age"]["p50_le_s"] == 10
+    assert snapshot["lags"]["event_age"]["p99_le_s"] == 30
+    assert snapshot["lags"]["event_age"]["over_last_bucket"] == 0
+
+
+def test_untraced_features():
+    tracker = FreshnessTracker()
+    assert tracker.observe({"feature_time": None}, score_time=100.0) == {}
+    snapshot = tracker.snapshot()
+    assert snapshot["untraced"] == 1
+    assert snapshot["lags"]["feature_age"]["p50_le_s"] is None
+
+
+def test_overflow_bucket_serializes_as_json():
+    tracker = FreshnessTracker()
+    tracker.observe({"feature_time": 0.0}, score_time=LAG_BUCKETS[-1] + 600.0)
+
+    snapshot = tracker.snapshot()
+    assert snapshot["lags"]["feature_age"]["p99_le_s"] is None
+    assert snapshot["lags"]["feature_age"]["over_last_bucket"] == 1
+    # FastAPI's JSONResponse refuses NaN/Infinity
+    json.dumps(snapshot, allow_nan=False)
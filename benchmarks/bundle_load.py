@@ -0,0 +1,74 @@
+"""
+Load time: model bundle (sequential read / mmap) vs the old two-file layout.
+
+    python benchmarks/bundle_load.py --rows 200000 --repeats 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# --- PATH FIX --- (models/ holds train_hybrid.py and the ensemble_cpr package)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../models")))
+
+import joblib
+import xgboost as xgb
+
+from ensemble_cpr.bundle import BUNDLE_FILENAME, load_models, read_bundle, serialize_models, write_bundle
+from train_hybrid import make_mock_data, train
+
+
+def load_two_files(directory):
+    # The pre-bundle CprPredictor.load path
+    model_xgb = xgb.XGBClassifier()
+    model_xgb.load_model(os.path.join(directory, "model.bst"))
+    model_iso = joblib.load(os.path.join(directory, "isolation_forest.joblib"))
+    return model_xgb, model_iso
+
+
+def load_bundle(directory, use_mmap):
+    _, sections = read_bundle(os.path.join(directory, BUNDLE_FILENAME), use_mmap=use_mmap)
+    return load_models(sections)
+
+
+def timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), min(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    df = make_mock_data(args.rows)
+    model_xgb, model_iso, _ = train(df.drop("is_fraud", axis=1), df["is_fraud"], cpus=os.cpu_count())
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_xgb.save_model(os.path.join(directory, "model.bst"))
+        joblib.dump(model_iso, os.path.join(directory, "isolation_forest.joblib"))
+        write_bundle(os.path.join(directory, BUNDLE_FILENAME), serialize_models(model_xgb, model_iso), "bench")
+
+        sizes = {name: os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)}
+        print("Artifacts: " + ", ".join(f"{n}={s / 1024:.0f} KiB" for n, s in sorted(sizes.items())))
+
+        cases = {
+            "two files (model.bst + joblib)": lambda: load_two_files(directory),
+            "bundle, sequential read": lambda: load_bundle(directory, use_mmap=False),
+            "bundle, mmap": lambda: load_bundle(directory, use_mmap=True),
+        }
+        print(f"Load time over {args.repeats} runs (ms):")
+        for name, fn in cases.items():
+            median, best = timed(fn, args.repeats)
+            print(f"  {name:<32} median={median:7.2f}  min={best:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
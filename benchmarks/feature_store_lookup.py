@@ -0,0 +1,177 @@
+"""
+Online feature lookup latency: the embedded memory-mapped table
+(app.services.local_feature_store) against a Vertex Feature Store stand-in.
+
+The stand-in is a FeatureBackend whose reads sleep for a log-normal round
+trip (median --vertex-rtt-ms; pass the p50 you measure from the API's region)
+plus a small per-entity cost on streaming reads, so the comparison is the
+network hop the embedded table removes, not a measurement of Vertex itself.
+
+Also measures the pipeline's batched write throughput and lookups from
+several reader processes while a writer keeps updating the table (checking
+that no reader ever sees a half-written record).
+
+    python benchmarks/feature_store_lookup.py --keys 200000 --readers 4
+"""
+import argparse
+import multiprocessing as mp
+import os
+import random
+import sys
+import tempfile
+import time
+
+# --- PATH FIX --- (api/ holds the app package, streaming/ the table writer)
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "api"))
+sys.path.insert(0, os.path.join(ROOT, "streaming"))
+
+import local_feature_store as table_writer
+from app.services.feature_backend import FeatureBackend
+from app.services.local_feature_store import LocalFeatureStoreClient
+
+NOW_US = int(time.time() * 1e6)
+
+
+class VertexStandIn(FeatureBackend):
+    """Remote-read latency model: one round trip per read, one per streaming batch."""
+
+    name = "vertex-stand-in"
+
+    def __init__(self, rtt_ms, per_entity_ms=0.05, sigma=0.35):
+        super().__init__()
+        self.rtt_ms = rtt_ms
+        self.per_entity_ms = per_entity_ms
+        self.sigma = sigma
+        self.rng = random.Random(0)
+
+    def _round_trip(self, entities=1):
+        time.sleep((self.rng.lognormvariate(0, self.sigma) * self.rtt_ms + entities * self.per_entity_ms) / 1000)
+
+    def get_streaming_features(self, tenant_id, card_id):
+        self._round_trip()
+        return self._empty()
+
+    def get_streaming_features_batch(self, entities):
+        entities = list(dict.fromkeys(entities))
+        self._round_trip(len(entities))
+        return {entity: self._empty() for entity in entities}
+
+
+def row(i, version=1):
+    # txn_sum_10m is always 10 x txn_count_10m, so a torn read is detectable
+    return (f"tenant_{i % 20:03d}#CARD_{i:08d}", version + i % 7, (version + i % 7) * 10.0,
+            NOW_US, NOW_US - 3_000_000, NOW_US)
+
+
+def entity(i):
+    return f"tenant_{i % 20:03d}", f"CARD_{i:08d}"
+
+
+def percentiles(samples_us):
+    samples_us = sorted(samples_us)
+    pick = lambda q: samples_us[min(len(samples_us) - 1, int(q * len(samples_us)))]
+    return pick(0.50), pick(0.99), sum(samples_us) / len(samples_us)
+
+
+def time_calls(fn, args_list):
+    samples = []
+    for args in args_list:
+        t0 = time.perf_counter_ns()
+        fn(*args)
+        samples.append((time.perf_counter_ns() - t0) / 1000)
+    return percentiles(samples)
+
+
+def build(path, keys, batch_size):
+    table_writer.create_table(path, int(keys / 0.7))
+    table = table_writer.LocalFeatureTable(path, writable=True)
+    start = time.perf_counter()
+    for lo in range(0, keys, batch_size):
+        table.write_batch([row(i) for i in range(lo, min(lo + batch_size, keys))])
+    insert_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for lo in range(0, keys, batch_size):
+        table.write_batch([row(i, version=2) for i in range(lo, min(lo + batch_size, keys))])
+    update_s = time.perf_counter() - start
+    print(f"Table: {keys:,} keys in {table.capacity:,} slots "
+          f"({os.path.getsize(path) / 2 ** 20:.0f} MiB), batches of {batch_size}")
+    print(f"  insert {keys / insert_s:,.0f} rows/s, update {keys / update_s:,.0f} rows/s")
+    table.close()
+
+
+def keep_writing(path, keys, batch_size, stop):
+    table = table_writer.LocalFeatureTable(path, writable=True)
+    version = 3
+    while not stop.is_set():
+        lo = random.randrange(0, max(keys - batch_size, 1))
+        table.write_batch([row(i, version) for i in range(lo, min(lo + batch_size, keys))])
+        version += 1
+
+
+def read_for(path, keys, seconds, results):
+    client = LocalFeatureStoreClient(path)
+    rng = random.Random(os.getpid())
+    lookups = torn = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        for _ in range(1000):
+            features = client.get_streaming_features(*entity(rng.randrange(keys)))
+            if features["txn_sum_10m"] != features["txn_count_10m"] * 10.0:
+                torn += 1
+        lookups += 1000
+    results.put((lookups, torn))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=200_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=100, help="Entities per batch read")
+    parser.add_argument("--write-batch", type=int, default=500, help="Rows per pipeline write batch")
+    parser.add_argument("--vertex-rtt-ms", type=float, default=6.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "features.fsl")
+        build(path, args.keys, args.write_batch)
+
+        local = LocalFeatureStoreClient(path)
+        vertex = VertexStandIn(args.vertex_rtt_ms)
+        rng = random.Random(1)
+        hits = [entity(rng.randrange(args.keys)) for _ in range(args.lookups)]
+        misses = [("tenant_999", f"CARD_X{i:08d}") for i in range(args.lookups)]
+        batches = [[entity(rng.randrange(args.keys)) for _ in range(args.batch_size)] for _ in range(200)]
+
+        print(f"\n{'backend':<18}{'read':<16}{'p50 us':>10}{'p99 us':>10}{'mean us':>10}")
+        for name, backend, n in (("local (mmap)", local, args.lookups), ("vertex stand-in", vertex, 200)):
+            rows = [
+                ("single, hit", backend.get_streaming_features, hits[:n]),
+                ("single, miss", backend.get_streaming_features, misses[:n]),
+                (f"batch of {args.batch_size}", backend.get_streaming_features_batch, [(b,) for b in batches]),
+            ]
+            for label, fn, calls in rows:
+                p50, p99, mean = time_calls(fn, calls)
+                print(f"{name:<18}{label:<16}{p50:10.1f}{p99:10.1f}{mean:10.1f}")
+
+        # Many API worker processes reading while the pipeline writes
+        stop, results = mp.Event(), mp.Queue()
+        writer = mp.Process(target=keep_writing, args=(path, args.keys, args.write_batch, stop))
+        readers = [mp.Process(target=read_for, args=(path, args.keys, args.seconds, results))
+                   for _ in range(args.readers)]
+        writer.start()
+        for p in readers:
+            p.start()
+        counts = [results.get() for _ in readers]
+        stop.set()
+        for p in readers + [writer]:
+            p.join()
+        lookups = sum(c[0] for c in counts)
+        print(f"\n{args.readers} reader processes + 1 writer for {args.seconds:.0f}s ({os.cpu_count()} CPUs): "
+              f"{lookups / args.seconds:,.0f} lookups/s total, {sum(c[1] for c in counts)} torn reads")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Prediction log writer: cost of enqueue() on the request path, and flush
+throughput of each local sink (the BigQuery sink is exercised through its
+SQLite stand-in).
+
+    python benchmarks/prediction_log.py --records 200000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+# --- PATH FIX --- (api/ holds the app package)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../api")))
+
+from app.services.prediction_log import PredictionLogWriter, build_sink
+
+
+def make_records(n):
+    rng = random.Random(7)
+    return [{
+        "timestamp": f"2026-01-01T00:{i // 60000 % 60:02d}:{i // 1000 % 60:02d}.{i % 1000:03d}000+00:00",
+        "transaction_id": f"tx_{i}",
+        "tenant_id": f"tenant_{i % 20}",
+        "card_id": f"card_{rng.randrange(100000)}",
+        "amount": round(rng.lognormvariate(3.5, 1.0), 2),
+        "txn_count_10m": rng.randrange(10),
+        "txn_sum_10m": round(rng.uniform(0, 2000), 2),
+        "score": rng.random(),
+        "risk_band": rng.choice(["LOW", "MEDIUM", "HIGH"]),
+        "xgb_score": rng.random(),
+        "iso_score": rng.random(),
+        "model_version": "bench",
+    } for i in range(n)]
+
+
+class NullSink:
+    def write(self, records):
+        pass
+
+    def close(self):
+        pass
+
+
+def bench_enqueue(records, max_queue, overflow, spill_dir=None):
+    """Per-record enqueue cost with the writer draining in the background."""
+    writer = PredictionLogWriter([NullSink()], max_queue=max_queue, overflow=overflow, spill_dir=spill_dir)
+    t0 = time.perf_counter_ns()
+    for r in records:
+        writer.enqueue(r)
+    elapsed = time.perf_counter_ns() - t0
+    writer.close()
+    return elapsed / len(records), writer.snapshot()
+
+
+def bench_flush(kind, target, records, batch_size):
+    """Throughput from enqueue to records durably handed to the sink."""
+    writer = PredictionLogWriter([build_sink(kind, target)], max_queue=len(records) + 1,
+                                 batch_size=batch_size, flush_interval=0.05)
+    t0 = time.perf_counter()
+    for r in records:
+        writer.enqueue(r)
+    writer.close()
+    return len(records) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+
+    # 1. Request-path cost
+    print("enqueue() cost:")
+    ns, stats = bench_enqueue(records, max_queue=len(records) + 1, overflow="drop")
+    print(f"  buffer never full          {ns:7.0f} ns/record")
+    ns, stats = bench_enqueue(records, max_queue=1000, overflow="drop")
+    print(f"  buffer 1k, overflow=drop   {ns:7.0f} ns/record  (dropped {stats['dropped']:,})")
+    with tempfile.TemporaryDirectory() as spill_dir:
+        ns, stats = bench_enqueue(records, max_queue=1000, overflow="spill", spill_dir=spill_dir)
+    print(f"  buffer 1k, overflow=spill  {ns:7.0f} ns/record  (spilled {stats['spilled']:,}, "
+          f"replayed {stats['replayed']:,})")
+
+    # 2. Sink throughput
+    print(f"Flush throughput (batch_size={args.batch_size}):")
+    with tempfile.TemporaryDirectory() as directory:
+        sinks = {
+            "jsonl": os.path.join(directory, "jsonl"),
+            "parquet": os.path.join(directory, "parquet"),
+            "sqlite (BigQuery stand-in)": os.path.join(directory, "predictions.db"),
+        }
+        for name, target in sinks.items():
+            try:
+                rate = bench_flush(name.split()[0], target, records, args.batch_size)
+            except ImportError as e:
+                print(f"  {name:<28} skipped ({e})")
+                continue
+            print(f"  {name:<28} {rate:12,.0f} records/s")
+
+
+if __name__ == "__main__":
+    main()
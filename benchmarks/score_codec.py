@@ -0,0 +1,107 @@
+"""
+Serialization cost of /v3/score and /v3/score/batch: request decode + response
+encode, per request and per batch, for
+
+  * the previous JSON path: pydantic validation of the body, then FastAPI's
+    jsonable_encoder pass before JSONResponse
+  * the current JSON path: pydantic validation, JSONResponse directly
+  * msgpack: hand-checked fast-path parser, msgpack.packb
+
+    python benchmarks/score_codec.py --batch-sizes 1 100 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+# --- PATH FIX --- (api/ holds the app package)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../api")))
+
+import msgpack
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.services import codec
+
+
+# Same shapes as app.main (importing it would pull in the Google clients)
+class TransactionRequest(BaseModel):
+    transaction_id: str
+    tenant_id: str
+    card_id: str
+    amount: float
+
+
+class BatchRequest(BaseModel):
+    transactions: List[TransactionRequest]
+
+
+def make_request(i):
+    return {"transaction_id": f"tx_{i:012d}", "tenant_id": f"tenant_{i % 20:03d}",
+            "card_id": f"CARD_{i % 100000:07d}", "amount": 12.5 + i % 977}
+
+
+def make_response(txn):
+    return {
+        "transaction_id": txn["transaction_id"],
+        "tenant_id": txn["tenant_id"],
+        "velocity_features": {"txn_count_10m": 3, "txn_sum_10m": 412.75, "feature_time": 1792369560.0,
+                              "last_event_time": 1792369555.31, "written_at": 1792369557.02},
+        "risk_assessment": {"score": 0.0731, "risk_band": "LOW", "model_version": "v3-20261019001454",
+                            "components": {"xgb": 0.0412, "iso": 0.2008}},
+        "feature_freshness": {"feature_age": 4.1, "event_age": 8.8, "since_write": 7.1, "pipeline_lag": 1.7},
+        "degraded": [],
+    }
+
+
+def bench(fn, min_seconds=0.5):
+    n, start = 0, time.perf_counter()
+    while True:
+        fn()
+        n += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 500])
+    args = parser.parse_args()
+
+    print(f"{'payload':<16}{'path':<22}{'decode us':>11}{'encode us':>11}{'total us':>10}"
+          f"{'us/txn':>9}{'req B':>9}{'resp B':>9}")
+    for size in args.batch_sizes:
+        txns = [make_request(i) for i in range(size)]
+        if size == 1:
+            label, req_obj = "single", txns[0]
+            resp_obj = make_response(txns[0])
+            decode_json = lambda body: codec.decode_transaction(body, "application/json", TransactionRequest)
+            decode_mp = lambda body: codec.decode_transaction(body, codec.MSGPACK, TransactionRequest)
+        else:
+            label, req_obj = f"batch of {size}", {"transactions": txns}
+            resp_obj = {"results": [make_response(t) for t in txns]}
+            decode_json = lambda body: codec.decode_batch(body, "application/json", BatchRequest)
+            decode_mp = lambda body: codec.decode_batch(body, codec.MSGPACK, BatchRequest)
+
+        json_body = json.dumps(req_obj).encode()
+        mp_body = msgpack.packb(req_obj)
+        paths = {
+            "json (previous)": (lambda: decode_json(json_body),
+                                lambda: JSONResponse(jsonable_encoder(resp_obj)).body, json_body),
+            "json (current)": (lambda: decode_json(json_body),
+                               lambda: codec.encode(resp_obj, "application/json", "application/json").body, json_body),
+            "msgpack": (lambda: decode_mp(mp_body),
+                        lambda: codec.encode(resp_obj, codec.MSGPACK, codec.MSGPACK).body, mp_body),
+        }
+        for name, (decode, encode, body) in paths.items():
+            d_us, e_us = bench(decode), bench(encode)
+            print(f"{label:<16}{name:<22}{d_us:11.1f}{e_us:11.1f}{d_us + e_us:10.1f}"
+                  f"{(d_us + e_us) / size:9.2f}{len(body):9,}{len(encode()):9,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Load test for /v3/score admission control.
+
+Replays the scoring handler's steps (gate -> admit -> features -> model ->
+release) against simulated Feature Store / endpoint latencies on a worker pool
+the size of the FastAPI thread pool, with open-loop Poisson arrivals at
+multiples of capacity. Compares no admission control against AdmissionController
+and reports served throughput, p50/p99 of served requests, and every decision.
+
+    python benchmarks/score_load.py --duration 10 --load 1.0 2.0
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- PATH FIX --- (api/ holds the app package)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../api")))
+
+from app.services.admission import AdmissionController, Rejected
+
+WORKERS = 40                 # anyio's default thread pool, which runs sync FastAPI handlers
+FEATURE_MS = 15              # Feature Store online read
+MODEL_MS = 60                # Endpoint call, XGBoost + IsolationForest
+MODEL_SKIP_ISO_MS = 35       # Endpoint call, XGBoost only
+CAPACITY_RPS = WORKERS / ((FEATURE_MS + MODEL_MS) / 1000)
+TENANT_SHARES = {"tenant_A": 0.4, **{f"tenant_{c}": 0.1 for c in "BCDEFG"}}
+
+
+def stage(ms):
+    time.sleep(ms / 1000 * random.lognormvariate(0, 0.25))
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.served = []
+        self.status = {}
+
+    def add(self, status, latency=None):
+        with self.lock:
+            self.status[status] = self.status.get(status, 0) + 1
+            if latency is not None:
+                self.served.append(latency)
+
+
+def handle(controller, cache, recorder, tenant, card, arrival):
+    """The /v3/score handler body with the network calls replaced by sleeps."""
+    try:
+        if controller is None:
+            stage(FEATURE_MS)
+            stage(MODEL_MS)
+            recorder.add(200, time.monotonic() - arrival)
+            return
+        try:
+            ticket = controller.admit(tenant, arrival)
+        except Rejected as r:
+            recorder.add(r.status_code)
+            return
+        try:
+            if ticket.stale_features and card in cache:
+                controller.count("stale_features_served")
+            else:
+                if ticket.stale_features:
+                    controller.count("stale_features_miss")
+                t0 = time.monotonic()
+                stage(FEATURE_MS)
+                cache[card] = True
+                controller.observe("features", time.monotonic() - t0)
+            t0 = time.monotonic()
+            stage(MODEL_SKIP_ISO_MS if ticket.skip_iso else MODEL_MS)
+            controller.observe("model_skip_iso" if ticket.skip_iso else "model", time.monotonic() - t0)
+        finally:
+            controller.release(ticket, arrival)
+        recorder.add(200, time.monotonic() - arrival)
+    finally:
+        if controller is not None:
+            controller.exit()
+
+
+def run(rate, duration, controller):
+    recorder = Recorder()
+    cache = {}
+    tenants, weights = list(TENANT_SHARES), list(TENANT_SHARES.values())
+    pool = ThreadPoolExecutor(max_workers=WORKERS)
+
+    start = time.monotonic()
+    next_arrival = start
+    while next_arrival - start < duration:
+        now = time.monotonic()
+        if next_arrival > now:
+            time.sleep(next_arrival - now)
+        arrival = time.monotonic()
+        tenant = random.choices(tenants, weights)[0]
+        card = f"card_{int(random.paretovariate(1.2)) % 5000}"
+        # The middleware gate runs on the event loop, before the thread pool queue
+        if controller is not None:
+            try:
+                controller.enter()
+            except Rejected as r:
+                recorder.add(r.status_code)
+                next_arrival += random.expovariate(rate)
+                continue
+        pool.submit(handle, controller, cache, recorder, tenant, card, arrival)
+        next_arrival += random.expovariate(rate)
+    pool.shutdown(wait=True)
+    return recorder, time.monotonic() - start
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] * 1000 if values else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--load", type=float, nargs="+", default=[1.0, 2.0], help="Multiples of capacity")
+    parser.add_argument("--budget-ms", type=float, default=250)
+    args = parser.parse_args()
+
+    print(f"Simulated capacity ~{CAPACITY_RPS:.0f} req/s ({WORKERS} workers, "
+          f"{FEATURE_MS}+{MODEL_MS} ms per request), {args.duration:.0f}s per run")
+    print(f"{'scenario':<28}{'offered':>9}{'served/s':>10}{'p50 ms':>9}{'p99 ms':>9}   responses / decisions")
+    for load in args.load:
+        rate = load * CAPACITY_RPS
+        for name in ("no admission control", "admission control"):
+            controller = None
+            if name == "admission control":
+                controller = AdmissionController(budget_ms=args.budget_ms, max_inflight=WORKERS + WORKERS // 2)
+            recorder, elapsed = run(rate, args.duration, controller)
+            served = recorder.served
+            line = (f"{name + f' @ {load:.1f}x':<28}{rate:9.0f}{len(served) / elapsed:10.0f}"
+                    f"{pct(served, 0.50):9.1f}{pct(served, 0.99):9.1f}   "
+                    + " ".join(f"{s}={n}" for s, n in sorted(recorder.status.items())))
+            print(line)
+            if controller is not None:
+                d = controller.snapshot()["decisions"]
+                print(f"{'':<65}full={d['full']} stale={d['stale_features']} (served {d['stale_features_served']}) "
+                      f"skip_iso={d['skip_iso']} shed={d['shed_overload'] + d['shed_budget']} "
+                      f"throttled={d['throttled_rate'] + d['throttled_concurrency']}")
+
+
+if __name__ == "__main__":
+    main()
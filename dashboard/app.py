@@ -1,14 +1,12 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
 import time
-from datetime import datetime, timedelta
 import plotly.express as px
 from google.oauth2 import service_account
-from google.cloud import bigquery
 from google.cloud import aiplatform
 import os
 
+from data_layer import DashboardData, BigQuerySource, MockSource
+
 # Page Config
 st.set_page_config(
     page_title="FraudShield V3 Operations",
@@ -34,40 +32,20 @@ def get_credentials():
 
 creds = get_credentials()
 
-# --- MOCK DATA GENERATOR (V3 Demo) ---
-def generate_mock_data():
-    """Generates realistic-looking V3 fraud logs for demo purposes."""
-    data = []
-    base_time = datetime.now()
-    
-    # Generate 100 recent transactions
-    for i in range(100):
-        is_fraud = np.random.choice([True, False], p=[0.15, 0.85])
-        
-        # Logic to make data look correlated
-        score = np.random.uniform(0.7, 0.99) if is_fraud else np.random.uniform(0.01, 0.4)
-        risk = "HIGH" if score > 0.7 else ("MEDIUM" if score > 0.3 else "LOW")
-        
-        tx = {
-            "timestamp": (base_time - timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
-            "transaction_id": f"TXN_{100000+i}",
-            "tenant_id": "tenant_A" if i % 2 == 0 else "tenant_B",
-            "amount": round(np.random.uniform(10, 1500), 2),
-            "score": round(score, 4),
-            "risk_band": risk,
-            "model_version": "fraudshield-hybrid-v1"
-        }
-        data.append(tx)
-    
-    return pd.DataFrame(data)
+# --- DATA LAYER ---
+# Shared by every session and rerun: TTL-cached, incrementally refreshed, aggregated in SQL
+@st.cache_resource
+def get_data(mode):
+    if mode == "Live Stream (Demo)":
+        return DashboardData(MockSource(events_per_sec=25.0))
+    return DashboardData(BigQuerySource(TABLE_ID, PROJECT_ID, credentials=creds))
 
 # --- SIDEBAR ---
 st.sidebar.title("🛡️ FraudShield V3")
 st.sidebar.markdown(f"**Project:** `{PROJECT_ID}`")
 mode = st.sidebar.radio("Data Source", ["Live Stream (Demo)", "BigQuery (Offline)"])
 
-if st.sidebar.button("Refresh Data"):
-    st.rerun()
+force_refresh = st.sidebar.button("Refresh Data")
 
 st.sidebar.markdown("---")
 st.sidebar.header("Operations")
@@ -82,84 +60,85 @@ if st.sidebar.button("Trigger Retraining (Hybrid)"):
 st.title("FraudShield Operations Center")
 
 # Data Loading Logic
-df = pd.DataFrame()
+data = None
 
 if mode == "Live Stream (Demo)":
-    # Simulate loading
-    with st.spinner('Fetching real-time predictions from Pub/Sub...'):
-        time.sleep(0.5) 
-    df = generate_mock_data()
+    data = get_data(mode)
+    data.refresh(force=force_refresh)
     st.sidebar.success("🟢 System Status: ONLINE")
     st.sidebar.info("Streaming Engine: Active\n\nEndpoint: fraudshield-hybrid-endpoint")
 
 else:
     # BigQuery Connection (V2 Logic)
     try:
-        client = bigquery.Client(project=PROJECT_ID, credentials=creds)
-        query = f"""
-            SELECT transaction_id, score, risk_band, timestamp, model_version
-            FROM `{TABLE_ID}`
-            ORDER BY timestamp DESC
-            LIMIT 1000
-        """
-        df = client.query(query).to_dataframe()
+        data = get_data(mode)
+        data.refresh(force=force_refresh)
     except Exception as e:
+        data = None
         st.error(f"BigQuery Connection Error: {e}")
         st.warning("Switch to 'Live Stream (Demo)' to view the dashboard interface.")
 
+if data and data.stats["last"]:
+    last = data.stats["last"]
+    st.sidebar.caption(
+        f"Last refresh: {last['until']:%H:%M:%S} UTC · {last['queries']} queries · "
+        f"{last['bytes_processed'] / 1e6:.1f} MB processed · {last['rows']:,} rows · {last['seconds']:.2f}s\n\n"
+        f"Refreshes: {data.stats['refreshes']} · cached reruns: {data.stats['cache_hits']}"
+    )
+
 # --- DASHBOARD VISUALIZATION ---
-if not df.empty:
+summary = data.summary() if data else None
+if summary and summary["total"]:
     # 1. METRICS ROW
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Total Predictions", len(df))
-    
-    avg_score = df['score'].mean()
-    col2.metric("Avg Fraud Score", f"{avg_score:.4f}")
-    
-    high_risk_count = len(df[df['risk_band'] == 'HIGH'])
-    col3.metric("High Risk Tx", high_risk_count, delta_color="inverse")
-    
-    latest_version = df.iloc[0]['model_version'] if 'model_version' in df.columns else "N/A"
-    col4.metric("Active Model", latest_version)
-
-    # 2. CHARTS ROW (Plotly)
+    col1.metric("Total Predictions", f"{summary['total']:,}")
+    col2.metric("Avg Fraud Score", f"{summary['avg_score']:.4f}")
+    col3.metric("High Risk Tx", f"{summary['high_risk']:,}", delta_color="inverse")
+    col4.metric("Active Model", summary["model_version"])
+
+    # 2. CHARTS ROW (Plotly) - pre-aggregated, so plot bars/lines directly
+    band_colors = {"LOW": "#00CC96", "MEDIUM": "#FFA15A", "HIGH": "#EF553B"}
     c1, c2 = st.columns(2)
     with c1:
         st.subheader("Score Distribution")
-        fig_hist = px.histogram(
-            df, 
-            x="score", 
-            nbins=20, 
-            title="Fraud Score Histogram", 
+        fig_hist = px.bar(
+            data.histogram(),
+            x="bin_start",
+            y="n",
+            title="Fraud Score Histogram",
             color="risk_band",
-            color_discrete_map={"LOW": "#00CC96", "MEDIUM": "#FFA15A", "HIGH": "#EF553B"}
+            color_discrete_map=band_colors,
+            labels={"bin_start": "score", "n": "count"}
         )
+        fig_hist.update_layout(bargap=0)
         st.plotly_chart(fig_hist, use_container_width=True)
-        
+
     with c2:
         st.subheader("Drift Monitor")
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        # Sort by time for the line chart
-        df_sorted = df.sort_values('timestamp')
         fig_line = px.line(
-            df_sorted, 
-            x="timestamp", 
-            y="score", 
-            title="Avg Score Over Time", 
-            markers=True,
+            data.timeseries(),
+            x="minute",
+            y="avg_score",
+            title="Avg Score Per Minute",
             line_shape="spline"
         )
         st.plotly_chart(fig_line, use_container_width=True)
 
-    # 3. DATA TABLE
+    # 3. TENANT BREAKDOWN
+    st.subheader("Risk Bands per Tenant")
+    bands = data.tenant_bands().reset_index().melt(id_vars="tenant_id", var_name="risk_band", value_name="n")
+    fig_tenants = px.bar(bands, x="tenant_id", y="n", color="risk_band", color_discrete_map=band_colors)
+    st.plotly_chart(fig_tenants, use_container_width=True)
+
+    # 4. DATA TABLE
     st.subheader("Recent Live Traffic")
-    
+
     def color_risk(val):
         color = '#ff4b4b' if val == 'HIGH' else ('#ffa421' if val == 'MEDIUM' else '#21c354')
         return f'color: {color}; font-weight: bold'
 
     st.dataframe(
-        df[['timestamp', 'transaction_id', 'score', 'risk_band', 'amount', 'tenant_id']]
+        data.recent[['timestamp', 'transaction_id', 'score', 'risk_band', 'amount', 'tenant_id']]
         .style.applymap(color_risk, subset=['risk_band']),
         use_container_width=True
     )
@@ -0,0 +1,285 @@
+"""
+Data layer for the operations dashboard.
+
+Streamlit re-runs app.py on every widget interaction, so nothing here talks to
+BigQuery per rerun. One DashboardData instance is shared by all sessions
+(st.cache_resource) and:
+
+  * refreshes at most once per TTL; reruns in between are served from memory
+  * fetches only the interval (watermark, now - lag] on each refresh
+  * pushes aggregation into SQL - per-minute score histograms by band and
+    per-minute band counts by tenant - so a refresh returns a few hundred rows
+    however many predictions landed; only the "recent traffic" table is raw rows
+  * folds increments into per-minute cubes and ages minutes out of the window
+
+Every panel (metrics, histogram, time series, tenant bands) is derived from the
+cubes, and per-refresh query count, bytes processed and rows transferred are
+kept in `stats` for display.
+
+    python dashboard/data_layer.py --estimate     # dry-run bytes: legacy query vs incremental refresh
+    python dashboard/data_layer.py --mock         # refresh cost against the mock source
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+SCORE_BINS = 20
+BANDS = ["LOW", "MEDIUM", "HIGH"]
+RECENT_COLUMNS = ["timestamp", "transaction_id", "tenant_id", "amount", "score", "risk_band", "model_version"]
+
+
+# --- Sources ---
+class BigQuerySource:
+    """Aggregating queries over the partitioned `predictions` table."""
+
+    def __init__(self, table_id, project_id, credentials=None):
+        from google.cloud import bigquery
+
+        self.bq = bigquery
+        self.client = bigquery.Client(project=project_id, credentials=credentials)
+        self.table_id = table_id
+
+    def _queries(self, recent_rows):
+        t = self.table_id
+        window = "WHERE timestamp > @since AND timestamp <= @until"
+        return {
+            "minutes": f"""
+                SELECT TIMESTAMP_TRUNC(timestamp, MINUTE) AS minute, risk_band,
+                       LEAST(CAST(FLOOR(score * {SCORE_BINS}) AS INT64), {SCORE_BINS - 1}) AS score_bin,
+                       COUNT(*) AS n, SUM(score) AS score_sum
+                FROM `{t}` {window}
+                GROUP BY minute, risk_band, score_bin
+            """,
+            "tenants": f"""
+                SELECT TIMESTAMP_TRUNC(timestamp, MINUTE) AS minute,
+                       IFNULL(tenant_id, 'unknown') AS tenant_id, risk_band, COUNT(*) AS n
+                FROM `{t}` {window}
+                GROUP BY minute, tenant_id, risk_band
+            """,
+            "recent": f"""
+                SELECT {', '.join(RECENT_COLUMNS)}
+                FROM `{t}` {window}
+                ORDER BY timestamp DESC
+                LIMIT {int(recent_rows)}
+            """,
+        }
+
+    def _config(self, since, until, dry_run=False):
+        return self.bq.QueryJobConfig(dry_run=dry_run, use_query_cache=not dry_run, query_parameters=[
+            self.bq.ScalarQueryParameter("since", "TIMESTAMP", since),
+            self.bq.ScalarQueryParameter("until", "TIMESTAMP", until),
+        ])
+
+    def fetch(self, since, until, recent_rows):
+        """Returns ({name: DataFrame}, {"queries", "bytes_processed", "rows"})."""
+        frames, cost = {}, {"queries": 0, "bytes_processed": 0, "rows": 0}
+        jobs = {name: self.client.query(sql, job_config=self._config(since, until))
+                for name, sql in self._queries(recent_rows).items()}  # submitted concurrently
+        for name, job in jobs.items():
+            frames[name] = job.to_dataframe()
+            cost["queries"] += 1
+            cost["bytes_processed"] += job.total_bytes_processed or 0
+            cost["rows"] += len(frames[name])
+        return frames, cost
+
+    def estimate(self, since, until, recent_rows):
+        """Dry-run bytes per query for one refresh over (since, until]."""
+        return {name: self.client.query(sql, job_config=self._config(since, until, dry_run=True)).total_bytes_processed
+                for name, sql in self._queries(recent_rows).items()}
+
+    def estimate_legacy(self):
+        """Dry-run bytes of the query app.py used to run on every rerun."""
+        sql = f"""
+            SELECT transaction_id, score, risk_band, timestamp, model_version
+            FROM `{self.table_id}`
+            ORDER BY timestamp DESC
+            LIMIT 1000
+        """
+        return self.client.query(sql, job_config=self.bq.QueryJobConfig(dry_run=True)).total_bytes_processed
+
+
+class MockSource:
+    """
+    Synthetic predictions at a fixed rate, generated with vectorized numpy for
+    exactly the requested interval and aggregated the same way as the SQL.
+    """
+
+    def __init__(self, events_per_sec=25.0, tenants=8, seed=None):
+        self.rate = events_per_sec
+        self.tenants = np.array([f"tenant_{chr(ord('A') + i)}" for i in range(tenants)])
+        self.rng = np.random.default_rng(seed)
+        self.next_id = 100000
+
+    def generate(self, since, until):
+        span = (until - since).total_seconds()
+        n = int(self.rng.poisson(max(span, 0) * self.rate))
+        offsets = np.sort(self.rng.uniform(0, span, n))
+        is_fraud = self.rng.random(n) < 0.05
+        score = np.where(is_fraud, self.rng.uniform(0.6, 0.99, n), self.rng.beta(1.2, 8.0, n))
+        band = np.where(score > 0.7, "HIGH", np.where(score > 0.3, "MEDIUM", "LOW"))
+        df = pd.DataFrame({
+            "timestamp": pd.Timestamp(since) + pd.to_timedelta(offsets, unit="s"),
+            "transaction_id": np.char.add("TXN_", np.arange(self.next_id, self.next_id + n).astype(str)),
+            "tenant_id": self.tenants[self.rng.integers(0, len(self.tenants), n)],
+            "amount": np.round(self.rng.lognormal(3.5, 1.0, n), 2),
+            "score": np.round(score, 4),
+            "risk_band": band,
+            "model_version": "fraudshield-hybrid-v1",
+        })
+        self.next_id += n
+        return df
+
+    def fetch(self, since, until, recent_rows):
+        df = self.generate(since, until)
+        minute = df["timestamp"].dt.floor("min")
+        score_bin = np.minimum((df["score"].to_numpy() * SCORE_BINS).astype(np.int64), SCORE_BINS - 1)
+        frames = {
+            "minutes": df.assign(minute=minute, score_bin=score_bin)
+                         .groupby(["minute", "risk_band", "score_bin"], as_index=False)
+                         .agg(n=("score", "size"), score_sum=("score", "sum")),
+            "tenants": df.assign(minute=minute)
+                         .groupby(["minute", "tenant_id", "risk_band"], as_index=False)
+                         .agg(n=("score", "size")),
+            "recent": df.iloc[::-1].head(recent_rows)[RECENT_COLUMNS],
+        }
+        return frames, {"queries": 0, "bytes_processed": 0, "rows": sum(len(f) for f in frames.values())}
+
+
+# --- Incremental store ---
+class DashboardData:
+    def __init__(self, source, window_minutes=360, ttl_seconds=15, lag_seconds=10, recent_rows=200,
+                 clock=lambda: datetime.now(timezone.utc)):
+        self.source = source
+        self.window = timedelta(minutes=window_minutes)
+        self.ttl = ttl_seconds
+        self.lag = timedelta(seconds=lag_seconds)
+        self.recent_rows = recent_rows
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.watermark = None
+        self.refreshed_at = None
+        self.minutes = pd.DataFrame(columns=["minute", "risk_band", "score_bin", "n", "score_sum"])
+        self.tenants = pd.DataFrame(columns=["minute", "tenant_id", "risk_band", "n"])
+        self.recent = pd.DataFrame(columns=RECENT_COLUMNS)
+        self.stats = {"refreshes": 0, "cache_hits": 0, "last": None,
+                      "total_queries": 0, "total_bytes_processed": 0}
+
+    @staticmethod
+    def _fold(cube, increment, keys):
+        if increment.empty:
+            return cube
+        if cube.empty:
+            return increment.reset_index(drop=True)
+        # Only the boundary minute can appear in both; sum it, keep the rest as is
+        return pd.concat([cube, increment], ignore_index=True).groupby(keys, as_index=False).sum()
+
+    def refresh(self, force=False):
+        """Fetches rows newer than the watermark unless the last refresh is younger than the TTL."""
+        with self.lock:
+            now = self.clock()
+            if not force and self.refreshed_at and (now - self.refreshed_at).total_seconds() < self.ttl:
+                self.stats["cache_hits"] += 1
+                return False
+
+            until = now - self.lag
+            since = self.watermark or until - self.window
+            t0 = time.perf_counter()
+            frames, cost = self.source.fetch(since, until, self.recent_rows)
+            for name, column in (("minutes", "minute"), ("tenants", "minute"), ("recent", "timestamp")):
+                frames[name][column] = pd.to_datetime(frames[name][column], utc=True)
+
+            self.minutes = self._fold(self.minutes, frames["minutes"], ["minute", "risk_band", "score_bin"])
+            self.tenants = self._fold(self.tenants, frames["tenants"], ["minute", "tenant_id", "risk_band"])
+            if not frames["recent"].empty:
+                self.recent = (frames["recent"] if self.recent.empty
+                               else pd.concat([frames["recent"], self.recent], ignore_index=True)).head(self.recent_rows)
+
+            # Age out minutes that left the window
+            cutoff = pd.Timestamp(until - self.window).floor("min")
+            self.minutes = self.minutes[self.minutes["minute"] >= cutoff]
+            self.tenants = self.tenants[self.tenants["minute"] >= cutoff]
+
+            self.watermark = until
+            self.refreshed_at = now
+            cost.update(seconds=time.perf_counter() - t0, since=since, until=until)
+            self.stats["refreshes"] += 1
+            self.stats["last"] = cost
+            self.stats["total_queries"] += cost["queries"]
+            self.stats["total_bytes_processed"] += cost["bytes_processed"]
+            return True
+
+    # --- views (all served from memory) ---
+    def summary(self):
+        n = int(self.minutes["n"].sum())
+        high = int(self.minutes.loc[self.minutes["risk_band"] == "HIGH", "n"].sum())
+        return {
+            "total": n,
+            "avg_score": float(self.minutes["score_sum"].sum() / n) if n else None,
+            "high_risk": high,
+            "model_version": self.recent["model_version"].iloc[0] if not self.recent.empty else "N/A",
+        }
+
+    def histogram(self):
+        """Counts per (score bin, band) with bin_start for plotting."""
+        hist = self.minutes.groupby(["score_bin", "risk_band"], as_index=False)["n"].sum()
+        hist["bin_start"] = hist["score_bin"].astype(float) / SCORE_BINS
+        return hist
+
+    def timeseries(self):
+        """Per-minute prediction count and average score."""
+        ts = self.minutes.groupby("minute", as_index=False)[["n", "score_sum"]].sum()
+        ts["avg_score"] = ts["score_sum"] / ts["n"]
+        return ts[["minute", "n", "avg_score"]]
+
+    def tenant_bands(self):
+        """Band counts per tenant over the window."""
+        return (self.tenants.groupby(["tenant_id", "risk_band"])["n"].sum()
+                .unstack(fill_value=0).reindex(columns=BANDS, fill_value=0))
+
+
+# --- CLI ---
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mock", action="store_true", help="Measure refresh cost against the mock source")
+    parser.add_argument("--estimate", action="store_true", help="Dry-run bytes for the BigQuery table")
+    parser.add_argument("--table", default="fraudshield-v3-dev-5320.fraudshield.predictions")
+    parser.add_argument("--window-minutes", type=int, default=360)
+    parser.add_argument("--events-per-sec", type=float, default=25.0)
+    args = parser.parse_args()
+
+    if args.estimate:
+        source = BigQuerySource(args.table, args.table.split(".")[0])
+        until = datetime.now(timezone.utc)
+        print(f"Legacy per-rerun query:      {source.estimate_legacy() / 1e6:10.1f} MB")
+        for label, since in (("Initial load", until - timedelta(minutes=args.window_minutes)),
+                             ("Incremental (15s)", until - timedelta(seconds=15))):
+            per_query = source.estimate(since, until, 200)
+            print(f"{label + ':':<28} {sum(per_query.values()) / 1e6:10.1f} MB  "
+                  + ", ".join(f"{k}={v / 1e6:.1f}" for k, v in per_query.items()))
+        return
+
+    # Simulated clock so a run covers many refreshes without waiting on wall time
+    clock_now = [datetime.now(timezone.utc)]
+    data = DashboardData(MockSource(args.events_per_sec, seed=0), window_minutes=args.window_minutes,
+                         clock=lambda: clock_now[0])
+    print(f"Mock source at {args.events_per_sec:.0f} predictions/s "
+          f"({args.events_per_sec * 86400 / 1e6:.1f}M/day), window {args.window_minutes} min")
+    for step in range(12):
+        t0 = time.perf_counter()
+        fetched = data.refresh()
+        views = (data.summary(), data.histogram(), data.timeseries(), data.tenant_bands())
+        rerun_ms = (time.perf_counter() - t0) * 1000
+        last = data.stats["last"]
+        print(f"  rerun {step:2d}: {'refresh' if fetched else 'cached '}  rows fetched={last['rows']:6,}  "
+              f"rerun={rerun_ms:7.1f} ms  cube rows={len(data.minutes) + len(data.tenants):,}  "
+              f"predictions in window={views[0]['total']:,}")
+        clock_now[0] += timedelta(seconds=5)
+
+
+if __name__ == "__main__":
+    main()
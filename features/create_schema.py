@@ -25,18 +25,20 @@ def create_schema():
         print(f"Entity creation skipped (might exist): {e}")
         cards_entity = fs.get_entity_type("cards")
 
-    # 2. Create Features: 'txn_count_10m', 'txn_sum_10m'
-    # We use batch_create for efficiency
-    try:
-        cards_entity.batch_create_features(
-            feature_configs={
-                "txn_count_10m": {"value_type": "INT64", "description": "10 min sliding count"},
-                "txn_sum_10m":   {"value_type": "DOUBLE", "description": "10 min sliding sum"},
-            }
-        ).wait()
-        print("Features created successfully.")
-    except Exception as e:
-        print(f"Feature creation skipped: {e}")
+    # 2. Create Features: velocity values plus the freshness-tracing timestamps
+    # written by streaming/pipeline.py. One at a time, so re-runs add new ones.
+    feature_configs = {
+        "txn_count_10m": {"value_type": "INT64", "description": "10 min sliding count"},
+        "txn_sum_10m":   {"value_type": "DOUBLE", "description": "10 min sliding sum"},
+        "last_event_us": {"value_type": "INT64", "description": "Event time of the newest transaction in the window (epoch us)"},
+        "written_at_us": {"value_type": "INT64", "description": "Wall clock when the pipeline wrote the value (epoch us)"},
+    }
+    for feature_id, config in feature_configs.items():
+        try:
+            cards_entity.create_feature(feature_id=feature_id, **config)
+            print(f"Feature '{feature_id}' created.")
+        except Exception as e:
+            print(f"Feature '{feature_id}' creation skipped (might exist): {e}")
 
 if __name__ == "__main__":
     create_schema()
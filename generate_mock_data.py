@@ -1,68 +1,208 @@
-import pandas as pd
+import argparse
+import os
+import time
+from datetime import datetime
+
 import numpy as np
-import random
-from datetime import datetime, timedelta
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
 # Settings
 NUM_TRANSACTIONS = 5000
 NUM_CUSTOMERS = 100
 NUM_TERMINALS = 50
+NUM_TENANTS = 5
+CARDS_PER_CUSTOMER = 2
+NUM_DAYS = 90
 START_DATE = datetime(2024, 1, 1)
 
-def generate_data():
-    print(f"Generating {NUM_TRANSACTIONS} transactions...")
-    
-    # IDs
-    customer_ids = [f"CUST_{i:04d}" for i in range(NUM_CUSTOMERS)]
-    terminal_ids = [f"TERM_{i:04d}" for i in range(NUM_TERMINALS)]
-    
-    data = []
-    
-    for _ in range(NUM_TRANSACTIONS):
+CHUNK_SIZE = 1_000_000
+SEED = 42
+OUTPUT_DIR = "data/transactions"
+
+# Fraud scenarios
+SPIKE_AMOUNT = 800
+SPIKE_FRAUD_RATE = 0.8
+LATE_NIGHT_HOURS = (2, 5)
+LATE_NIGHT_FRAUD_RATE = 0.3
+BUSTED_TERMINAL = 13            # TERM_0013
+BUSTED_TERMINAL_FRAUD_RATE = 0.5
+VELOCITY_ATTACK_RATE = 0.002    # Share of rows that belong to velocity-attack bursts
+VELOCITY_BURST_SIZE = 20        # Transactions per burst
+VELOCITY_BURST_SECONDS = 600    # Bursts land inside one 10-minute window
+
+SCHEMA = pa.schema([
+    ("tx_id", pa.string()),
+    ("tenant_id", pa.dictionary(pa.int32(), pa.string())),
+    ("customer_id", pa.dictionary(pa.int32(), pa.string())),
+    ("card_id", pa.dictionary(pa.int32(), pa.string())),
+    ("terminal_id", pa.dictionary(pa.int32(), pa.string())),
+    ("tx_ts", pa.timestamp("us")),
+    ("amount", pa.float64()),
+    ("is_fraud", pa.int8()),
+])
+
+
+class ChunkGenerator:
+    """
+    Generates transactions in fixed-size, column-oriented NumPy chunks.
+    Chunk i always uses the i-th child of the root SeedSequence, so output is
+    reproducible for a given (seed, num_rows, chunk_size).
+    """
+
+    def __init__(self, num_rows, chunk_size=CHUNK_SIZE, seed=SEED,
+                 num_customers=NUM_CUSTOMERS, num_terminals=NUM_TERMINALS,
+                 num_tenants=NUM_TENANTS, num_days=NUM_DAYS):
+        self.num_rows = num_rows
+        self.chunk_size = chunk_size
+        self.num_chunks = max(1, -(-num_rows // chunk_size))
+        self.seeds = np.random.SeedSequence(seed).spawn(self.num_chunks)
+        self.num_customers = num_customers
+        self.num_cards = num_customers * CARDS_PER_CUSTOMER
+        self.num_terminals = num_terminals
+        self.num_tenants = num_tenants
+        self.num_days = num_days
+        self.start_us = int(np.datetime64(START_DATE, "us").astype(np.int64))
+
+        # Dictionaries are built once; each chunk only carries int32 indices
+        self.tenant_dict = pa.array([f"tenant_{chr(ord('A') + i)}" if i < 26 else f"tenant_{i}"
+                                     for i in range(num_tenants)])
+        self.customer_dict = pa.array([f"CUST_{i:04d}" for i in range(num_customers)])
+        self.card_dict = pa.array([f"CARD_{i:04d}" for i in range(self.num_cards)])
+        self.terminal_dict = pa.array([f"TERM_{i:04d}" for i in range(num_terminals)])
+        self.date_dict = pa.array([str(np.datetime64(START_DATE, "D") + d) for d in range(num_days)])
+
+    def chunk_days(self, idx):
+        # Chunks walk forward through time so each one touches few date partitions
+        lo = idx * self.num_days // self.num_chunks
+        hi = (idx + 1) * self.num_days // self.num_chunks
+        return lo, max(hi, lo + 1)
+
+    def generate_chunk(self, idx):
+        rng = np.random.default_rng(self.seeds[idx])
+        offset = idx * self.chunk_size
+        n = min(self.chunk_size, self.num_rows - offset)
+
         # 1. Basic Transaction Info
-        tx_id = f"TXN_{random.randint(10000000, 99999999)}"
-        customer_id = random.choice(customer_ids)
-        terminal_id = random.choice(terminal_ids)
-        
-        # Time distribution (more tx during day)
-        days_offset = random.randint(0, 90)
-        hour = int(np.random.normal(14, 4)) % 24 # Peak at 2pm
-        tx_ts = START_DATE + timedelta(days=days_offset, hours=hour, minutes=random.randint(0,59))
-        
+        customer = rng.integers(0, self.num_customers, n, dtype=np.int32)
+        card = customer * CARDS_PER_CUSTOMER + rng.integers(0, CARDS_PER_CUSTOMER, n, dtype=np.int32)
+        tenant = customer % self.num_tenants
+        terminal = rng.integers(0, self.num_terminals, n, dtype=np.int32)
+
+        # Time distribution (more tx during day, peak at 2pm)
+        lo, hi = self.chunk_days(idx)
+        day = rng.integers(lo, hi, n)
+        hour = np.rint(rng.normal(14, 4, n)).astype(np.int64) % 24
+        second = rng.integers(0, 3600, n)
+        ts_us = self.start_us + (day * 86400 + hour * 3600 + second) * 1_000_000
+
         # Amounts (Log-normal distribution for realistic spend)
-        amount = round(np.random.lognormal(3.5, 1.0), 2)
-        
+        amount = np.round(rng.lognormal(3.5, 1.0, n), 2)
+
         # 2. Fraud Logic (Injecting signals for the model to find)
-        is_fraud = 0
-        
+        u = rng.random((3, n))
         # SCENARIO A: High Amount Spike
-        if amount > 800 and random.random() < 0.8:
-            is_fraud = 1
-            
+        is_fraud = (amount > SPIKE_AMOUNT) & (u[0] < SPIKE_FRAUD_RATE)
         # SCENARIO B: Late Night Activity (2AM - 5AM)
-        if 2 <= tx_ts.hour <= 5 and random.random() < 0.3:
-            is_fraud = 1
-            
+        is_fraud |= (hour >= LATE_NIGHT_HOURS[0]) & (hour <= LATE_NIGHT_HOURS[1]) & (u[1] < LATE_NIGHT_FRAUD_RATE)
         # SCENARIO C: The "Busted Terminal" (Specific terminal has high fraud)
-        if terminal_id == "TERM_0013" and random.random() < 0.5:
-            is_fraud = 1
-
-        data.append({
-            "tx_id": tx_id,
-            "customer_id": customer_id,
-            "terminal_id": terminal_id,
-            "tx_ts": tx_ts,
-            "amount": amount,
-            "is_fraud": is_fraud
-        })
-
-    df = pd.DataFrame(data)
-    
-    # Save to CSV
-    output_path = "data/sample_transactions.csv"
-    df.to_csv(output_path, index=False)
-    print(f"? Data saved to {output_path}")
-    print(df["is_fraud"].value_counts())
+        is_fraud |= (terminal == BUSTED_TERMINAL) & (u[2] < BUSTED_TERMINAL_FRAUD_RATE)
+
+        # SCENARIO D: Velocity Attack (bursts of card-testing on one card in 10 minutes)
+        n_bursts = int(n * VELOCITY_ATTACK_RATE) // VELOCITY_BURST_SIZE
+        if n_bursts:
+            rows = rng.choice(n, n_bursts * VELOCITY_BURST_SIZE, replace=False)
+            burst = np.repeat(np.arange(n_bursts), VELOCITY_BURST_SIZE)
+            burst_card = rng.integers(0, self.num_cards, n_bursts, dtype=np.int32)
+            burst_start = ts_us[rows[::VELOCITY_BURST_SIZE]]
+            card[rows] = burst_card[burst]
+            customer[rows] = burst_card[burst] // CARDS_PER_CUSTOMER
+            tenant[rows] = customer[rows] % self.num_tenants
+            ts_us[rows] = burst_start[burst] + rng.integers(0, VELOCITY_BURST_SECONDS * 1_000_000, rows.size)
+            amount[rows] = np.round(rng.uniform(1, 50, rows.size), 2)
+            is_fraud[rows] = True
+
+        # Emit in event-time order so partitions are contiguous slices of the chunk
+        order = np.argsort(ts_us, kind="stable")
+        tx_id = pc.binary_join_element_wise(
+            "TXN_", pa.array(np.arange(offset, offset + n, dtype=np.int64)).cast(pa.string()), ""
+        )
+
+        return pa.Table.from_arrays([
+            tx_id,
+            pa.DictionaryArray.from_arrays(pa.array(tenant[order]), self.tenant_dict),
+            pa.DictionaryArray.from_arrays(pa.array(customer[order]), self.customer_dict),
+            pa.DictionaryArray.from_arrays(pa.array(card[order]), self.card_dict),
+            pa.DictionaryArray.from_arrays(pa.array(terminal[order]), self.terminal_dict),
+            pa.array(ts_us[order], type=pa.timestamp("us")),
+            pa.array(amount[order]),
+            pa.array(is_fraud[order].astype(np.int8)),
+        ], schema=SCHEMA)
+
+    def partitions(self, table):
+        """Splits a time-ordered chunk into (tx_date, slice) pairs."""
+        ts_us = table["tx_ts"].to_numpy().astype(np.int64)
+        day = np.clip((ts_us - self.start_us) // (86400 * 1_000_000), 0, self.num_days - 1)
+        bounds = np.flatnonzero(np.diff(day)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(day)]))
+        for lo, hi in zip(starts, ends):
+            yield self.date_dict[int(day[lo])].as_py(), table.slice(lo, hi - lo)
+
+    def __iter__(self):
+        for idx in range(self.num_chunks):
+            yield idx, self.generate_chunk(idx)
+
+
+def generate_data(num_rows=NUM_TRANSACTIONS, output_dir=OUTPUT_DIR, chunk_size=CHUNK_SIZE,
+                  seed=SEED, num_customers=NUM_CUSTOMERS, csv_path=None):
+    print(f"Generating {num_rows:,} transactions in chunks of {chunk_size:,} (seed={seed})...")
+    gen = ChunkGenerator(num_rows, chunk_size=chunk_size, seed=seed, num_customers=num_customers)
+
+    csv_writer = None
+    total_rows = 0
+    total_fraud = 0
+    start = time.perf_counter()
+
+    for idx, table in gen:
+        t0 = time.perf_counter()
+        # Hive-partitioned by tx_date; one file per (chunk, day) so re-runs overwrite in place
+        for tx_date, part in gen.partitions(table):
+            part_dir = os.path.join(output_dir, f"tx_date={tx_date}")
+            os.makedirs(part_dir, exist_ok=True)
+            pq.write_table(part, os.path.join(part_dir, f"chunk-{idx:05d}.parquet"))
+        if csv_path:
+            if csv_writer is None:
+                os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+                csv_writer = pacsv.CSVWriter(csv_path, table.schema)
+            csv_writer.write_table(table)
+
+        total_rows += table.num_rows
+        total_fraud += pc.sum(table["is_fraud"]).as_py()
+        elapsed = time.perf_counter() - start
+        print(f"Chunk {idx + 1}/{gen.num_chunks}: {table.num_rows:,} rows "
+              f"(write {time.perf_counter() - t0:.2f}s) | {total_rows / elapsed:,.0f} rows/sec")
+
+    if csv_writer is not None:
+        csv_writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"? Data saved to {output_dir}" + (f" and {csv_path}" if csv_path else ""))
+    print(f"Rows: {total_rows:,} | Fraud: {total_fraud:,} ({total_fraud / max(total_rows, 1):.2%}) | "
+          f"{elapsed:.1f}s | {total_rows / elapsed:,.0f} rows/sec")
+    return total_rows / elapsed
+
 
 if __name__ == "__main__":
-    generate_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Vectorized synthetic transaction generator")
+    parser.add_argument("--rows", type=int, default=NUM_TRANSACTIONS)
+    parser.add_argument("--chunk_size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--customers", type=int, default=NUM_CUSTOMERS)
+    parser.add_argument("--output_dir", default=OUTPUT_DIR)
+    parser.add_argument("--csv", default=None, help="Optionally also write a single CSV (small runs)")
+    args = parser.parse_args()
+
+    generate_data(args.rows, args.output_dir, args.chunk_size, args.seed, args.customers, args.csv)
@@ -73,6 +73,60 @@ resource "google_bigquery_dataset" "fraudshield" {
   depends_on                 = [google_project_service.enabled_apis]
 }
 
+# Prediction log: hour-partitioned so the dashboard's incremental refreshes and the
+# monitoring job's watermark scans only touch the newest partitions
+resource "google_bigquery_table" "predictions" {
+  dataset_id          = google_bigquery_dataset.fraudshield.dataset_id
+  table_id            = "predictions"
+  deletion_protection = false
+
+  time_partitioning {
+    type          = "HOUR"
+    field         = "timestamp"
+    expiration_ms = 7776000000 # 90 days (hourly partitions are capped at 4000 per table)
+  }
+  clustering = ["tenant_id"]
+
+  schema = jsonencode([
+    { name = "timestamp",      type = "TIMESTAMP", mode = "REQUIRED" },
+    { name = "transaction_id", type = "STRING",    mode = "REQUIRED" },
+    { name = "tenant_id",      type = "STRING",    mode = "NULLABLE" },
+    { name = "card_id",        type = "STRING",    mode = "NULLABLE" },
+    { name = "amount",         type = "FLOAT64",   mode = "NULLABLE" },
+    { name = "txn_count_10m",  type = "INT64",     mode = "NULLABLE" },
+    { name = "txn_sum_10m",    type = "FLOAT64",   mode = "NULLABLE" },
+    { name = "score",          type = "FLOAT64",   mode = "NULLABLE" },
+    { name = "risk_band",      type = "STRING",    mode = "NULLABLE" },
+    { name = "xgb_score",      type = "FLOAT64",   mode = "NULLABLE" },
+    { name = "iso_score",      type = "FLOAT64",   mode = "NULLABLE" },
+    { name = "model_version",  type = "STRING",    mode = "NULLABLE" }
+  ])
+}
+
+# Point-in-time 10m velocity features per transaction (training join on tx_id);
+# loaded by features/velocity_backfill.py --bq_table
+resource "google_bigquery_table" "velocity_features_10m" {
+  dataset_id          = google_bigquery_dataset.fraudshield.dataset_id
+  table_id            = "velocity_features_10m"
+  deletion_protection = false
+
+  time_partitioning {
+    type  = "DAY"
+    field = "tx_ts"
+  }
+  clustering = ["tx_id"]
+
+  schema = jsonencode([
+    { name = "tx_id",         type = "STRING",    mode = "REQUIRED" },
+    { name = "tenant_id",     type = "STRING",    mode = "NULLABLE" },
+    { name = "card_id",       type = "STRING",    mode = "NULLABLE" },
+    { name = "tx_ts",         type = "TIMESTAMP", mode = "REQUIRED" },
+    { name = "txn_count_10m", type = "INT64",     mode = "NULLABLE" },
+    { name = "txn_sum_10m",   type = "FLOAT64",   mode = "NULLABLE" },
+    { name = "feature_time",  type = "TIMESTAMP", mode = "NULLABLE" }
+  ])
+}
+
 resource "google_vertex_ai_featurestore" "featurestore" {
   name     = "fraudshield_feature_store_${var.env}"
   region   = var.region
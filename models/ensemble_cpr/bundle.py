@@ -0,0 +1,200 @@
+"""
+FraudShield model bundle: one file holding both hybrid models plus the
+manifest that describes how to use them.
+
+Layout (all offsets are absolute, sections are page-aligned so the file can be
+memory-mapped and each section handed to its loader without re-reading):
+
+    [0:8]    MAGIC  b"FSBNDL01"
+    [8:16]   manifest length (uint64, little-endian)
+    [16:..]  manifest (UTF-8 JSON)
+    ...      section "xgb"  (XGBoost UBJSON model)
+    ...      section "iso"  (joblib-pickled IsolationForest)
+
+The manifest carries the model version, feature order, ensemble weights,
+band thresholds, a SHA-256 per section, and (optionally) baseline histograms
+of the features and scores on training data. The manifest sits ahead of the
+payloads, so readers that only need it (e.g. the API's drift monitor) can
+fetch it with a ranged read instead of downloading the models.
+"""
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+import tempfile
+from datetime import datetime, timezone
+
+MAGIC = b"FSBNDL01"
+FORMAT_VERSION = 1
+BUNDLE_FILENAME = "model_bundle.fsb"
+ALIGNMENT = 4096
+
+FEATURE_ORDER = ["amount", "txn_count_10m", "txn_sum_10m"]
+ENSEMBLE_WEIGHTS = {"xgb": 0.8, "iso": 0.2}
+BAND_THRESHOLDS = {"HIGH": 0.7, "MEDIUM": 0.3}
+
+_HEADER = struct.Struct("<8sQ")
+
+SCORE_BASELINE_BINS = 20        # Uniform bins over [0, 1] for score/xgb/iso
+FEATURE_BASELINE_BINS = 10      # Training-data deciles for the input features
+
+
+class BundleError(ValueError):
+    """Raised when a bundle is malformed, corrupted, or incompatible."""
+
+
+def _align(n):
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def serialize_models(xgb_model, iso_model):
+    """Returns the raw section payloads for an XGBoost model/Booster and an IsolationForest."""
+    import joblib
+
+    booster = xgb_model.get_booster() if hasattr(xgb_model, "get_booster") else xgb_model
+    iso_buf = io.BytesIO()
+    joblib.dump(iso_model, iso_buf)
+    return {
+        "xgb": bytes(booster.save_raw(raw_format="ubj")),
+        "iso": iso_buf.getvalue(),
+    }
+
+
+def compute_baseline(columns, bounded=("score", "xgb", "iso")):
+    """
+    Baseline histograms for drift monitoring: {name: {"edges": [...], "counts": [...]}}.
+    edges are the interior bin edges; a value v falls in bin bisect_right(edges, v),
+    so there are len(edges) + 1 bins and out-of-range values are still counted.
+    """
+    import numpy as np
+
+    baseline = {}
+    for name, values in columns.items():
+        values = np.asarray(values, dtype=np.float64)
+        if name in bounded:
+            edges = np.linspace(0, 1, SCORE_BASELINE_BINS + 1)[1:-1]
+        else:
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, FEATURE_BASELINE_BINS + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+        baseline[name] = {"edges": [float(e) for e in edges], "counts": [int(c) for c in counts]}
+    return baseline
+
+
+def build_bundle(sections, model_version, feature_order=FEATURE_ORDER,
+                 ensemble_weights=ENSEMBLE_WEIGHTS, band_thresholds=BAND_THRESHOLDS, extra=None):
+    """Lays out sections behind a manifest and returns the bundle bytes."""
+    formats = {"xgb": "ubj", "iso": "joblib"}
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "model_version": model_version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "feature_order": list(feature_order),
+        "ensemble_weights": dict(ensemble_weights),
+        "band_thresholds": dict(band_thresholds),
+        "sections": {},
+    }
+    if extra:
+        manifest.update(extra)
+
+    # Offsets depend on the manifest size, which depends on the offsets' digits;
+    # reserve generously and pad.
+    reserve = _align(_HEADER.size + len(json.dumps(manifest, sort_keys=True)) + 512 * (len(sections) + 1))
+    offset = reserve
+    for name, payload in sections.items():
+        manifest["sections"][name] = {
+            "offset": offset,
+            "length": len(payload),
+            "sha256": hashlib.sha256(payload).hexdigest(),
+            "format": formats.get(name, "raw"),
+        }
+        offset = _align(offset + len(payload))
+
+    manifest_bytes = json.dumps(manifest, sort_keys=True).encode("utf-8")
+    if _HEADER.size + len(manifest_bytes) > reserve:
+        raise BundleError("Manifest does not fit in the reserved header space")
+
+    out = bytearray(offset)
+    out[:_HEADER.size] = _HEADER.pack(MAGIC, len(manifest_bytes))
+    out[_HEADER.size:_HEADER.size + len(manifest_bytes)] = manifest_bytes
+    for name, payload in sections.items():
+        start = manifest["sections"][name]["offset"]
+        out[start:start + len(payload)] = payload
+    return bytes(out)
+
+
+def write_bundle(path, sections, model_version, **kwargs):
+    """Writes the bundle to a temp file and renames it into place (atomic on POSIX)."""
+    data = build_bundle(sections, model_version, **kwargs)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+def parse_bundle(buf, verify=True):
+    """
+    Parses a bundle from a bytes-like object (bytes or mmap).
+    Returns (manifest, {section_name: memoryview}).
+    """
+    view = memoryview(buf)
+    if len(view) < _HEADER.size:
+        raise BundleError("File too small to be a model bundle")
+    magic, manifest_len = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise BundleError(f"Bad magic {magic!r}; not a FraudShield model bundle")
+    try:
+        manifest = json.loads(bytes(view[_HEADER.size:_HEADER.size + manifest_len]))
+    except ValueError as e:
+        raise BundleError(f"Unreadable manifest: {e}")
+
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise BundleError(f"Unsupported bundle format_version {manifest.get('format_version')}")
+    for key in ("model_version", "feature_order", "ensemble_weights", "band_thresholds", "sections"):
+        if key not in manifest:
+            raise BundleError(f"Manifest missing '{key}'")
+
+    sections = {}
+    for name, meta in manifest["sections"].items():
+        start, end = meta["offset"], meta["offset"] + meta["length"]
+        if end > len(view):
+            raise BundleError(f"Section '{name}' is truncated")
+        payload = view[start:end]
+        if verify and hashlib.sha256(payload).hexdigest() != meta["sha256"]:
+            raise BundleError(f"Checksum mismatch for section '{name}'")
+        sections[name] = payload
+    return manifest, sections
+
+
+def read_bundle(path, use_mmap=False, verify=True):
+    """
+    Reads a bundle with one sequential read (or a memory map).
+    Returns (manifest, sections); with use_mmap the sections are views into
+    the map, which stays open for as long as they are referenced.
+    """
+    with open(path, "rb") as f:
+        if use_mmap:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = f.read()
+    return parse_bundle(buf, verify=verify)
+
+
+def load_models(sections):
+    """Deserializes (xgb_model, iso_model) from parsed bundle sections."""
+    import joblib
+    import xgboost as xgb
+
+    xgb_model = xgb.XGBClassifier()
+    xgb_model.load_model(bytearray(sections["xgb"]))
+    iso_model = joblib.load(io.BytesIO(sections["iso"]))
+    return xgb_model, iso_model
@@ -0,0 +1,25 @@
+import numpy as np
+
+
+def score_components(xgb_model, iso_model, inputs, weights, skip_iso=False):
+    """
+    Returns (prob_xgb, prob_iso, final_scores) for a 2-D feature matrix.
+    With skip_iso (degraded mode under load) prob_iso is None and the score is XGBoost alone.
+    """
+    # Thread A: XGBoost Probability (0 to 1)
+    prob_xgb = xgb_model.predict_proba(inputs)[:, 1]
+    if skip_iso:
+        return prob_xgb, None, prob_xgb
+
+    # Thread B: Isolation Forest
+    # decision_function returns negative for anomalies, positive for normal.
+    # We invert it so higher = more anomalous.
+    # Normalizing roughly to 0-1 for the ensemble (simplified logic)
+    raw_iso = iso_model.decision_function(inputs)
+    # Flip: -1 (anomaly) becomes 1, 1 (normal) becomes 0
+    prob_iso = 1 - ((raw_iso + 1) / 2)
+    prob_iso = np.clip(prob_iso, 0, 1)
+
+    # Ensemble Logic
+    final_scores = (weights["xgb"] * prob_xgb) + (weights["iso"] * prob_iso)
+    return prob_xgb, prob_iso, final_scores
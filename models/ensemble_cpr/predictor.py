@@ -1,68 +1,145 @@
 import os
-import joblib
 import numpy as np
-import xgboost as xgb
 from google.cloud.aiplatform.prediction.predictor import Predictor
 from google.cloud.aiplatform.utils import prediction_utils
 
+from bundle import BUNDLE_FILENAME, BundleError, load_models, read_bundle
+from ensemble import score_components
+from tenant_models import Model, TenantModelCache, discover_tenant_bundles
+
+# Per-tenant bundles (<artifacts>/tenants/<tenant_id>/model_bundle.fsb) kept in memory at once
+TENANT_MODEL_CACHE_MB = int(os.getenv("TENANT_MODEL_CACHE_MB", "512"))
+TENANT_PREFETCH_SECONDS = float(os.getenv("TENANT_PREFETCH_SECONDS", "30"))
+# A tenant bundle that failed to load (or can't fit the cache) is retried after this long
+TENANT_RETRY_SECONDS = float(os.getenv("TENANT_RETRY_SECONDS", "300"))
+
 class CprPredictor(Predictor):
     def __init__(self):
         self.xgb_model = None
         self.iso_model = None
+        self.manifest = None
+        self.global_model = None
+        self.tenant_models = None
 
     def load(self, artifacts_uri: str):
-        """Loads both models from the GCS artifact directory."""
+        """Loads the hybrid model bundle (both models + manifest) from the artifact directory."""
         print(f"Loading artifacts from {artifacts_uri}")
-        
-        # 1. Load XGBoost
-        # Vertex AI downloads artifacts to a local path (artifacts_uri)
-        xgb_path = os.path.join(artifacts_uri, "model.bst")
-        self.xgb_model = xgb.XGBClassifier()
-        self.xgb_model.load_model(xgb_path)
-        
-        # 2. Load Isolation Forest
-        iso_path = os.path.join(artifacts_uri, "isolation_forest.joblib")
-        self.iso_model = joblib.load(iso_path)
-        
-        print("Hybrid models loaded successfully.")
+
+        # Vertex AI normally hands us a local path; fetch it ourselves if not
+        if artifacts_uri.startswith("gs://"):
+            prediction_utils.download_model_artifacts(artifacts_uri)
+            artifacts_uri = "."
+
+        # One sequential read of one file; checksums are verified before unpickling
+        bundle_path = os.path.join(artifacts_uri, BUNDLE_FILENAME)
+        self.manifest, sections = read_bundle(bundle_path)
+        self.xgb_model, self.iso_model = load_models(sections)
+
+        self.feature_order = self.manifest["feature_order"]
+        self.weights = self.manifest["ensemble_weights"]
+        self.thresholds = self.manifest["band_thresholds"]
+
+        self.global_model = Model(None, self.manifest, self.xgb_model, self.iso_model)
+
+        print(f"Hybrid models loaded successfully (version {self.manifest['model_version']}, "
+              f"features {self.feature_order}).")
+
+        # Tenant bundles are only discovered here; each is loaded on first use (or prefetched)
+        tenant_bundles = discover_tenant_bundles(artifacts_uri)
+        self.tenant_models = TenantModelCache(
+            tenant_bundles, self.feature_order,
+            max_bytes=TENANT_MODEL_CACHE_MB * 2 ** 20, prefetch_interval=TENANT_PREFETCH_SECONDS,
+            retry_interval=TENANT_RETRY_SECONDS,
+        )
+        print(f"{len(tenant_bundles)} tenant model bundles available "
+              f"(cache {TENANT_MODEL_CACHE_MB} MB); other tenants use the global model.")
+
+    def _to_matrix(self, instances):
+        """
+        Accepts feature vectors (lists in manifest feature order) or dicts keyed by
+        feature name, and refuses anything that does not match the manifest.
+        """
+        if instances and isinstance(instances[0], dict):
+            for i, inst in enumerate(instances):
+                if not isinstance(inst, dict):
+                    raise BundleError(f"Instance {i} is not a dict like instance 0")
+                missing = [f for f in self.feature_order if f not in inst]
+                if missing:
+                    raise BundleError(f"Instance {i} missing features {missing}; expected {self.feature_order}")
+            instances = [[inst[f] for f in self.feature_order] for inst in instances]
+
+        inputs = np.asarray(instances, dtype=np.float64)
+        if inputs.ndim != 2 or inputs.shape[1] != len(self.feature_order):
+            raise BundleError(
+                f"Expected feature vectors of length {len(self.feature_order)} "
+                f"({', '.join(self.feature_order)}), got shape {inputs.shape}"
+            )
+        return inputs
+
+    def _tenant_ids(self, instances, parameters):
+        """Per-instance tenant: a "tenant_id" key on dict instances, or parameters["tenant_ids"]."""
+        if instances and isinstance(instances[0], dict):
+            return [inst.get("tenant_id") for inst in instances]
+        tenant_ids = parameters.get("tenant_ids")
+        if tenant_ids is None:
+            return [None] * len(instances)
+        if len(tenant_ids) != len(instances):
+            raise BundleError(f"Got {len(tenant_ids)} tenant_ids for {len(instances)} instances")
+        return tenant_ids
+
+    def _route(self, tenant_ids):
+        """Groups instance indices by the model that scores them: [(model, [indices])]."""
+        by_tenant = {}
+        for i, tenant_id in enumerate(tenant_ids):
+            by_tenant.setdefault(tenant_id, []).append(i)
+        groups = {}
+        for tenant_id, indices in by_tenant.items():
+            model = None
+            if tenant_id is not None and self.tenant_models:
+                model = self.tenant_models.get(tenant_id, len(indices))
+            model = model or self.global_model
+            # Tenants without their own bundle share one call on the global model
+            groups.setdefault(id(model), (model, []))[1].extend(indices)
+        return list(groups.values())
 
     def predict(self, instances):
         """
-        Input: List of lists (feature vectors)
-        Output: Dictionary with score and risk band
+        Input: List of lists (feature vectors) or list of {feature: value} dicts,
+               or the request body {"instances": [...], "parameters": {...}} where
+               parameters may hold "skip_iso": true and "tenant_ids": [one per instance]
+        Output: Dictionary with score and risk band, scored by the tenant's own
+                bundle when it has one, else by the global bundle
         """
-        # Convert to numpy array
-        inputs = np.array(instances)
-        
-        # Thread A: XGBoost Probability (0 to 1)
-        prob_xgb = self.xgb_model.predict_proba(inputs)[:, 1]
-        
-        # Thread B: Isolation Forest
-        # decision_function returns negative for anomalies, positive for normal.
-        # We invert it so higher = more anomalous.
-        # Normalizing roughly to 0-1 for the ensemble (simplified logic)
-        raw_iso = self.iso_model.decision_function(inputs)
-        # Flip: -1 (anomaly) becomes 1, 1 (normal) becomes 0
-        prob_iso = 1 - ((raw_iso + 1) / 2) 
-        prob_iso = np.clip(prob_iso, 0, 1)
-
-        # Ensemble Logic
-        # 80% Supervised, 20% Unsupervised
-        final_scores = (0.8 * prob_xgb) + (0.2 * prob_iso)
-        
-        results = []
-        for score in final_scores:
-            band = "LOW"
-            if score > 0.7: band = "HIGH"
-            elif score > 0.3: band = "MEDIUM"
-            
-            results.append({
-                "score": float(score),
-                "risk_band": band,
-                "components": {
-                    "xgb": float(prob_xgb[0]),
-                    "iso": float(prob_iso[0])
+        parameters = {}
+        if isinstance(instances, dict):
+            parameters = instances.get("parameters") or {}
+            instances = instances["instances"]
+        inputs = self._to_matrix(instances)
+        skip_iso = bool(parameters.get("skip_iso"))
+        tenant_ids = self._tenant_ids(instances, parameters)
+
+        results = [None] * len(inputs)
+        # One vectorized call per model in the batch
+        for model, indices in self._route(tenant_ids):
+            # XGBoost + Isolation Forest, blended with the weights from that bundle's manifest
+            prob_xgb, prob_iso, final_scores = score_components(
+                model.xgb_model, model.iso_model, inputs[indices], model.weights, skip_iso=skip_iso)
+            if skip_iso:
+                prob_iso = [None] * len(final_scores)
+
+            for i, score, p_xgb, p_iso in zip(indices, final_scores, prob_xgb, prob_iso):
+                band = "LOW"
+                if score > model.thresholds["HIGH"]: band = "HIGH"
+                elif score > model.thresholds["MEDIUM"]: band = "MEDIUM"
+
+                results[i] = {
+                    "score": float(score),
+                    "risk_band": band,
+                    "model_version": model.version,
+                    "components": {
+                        "xgb": float(p_xgb),
+                        "iso": float(p_iso) if p_iso is not None else None
+                    }
                 }
-            })
-            
+
         return {"predictions": results}
@@ -0,0 +1,229 @@
+"""
+Per-tenant model routing for the CPR predictor.
+
+Tenants with their own models ship a bundle (same format as the global one)
+at <artifacts>/tenants/<tenant_id>/model_bundle.fsb; every other tenant is
+scored by the global bundle. Tenant bundles are only read from disk when a
+request needs them, into an LRU cache bounded by total bytes, so a replica
+holds the tenants it is actually serving rather than all of them.
+
+A background thread keeps decayed per-tenant request counts and prefetches
+the hottest uncached tenants into spare cache room (it never evicts to make
+room; misses on the request path do). Every cycle it logs the cache stats.
+
+Cache size is accounted as the serialized section bytes of each bundle, a
+close proxy for the in-memory size of the XGBoost booster and the forest.
+
+A bundle that fails to load, or is larger than the whole cache, is not
+retried for `retry_interval` seconds; its tenant is scored by the global
+model meanwhile (so a fixed or shrunk bundle is picked up without a restart).
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from bundle import BUNDLE_FILENAME, BundleError, load_models, read_bundle
+
+TENANTS_DIR = "tenants"
+
+
+class Model:
+    """One loaded bundle: both models plus what the predictor needs from the manifest."""
+
+    __slots__ = ("tenant_id", "manifest", "xgb_model", "iso_model", "weights", "thresholds", "version", "nbytes")
+
+    def __init__(self, tenant_id, manifest, xgb_model, iso_model):
+        self.tenant_id = tenant_id
+        self.manifest = manifest
+        self.xgb_model = xgb_model
+        self.iso_model = iso_model
+        self.weights = manifest["ensemble_weights"]
+        self.thresholds = manifest["band_thresholds"]
+        self.version = manifest["model_version"]
+        self.nbytes = sum(meta["length"] for meta in manifest["sections"].values())
+
+
+def load_model(path, tenant_id=None, feature_order=None):
+    manifest, sections = read_bundle(path)
+    if feature_order is not None and manifest["feature_order"] != feature_order:
+        raise BundleError(f"Bundle {path} expects features {manifest['feature_order']}, "
+                          f"the global model {feature_order}")
+    xgb_model, iso_model = load_models(sections)
+    return Model(tenant_id, manifest, xgb_model, iso_model)
+
+
+def discover_tenant_bundles(artifacts_dir):
+    """{tenant_id: bundle path} for every tenant directory holding a bundle."""
+    root = os.path.join(artifacts_dir, TENANTS_DIR)
+    if not os.path.isdir(root):
+        return {}
+    bundles = {}
+    for tenant_id in sorted(os.listdir(root)):
+        path = os.path.join(root, tenant_id, BUNDLE_FILENAME)
+        if os.path.isfile(path):
+            bundles[tenant_id] = path
+    return bundles
+
+
+class TenantModelCache:
+    def __init__(self, bundles, feature_order, max_bytes=512 * 2 ** 20, prefetch_interval=30.0,
+                 prefetch_top=8, heat_decay=0.5, retry_interval=300.0, loader=load_model):
+        self.bundles = bundles
+        self.feature_order = feature_order
+        self.max_bytes = max_bytes
+        self.prefetch_top = prefetch_top
+        self.heat_decay = heat_decay
+        self.retry_interval = retry_interval
+        self.loader = loader
+
+        self.lock = threading.Lock()
+        self.models = OrderedDict()          # tenant_id -> Model, least recently used first
+        self.used_bytes = 0
+        self.loading = {}                    # tenant_id -> Event, so concurrent misses load once
+        self.failed = {}                     # tenant_id -> when to retry a bundle that failed or didn't fit
+        self.heat = {}                       # tenant_id -> decayed instance count
+        self.counts = {"hits": 0, "misses": 0, "global_instances": 0, "tenant_instances": 0,
+                       "prefetched": 0, "evictions": 0, "load_errors": 0, "too_large": 0}
+        self.load_seconds = deque(maxlen=1024)
+
+        self.stop = threading.Event()
+        self.thread = None
+        if bundles and prefetch_interval:
+            self.thread = threading.Thread(target=self._prefetch_loop, args=(prefetch_interval,),
+                                           name="tenant-prefetch", daemon=True)
+            self.thread.start()
+
+    def get(self, tenant_id, instances=1):
+        """The tenant's model, loading it on a miss, or None to use the global model."""
+        with self.lock:
+            if tenant_id in self.failed and time.monotonic() >= self.failed[tenant_id]:
+                del self.failed[tenant_id]
+            if tenant_id not in self.bundles or tenant_id in self.failed:
+                self.counts["global_instances"] += instances
+                return None
+            self.heat[tenant_id] = self.heat.get(tenant_id, 0.0) + instances
+            model = self.models.get(tenant_id)
+            if model is not None:
+                self.models.move_to_end(tenant_id)
+                self.counts["hits"] += 1
+                self.counts["tenant_instances"] += instances
+                return model
+            self.counts["misses"] += 1
+        model = self._load(tenant_id)
+        with self.lock:
+            self.counts["tenant_instances" if model else "global_instances"] += instances
+        return model
+
+    def _load(self, tenant_id, prefetch=False):
+        with self.lock:
+            event = self.loading.get(tenant_id)
+            owner = event is None
+            if owner:
+                event = self.loading[tenant_id] = threading.Event()
+        if not owner:
+            # Someone else (a request or the prefetcher) is already loading it
+            event.wait()
+            with self.lock:
+                return self.models.get(tenant_id)
+
+        try:
+            t0 = time.perf_counter()
+            try:
+                model = self.loader(self.bundles[tenant_id], tenant_id, self.feature_order)
+            except Exception as e:
+                print(f"Failed to load model for tenant {tenant_id}, using the global model "
+                      f"(retry in {self.retry_interval:.0f}s): {e}")
+                with self.lock:
+                    self.failed[tenant_id] = time.monotonic() + self.retry_interval
+                    self.counts["load_errors"] += 1
+                return None
+            with self.lock:
+                self.load_seconds.append(time.perf_counter() - t0)
+                if prefetch:
+                    self.counts["prefetched"] += 1
+                if not self._insert(tenant_id, model):
+                    return None
+            return model
+        finally:
+            with self.lock:
+                del self.loading[tenant_id]
+            event.set()
+
+    def _insert(self, tenant_id, model):
+        # Caller holds the lock; False if the model can never fit
+        if model.nbytes > self.max_bytes:
+            # Don't reload it on every request: the global model serves the tenant until the retry
+            print(f"Model for tenant {tenant_id} ({model.nbytes:,} bytes) exceeds the cache "
+                  f"({self.max_bytes:,} bytes), using the global model (retry in {self.retry_interval:.0f}s)")
+            self.failed[tenant_id] = time.monotonic() + self.retry_interval
+            self.counts["too_large"] += 1
+            return False
+        while self.models and self.used_bytes + model.nbytes > self.max_bytes:
+            _, evicted = self.models.popitem(last=False)
+            self.used_bytes -= evicted.nbytes
+            self.counts["evictions"] += 1
+        self.models[tenant_id] = model
+        self.used_bytes += model.nbytes
+        return True
+
+    def prefetch(self):
+        """Loads the hottest uncached tenants that fit in the free cache room; returns how many."""
+        with self.lock:
+            hottest = sorted(self.heat, key=self.heat.get, reverse=True)[:self.prefetch_top]
+            candidates = [t for t in hottest
+                          if t not in self.models and t not in self.failed and t not in self.loading]
+            free = self.max_bytes - self.used_bytes
+            # Decay so "hottest" follows the recent traffic mix
+            self.heat = {t: h * self.heat_decay for t, h in self.heat.items() if h * self.heat_decay >= 0.5}
+        loaded = 0
+        for tenant_id in candidates:
+            size = os.path.getsize(self.bundles[tenant_id])  # Upper bound of the section bytes
+            if size > free:
+                continue
+            if self._load(tenant_id, prefetch=True) is not None:
+                free -= size
+                loaded += 1
+        return loaded
+
+    def _prefetch_loop(self, interval):
+        while not self.stop.wait(interval):
+            try:
+                self.prefetch()
+                print(json.dumps({"tenant_model_cache": self.snapshot()}))
+            except Exception as e:
+                print(f"Tenant model prefetch failed: {e}")
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(self.counts)
+            load_seconds = sorted(self.load_seconds)
+            resident = list(self.models)
+            used = self.used_bytes
+            hottest = sorted(self.heat.items(), key=lambda kv: kv[1], reverse=True)[:5]
+
+        lookups = counts["hits"] + counts["misses"]
+        routed = counts["tenant_instances"] + counts["global_instances"]
+        pick = lambda q: load_seconds[min(len(load_seconds) - 1, int(q * len(load_seconds)))]
+        return {
+            "tenant_bundles": len(self.bundles),
+            "resident": resident,
+            "resident_bytes": used,
+            "max_bytes": self.max_bytes,
+            "hit_rate": counts["hits"] / lookups if lookups else None,
+            "tenant_routed_share": counts["tenant_instances"] / routed if routed else None,
+            **counts,
+            "load_seconds": {
+                "count": len(load_seconds),
+                "mean": sum(load_seconds) / len(load_seconds) if load_seconds else None,
+                "p50": pick(0.50) if load_seconds else None,
+                "max": load_seconds[-1] if load_seconds else None,
+            },
+            "hottest": [{"tenant_id": t, "heat": round(h, 1)} for t, h in hottest],
+        }
+
+    def close(self):
+        self.stop.set()
+        if self.thread:
+            self.thread.join()
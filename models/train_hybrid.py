@@ -1,46 +1,192 @@
+import argparse
+import os
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
 import xgboost as xgb
-import joblib
-import os
 from sklearn.ensemble import IsolationForest
 from sklearn.model_selection import train_test_split
 
-# Ensure output dir exists
-os.makedirs("models_out", exist_ok=True)
+from ensemble_cpr.bundle import (
+    BUNDLE_FILENAME, ENSEMBLE_WEIGHTS, compute_baseline, serialize_models, write_bundle
+)
+from ensemble_cpr.ensemble import score_components
+
+NUM_ROWS = 1000
+FRAUD_RATE = 0.1
+SEED = 42
+ISO_CORE_SHARE = 0.25   # Fraction of the CPU budget given to the Isolation Forest
+
 
-print("Generating mock training data...")
-# Mock data matching V3 schema (streaming features included)
-data = []
-for i in range(1000):
-    is_fraud = 0
-    amount = np.random.uniform(10, 500)
+def make_mock_data(num_rows=NUM_ROWS, seed=SEED):
+    # Mock data matching V3 schema (streaming features included), built column-wise
+    rng = np.random.default_rng(seed)
+    amount = rng.uniform(10, 500, num_rows)
     # Streaming features
-    txn_count_10m = np.random.randint(1, 10)
-    txn_sum_10m = amount * txn_count_10m
-    
+    txn_count_10m = rng.integers(1, 10, num_rows)
+
     # Inject Fraud Patterns
-    if np.random.random() < 0.1:
-        is_fraud = 1
-        amount = np.random.uniform(800, 2000)
-        txn_count_10m = np.random.randint(10, 50) # Velocity attack
-        txn_sum_10m = amount * txn_count_10m
-
-    data.append([amount, txn_count_10m, txn_sum_10m, is_fraud])
-
-df = pd.DataFrame(data, columns=["amount", "txn_count_10m", "txn_sum_10m", "is_fraud"])
-X = df.drop("is_fraud", axis=1)
-y = df["is_fraud"]
-
-print("Training XGBoost (Supervised)...")
-model_xgb = xgb.XGBClassifier(objective="binary:logistic", n_estimators=50, use_label_encoder=False)
-model_xgb.fit(X, y)
-model_xgb.save_model("models_out/model.bst")
-
-print("Training Isolation Forest (Unsupervised)...")
-# IsoForest trains on *all* data to learn "normality"
-model_iso = IsolationForest(n_estimators=100, contamination=0.1, random_state=42)
-model_iso.fit(X)
-joblib.dump(model_iso, "models_out/isolation_forest.joblib")
-
-print("Artifacts saved to models_out/")
+    is_fraud = rng.random(num_rows) < FRAUD_RATE
+    n_fraud = int(is_fraud.sum())
+    amount[is_fraud] = rng.uniform(800, 2000, n_fraud)
+    txn_count_10m[is_fraud] = rng.integers(10, 50, n_fraud) # Velocity attack
+    txn_sum_10m = amount * txn_count_10m
+
+    return pd.DataFrame({
+        "amount": amount,
+        "txn_count_10m": txn_count_10m,
+        "txn_sum_10m": txn_sum_10m,
+        "is_fraud": is_fraud.astype(int)
+    })
+
+
+def available_cpus():
+    """CPU allocation of this container: cgroup quota if set, else the affinity mask."""
+    try:
+        quota, period = open("/sys/fs/cgroup/cpu.max").read().split()  # cgroup v2
+        if quota != "max":
+            return max(1, int(quota) // int(period))
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int(open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read())  # cgroup v1
+        period = int(open("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read())
+        if quota > 0:
+            return max(1, quota // period)
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+def split_cores(cpus):
+    iso_cores = max(1, int(cpus * ISO_CORE_SHARE))
+    return max(1, cpus - iso_cores), iso_cores
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def fit_xgb(X, y, nthread):
+    t0 = time.perf_counter()
+    model = xgb.XGBClassifier(objective="binary:logistic", n_estimators=50,
+                              tree_method="hist", n_jobs=nthread)
+    model.fit(X, y)
+    return model, time.perf_counter() - t0
+
+
+def fit_iso(X, n_jobs):
+    t0 = time.perf_counter()
+    # IsoForest trains on *all* data to learn "normality"
+    model = IsolationForest(n_estimators=100, contamination=0.1, random_state=42, n_jobs=n_jobs)
+    model.fit(X)
+    return model, time.perf_counter() - t0
+
+
+def train(X, y, cpus, concurrent=True):
+    """Trains both models; returns (model_xgb, model_iso, timings)."""
+    t0, cpu0 = time.perf_counter(), cpu_seconds()
+    # With a single core there is nothing to overlap; threads would only contend
+    if concurrent and cpus > 1:
+        xgb_cores, iso_cores = split_cores(cpus)
+        # Both fits spend their time in native code that releases the GIL
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            xgb_future = pool.submit(fit_xgb, X, y, xgb_cores)
+            iso_future = pool.submit(fit_iso, X, iso_cores)
+            model_xgb, xgb_seconds = xgb_future.result()
+            model_iso, iso_seconds = iso_future.result()
+    else:
+        # Sequential baseline: each model gets the whole budget in turn
+        model_xgb, xgb_seconds = fit_xgb(X, y, cpus)
+        model_iso, iso_seconds = fit_iso(X, cpus)
+    wall = time.perf_counter() - t0
+    cpu = cpu_seconds() - cpu0
+    return model_xgb, model_iso, {
+        "xgb_fit_seconds": xgb_seconds,
+        "iso_fit_seconds": iso_seconds,
+        "wall_seconds": wall,
+        "cpu_utilization": cpu / (wall * cpus),
+    }
+
+
+def benchmark(num_rows, cpus, repeats=3):
+    """Sequential vs concurrent training on the same data and core budget."""
+    df = make_mock_data(num_rows)
+    X, y = df.drop("is_fraud", axis=1), df["is_fraud"]
+    print(f"Benchmark: {num_rows:,} rows, {cpus} cores, best of {repeats}")
+
+    results = {}
+    for mode, concurrent in (("sequential", False), ("concurrent", True)):
+        runs = [train(X, y, cpus, concurrent)[2] for _ in range(repeats)]
+        best = min(runs, key=lambda r: r["wall_seconds"])
+        results[mode] = best
+        print(f"  {mode:<10} wall={best['wall_seconds']:.2f}s xgb={best['xgb_fit_seconds']:.2f}s "
+              f"iso={best['iso_fit_seconds']:.2f}s cpu_util={best['cpu_utilization']:.0%}")
+
+    speedup = results["sequential"]["wall_seconds"] / results["concurrent"]["wall_seconds"]
+    print(f"  speedup: {speedup:.2f}x")
+    return speedup
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=NUM_ROWS)
+    parser.add_argument("--cpus", type=int, default=None, help="Core budget (default: container allocation)")
+    parser.add_argument("--benchmark", action="store_true", help="Compare sequential vs concurrent training")
+    parser.add_argument("--tenants", nargs="*", default=[],
+                        help="Also train a bundle per tenant (models_out/tenants/<id>/), on its own mock data")
+    args = parser.parse_args()
+    cpus = args.cpus or available_cpus()
+
+    if args.benchmark:
+        benchmark(args.rows, cpus)
+        raise SystemExit(0)
+
+    # Ensure output dir exists
+    os.makedirs("models_out", exist_ok=True)
+
+    print("Generating mock training data...")
+    df = make_mock_data(args.rows)
+    X = df.drop("is_fraud", axis=1)
+    y = df["is_fraud"]
+
+    xgb_cores, iso_cores = split_cores(cpus)
+    print(f"Training XGBoost (Supervised, {xgb_cores} cores) and Isolation Forest (Unsupervised, {iso_cores} cores)...")
+    model_xgb, model_iso, timings = train(X, y, cpus)
+    print(f"XGBoost fit: {timings['xgb_fit_seconds']:.2f}s | IsoForest fit: {timings['iso_fit_seconds']:.2f}s | "
+          f"wall: {timings['wall_seconds']:.2f}s | CPU utilization: {timings['cpu_utilization']:.0%}")
+
+    # Both models + manifest in one bundle for the CPR predictor
+    model_version = f"local-{time.strftime('%Y%m%d%H%M%S')}"
+    bundle_path = os.path.join("models_out", BUNDLE_FILENAME)
+    # Training-data distributions ride along in the manifest as the drift baseline
+    prob_xgb, prob_iso, scores = score_components(model_xgb, model_iso, X.to_numpy(), ENSEMBLE_WEIGHTS)
+    baseline = compute_baseline({
+        **{name: X[name].to_numpy() for name in X.columns},
+        "xgb": prob_xgb, "iso": prob_iso, "score": scores,
+    })
+    write_bundle(bundle_path, serialize_models(model_xgb, model_iso), model_version,
+                 extra={"baseline": baseline})
+
+    print(f"Bundle {model_version} saved to {bundle_path}")
+
+    # Tenant bundles: same format and features, routed to by the predictor per tenant_id
+    for n, tenant_id in enumerate(args.tenants, start=1):
+        df = make_mock_data(args.rows, seed=SEED + n)
+        X, y = df.drop("is_fraud", axis=1), df["is_fraud"]
+        model_xgb, model_iso, _ = train(X, y, cpus)
+        # Its own drift baseline: the tenant's traffic is compared with the model that scores it
+        prob_xgb, prob_iso, scores = score_components(model_xgb, model_iso, X.to_numpy(), ENSEMBLE_WEIGHTS)
+        baseline = compute_baseline({
+            **{name: X[name].to_numpy() for name in X.columns},
+            "xgb": prob_xgb, "iso": prob_iso, "score": scores,
+        })
+        tenant_dir = os.path.join("models_out", "tenants", tenant_id)
+        os.makedirs(tenant_dir, exist_ok=True)
+        write_bundle(os.path.join(tenant_dir, BUNDLE_FILENAME), serialize_models(model_xgb, model_iso),
+                     f"{model_version}-{tenant_id}", extra={"tenant_id": tenant_id, "baseline": baseline})
+        print(f"Tenant bundle for {tenant_id} saved to {tenant_dir}")
@@ -1,10 +1,12 @@
 from google.cloud import bigquery
 from google.cloud import aiplatform
-import pandas as pd
+import argparse
+import json
 import numpy as np
 import sys
 import os
-from kfp import compiler
+import time
+from datetime import datetime, timedelta, timezone
 
 # --- PATH FIX ---
 # Add the training pipeline directory to sys.path so we can import 'components'
@@ -13,79 +15,311 @@ training_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../pipel
 if training_dir not in sys.path:
     sys.path.append(training_dir)
 
-# Now we can import the pipeline definition directly
-from pipeline_definition_v2 import fraudshield_pipeline_v2
-
 # --- CONFIG ---
-PROJECT_ID = "fraudshield-v2-dev"
+PROJECT_ID = "fraudshield-v3-dev-5320"
 REGION = "us-central1"
-BQ_TABLE = f"{PROJECT_ID}.fraudshield.predictions_log_v2"
+# Partitioned by HOUR on timestamp, clustered by tenant_id (see infra/terraform)
+BQ_TABLE = f"{PROJECT_ID}.fraudshield.predictions"
 PIPELINE_ROOT = f"gs://fraudshield-artifacts-dev-{PROJECT_ID}/pipeline_root"
+STATE_URI = f"gs://fraudshield-artifacts-dev-{PROJECT_ID}/monitoring/drift_state.json"
 
-def monitor_drift():
-    client = bigquery.Client(project=PROJECT_ID)
-    
-    print("--- 1. Fetching Prediction Logs ---")
+# --- SKETCH SETTINGS ---
+NUM_BINS = 50                   # Fixed-width score histogram over [0, 1], one per tenant per hour
+RETENTION_HOURS = 24 * 14       # Buckets older than this are dropped from state
+RECENT_HOURS = 24               # "Recent" window compared against the baseline
+BASELINE_HOURS = 24 * 7         # Baseline span: a tenant's first hours of predictions (or --repin_baseline's window)
+LATENESS_MINUTES = 10           # Don't read rows this close to "now" (streaming inserts still landing)
+MIN_COUNT = 100                 # Minimum rows on each side before a tenant is scored
+REPIN_HOURS = 24                # Hours of predictions from a newly deployed model that become its baseline
+RETRAIN_TIMEOUT_HOURS = 48      # A retrain that hasn't changed the served model by then may be triggered again
+
+# THRESHOLDS: PSI > 0.2 is the usual "significant shift" rule of thumb
+PSI_THRESHOLD = 0.20
+KS_THRESHOLD = 0.10
+
+GLOBAL = "__all__"
+
+
+# --- STATE ---
+def load_state(uri=STATE_URI):
+    """Watermark + per-tenant/per-bucket histograms + pinned baseline."""
+    try:
+        if uri.startswith("gs://"):
+            from google.cloud import storage
+            bucket, blob = uri[len("gs://"):].split("/", 1)
+            blob = storage.Client(project=PROJECT_ID).bucket(bucket).blob(blob)
+            if not blob.exists():
+                raise FileNotFoundError(uri)
+            raw = blob.download_as_text()
+        else:
+            with open(uri) as f:
+                raw = f.read()
+        state = json.loads(raw)
+    except FileNotFoundError:
+        state = {"watermark": None, "buckets": {}, "baseline": None, "versions": {}, "retrain": None}
+    if state.get("num_bins", NUM_BINS) != NUM_BINS:
+        raise ValueError(f"State was built with {state['num_bins']} bins; NUM_BINS is {NUM_BINS}")
+    return state
+
+
+def save_state(state, uri=STATE_URI):
+    state["num_bins"] = NUM_BINS
+    raw = json.dumps(state, sort_keys=True)
+    if uri.startswith("gs://"):
+        from google.cloud import storage
+        bucket, blob = uri[len("gs://"):].split("/", 1)
+        storage.Client(project=PROJECT_ID).bucket(bucket).blob(blob).upload_from_string(
+            raw, content_type="application/json"
+        )
+    else:
+        tmp = f"{uri}.tmp"
+        with open(tmp, "w") as f:
+            f.write(raw)
+        os.replace(tmp, uri)
+
+
+# --- SKETCHES ---
+def fold(state, rows):
+    """Adds (tenant_id, bucket_iso, model_version, bin, n) rows into the per-tenant bucket histograms."""
+    buckets = state["buckets"]
+    for tenant, bucket, _, bin_idx, n in rows:
+        for key in (tenant, GLOBAL):
+            hist = buckets.setdefault(key, {}).setdefault(bucket, [0] * NUM_BINS)
+            hist[min(max(int(bin_idx), 0), NUM_BINS - 1)] += int(n)
+
+
+def prune(state, now):
+    cutoff = (now - timedelta(hours=RETENTION_HOURS)).isoformat()
+    for tenant, hists in state["buckets"].items():
+        for bucket in [b for b in hists if b < cutoff]:
+            del hists[bucket]
+
+
+def window(state, tenant, start, end):
+    """Sum of the tenant's bucket histograms with start <= bucket < end."""
+    total = np.zeros(NUM_BINS)
+    lo, hi = start.isoformat(), end.isoformat()
+    for bucket, hist in state["buckets"].get(tenant, {}).items():
+        if lo <= bucket < hi:
+            total += hist
+    return total
+
+
+def track_versions(state, rows):
+    """
+    Records the model version serving each tenant key (the one in its newest
+    hour bucket) and the first bucket it appeared in. Tenants can be routed to
+    their own bundles, so versions are per tenant; GLOBAL's is the set of all.
+    """
+    versions = state.setdefault("versions", {})
+    latest, first = {}, {}
+    for tenant, bucket, version, _, _ in rows:
+        if bucket >= latest.get(tenant, ("", None))[0]:
+            latest[tenant] = (bucket, version)
+        first[(tenant, version)] = min(bucket, first.get((tenant, version), bucket))
+
+    changed = []
+    for tenant, (_, version) in latest.items():
+        if versions.get(tenant, {}).get("model_version") != version:
+            versions[tenant] = {"model_version": version, "since": first[(tenant, version)]}
+            changed.append(tenant)
+            print(f"{tenant}: now served by model {version} (since {first[(tenant, version)]})")
+    signature = ",".join(sorted({v["model_version"] for t, v in versions.items() if t != GLOBAL}))
+    if changed and versions.get(GLOBAL, {}).get("model_version") != signature:
+        versions[GLOBAL] = {"model_version": signature, "since": max(versions[t]["since"] for t in changed)}
+
+
+def pin_baseline(state, start, end):
+    versions = state.get("versions", {})
+    state["baseline"] = {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "hists": {tenant: window(state, tenant, start, end).tolist() for tenant in state["buckets"]},
+        "model_versions": {tenant: versions.get(tenant, {}).get("model_version") for tenant in state["buckets"]},
+    }
+    print(f"Pinned baseline {start:%Y-%m-%d %H:%M} -> {end:%Y-%m-%d %H:%M} "
+          f"for {len(state['baseline']['hists'])} tenant keys")
+
+
+def pin_tenant(state, tenant, until, hours):
+    """
+    Pins a tenant's baseline on its first `hours` of predictions from the model
+    now serving it (BASELINE_HOURS for a tenant without a baseline, REPIN_HOURS
+    after a model change). A tenant too quiet to fill MIN_COUNT in that span
+    gets everything before the recent window instead, and is pinned again on
+    later runs until it has enough. Returns False while the span hasn't landed
+    or the baseline is still too thin to score against.
+    """
+    version = state["versions"].get(tenant)
+    if version:
+        start = datetime.fromisoformat(version["since"]) + timedelta(hours=1)  # First full hour on this model
+    else:
+        start = datetime.fromisoformat(min(state["buckets"][tenant]))
+    end = start + timedelta(hours=hours)
+    if end > until:
+        return False
+    hist = window(state, tenant, start, end)
+    if hist.sum() < MIN_COUNT:
+        end = max(end, until - timedelta(hours=RECENT_HOURS))
+        hist = window(state, tenant, start, end)
+    state["baseline"]["hists"][tenant] = hist.tolist()
+    state["baseline"]["model_versions"][tenant] = version["model_version"] if version else None
+    print(f"{tenant}: pinned baseline on model {version['model_version'] if version else 'unknown'} "
+          f"{start:%Y-%m-%d %H:%M} -> {end:%Y-%m-%d %H:%M} (n={int(hist.sum()):,})")
+    return hist.sum() >= MIN_COUNT
+
+
+def psi(expected, actual, eps=1e-4):
+    """Population Stability Index between two histograms over the same bins."""
+    e = np.asarray(expected, float)
+    a = np.asarray(actual, float)
+    e = np.clip(e / e.sum(), eps, None)
+    a = np.clip(a / a.sum(), eps, None)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def ks(expected, actual):
+    """Two-sample Kolmogorov-Smirnov statistic from binned CDFs (bin-resolution lower bound)."""
+    e = np.cumsum(expected) / np.sum(expected)
+    a = np.cumsum(actual) / np.sum(actual)
+    return float(np.max(np.abs(e - a)))
+
+
+# --- INCREMENTAL SCAN ---
+def fetch_increment(client, since, until):
+    """
+    Histogram counts for rows with since < timestamp <= until, binned in SQL.
+    The timestamp range prunes partitions, so bytes scanned track the new rows
+    only; the result is at most tenants x buckets x NUM_BINS rows.
+    """
     query = f"""
-        SELECT score, risk_band, timestamp 
+        SELECT tenant_id,
+               TIMESTAMP_TRUNC(timestamp, HOUR) AS bucket,
+               model_version,
+               LEAST(CAST(FLOOR(score * {NUM_BINS}) AS INT64), {NUM_BINS - 1}) AS bin,
+               COUNT(*) AS n
         FROM `{BQ_TABLE}`
-        ORDER BY timestamp DESC
+        WHERE timestamp > @since AND timestamp <= @until
+        GROUP BY tenant_id, bucket, model_version, bin
     """
-    df = client.query(query).to_dataframe()
-    
-    # Needs at least a few rows to calculate meaningful stats
-    if len(df) < 2:
-        print("Not enough data to calculate drift. (Need > 2 predictions)")
-        return
-
-    # Simulate "Today" vs "Baseline"
-    # We split the data 20/80 just to demonstrate the math
-    split_idx = int(len(df) * 0.2)
-    if split_idx == 0: split_idx = 1 # Ensure at least 1 row in recent
-    
-    recent_df = df.iloc[:split_idx]
-    baseline_df = df.iloc[split_idx:]
-    
-    avg_recent = recent_df['score'].mean()
-    avg_baseline = baseline_df['score'].mean() if not baseline_df.empty else 0.5
-    
-    print(f"Baseline Avg Score: {avg_baseline:.4f}")
-    print(f"Recent Avg Score:   {avg_recent:.4f}")
-    
-    # Avoid divide by zero
-    if avg_baseline == 0: avg_baseline = 0.001
-    
-    drift_pct = abs((avg_recent - avg_baseline) / avg_baseline)
-    print(f"Drift Detected:     {drift_pct:.2%}")
-    
-    # THRESHOLD: 20% deviation triggers retrain
-    DRIFT_THRESHOLD = 0.20
-    
-    if drift_pct > DRIFT_THRESHOLD:
-        print(f">>> ALERT: Drift > {DRIFT_THRESHOLD:.0%}. Triggering Retraining Pipeline...")
+    job = client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("since", "TIMESTAMP", since),
+        bigquery.ScalarQueryParameter("until", "TIMESTAMP", until),
+    ]))
+    rows = [(r.tenant_id or "default", r.bucket.astimezone(timezone.utc).isoformat(),
+             r.model_version or "unknown", r.bin, r.n)
+            for r in job.result()]
+    return rows, job.total_bytes_processed or 0
+
+
+def monitor_drift(state_uri=STATE_URI, repin_baseline=False):
+    run_start = time.perf_counter()
+    client = bigquery.Client(project=PROJECT_ID)
+    state = load_state(state_uri)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+
+    print("--- 1. Folding New Predictions Into Sketches ---")
+    until = now - timedelta(minutes=LATENESS_MINUTES)
+    since = (datetime.fromisoformat(state["watermark"]) if state["watermark"]
+             else until - timedelta(hours=RETENTION_HOURS))
+    rows, bytes_scanned = fetch_increment(client, since, until)
+    fold(state, rows)
+    track_versions(state, rows)
+    prune(state, now)
+    state["watermark"] = until.isoformat()
+    new_predictions = sum(r[4] for r in rows)
+    print(f"Scanned {since:%Y-%m-%d %H:%M} -> {until:%Y-%m-%d %H:%M}: "
+          f"{new_predictions:,} predictions, {bytes_scanned / 1e6:.1f} MB processed")
+
+    recent_start = until - timedelta(hours=RECENT_HOURS)
+    if repin_baseline:
+        pin_baseline(state, recent_start - timedelta(hours=BASELINE_HOURS), recent_start)
+    elif not state["baseline"]:
+        # Filled per tenant below, from each tenant's own first BASELINE_HOURS
+        state["baseline"] = {"hists": {}, "model_versions": {}}
+    save_state(state, state_uri)
+
+    print("--- 2. Comparing Recent Window To Baseline ---")
+    alerts = []
+    baseline = state["baseline"]
+    # Baselines pinned before versions were tracked belong to whatever serves now
+    pinned_versions = baseline.setdefault("model_versions", {t: state["versions"].get(t, {}).get("model_version")
+                                                             for t in baseline["hists"]})
+    # Every tenant with predictions, including ones that showed up after the baseline was pinned
+    for tenant in sorted(state["buckets"]):
+        if not state["buckets"][tenant]:
+            continue  # All of its buckets aged out
+        current = state["versions"].get(tenant)
+        pinned = baseline["hists"].get(tenant)
+        if pinned is None or sum(pinned) < MIN_COUNT:
+            if not pin_tenant(state, tenant, until, BASELINE_HOURS):
+                print(f"{tenant:<16} awaiting a baseline ({BASELINE_HOURS}h and {MIN_COUNT} predictions)")
+                continue
+        elif current and pinned_versions.get(tenant) != current["model_version"]:
+            # A newly deployed model is compared against its own output, not its predecessor's
+            if not pin_tenant(state, tenant, until, REPIN_HOURS):
+                print(f"{tenant:<16} awaiting {REPIN_HOURS}h of predictions from {current['model_version']}")
+                continue
+        baseline_hist = baseline["hists"][tenant]
+        recent_hist = window(state, tenant, recent_start, until + timedelta(hours=1))
+        if sum(baseline_hist) < MIN_COUNT or recent_hist.sum() < MIN_COUNT:
+            continue
+        tenant_psi = psi(baseline_hist, recent_hist)
+        tenant_ks = ks(baseline_hist, recent_hist)
+        drifted = tenant_psi > PSI_THRESHOLD or tenant_ks > KS_THRESHOLD
+        label = "ALL TENANTS" if tenant == GLOBAL else tenant
+        print(f"{label:<16} PSI={tenant_psi:.4f} KS={tenant_ks:.4f} "
+              f"(baseline n={int(sum(baseline_hist)):,}, recent n={int(recent_hist.sum()):,})"
+              + ("  <-- DRIFT" if drifted else ""))
+        if drifted:
+            alerts.append(label)
+
+    print(f"Runtime: {time.perf_counter() - run_start:.2f}s | Bytes processed: {bytes_scanned:,}")
+
+    serving = state["versions"].get(GLOBAL, {}).get("model_version")
+    retrain = state.get("retrain")
+    in_flight = (retrain and retrain["model_versions"] == serving
+                 and now < datetime.fromisoformat(retrain["submitted_at"]) + timedelta(hours=RETRAIN_TIMEOUT_HOURS))
+    if alerts and in_flight:
+        print(f">>> ALERT: Drift on {', '.join(alerts)}, but a retrain was submitted at "
+              f"{retrain['submitted_at']} and its model is not serving yet. Not re-triggering.")
+    elif alerts:
+        print(f">>> ALERT: Drift (PSI > {PSI_THRESHOLD} or KS > {KS_THRESHOLD}) on {', '.join(alerts)}. "
+              "Triggering Retraining Pipeline...")
         trigger_retrain()
+        state["retrain"] = {"submitted_at": now.isoformat(), "model_versions": serving}
     else:
         print(">>> Status: System Healthy. No retraining needed.")
+    save_state(state, state_uri)
 
 def trigger_retrain():
-    print("--- 2. Compiling & Submitting Pipeline ---")
-    
+    # Imported here so the monitoring pass itself doesn't need kfp
+    from kfp import compiler
+    from pipeline_definition_v3 import fraudshield_pipeline_v3
+
+    print("--- 3. Compiling & Submitting Pipeline ---")
+
     package_path = "fraudshield_retrain_pipeline.json"
     compiler.Compiler().compile(
-        pipeline_func=fraudshield_pipeline_v2,
+        pipeline_func=fraudshield_pipeline_v3,
         package_path=package_path
     )
-    
+
     aiplatform.init(project=PROJECT_ID, location=REGION)
-    
+
     job = aiplatform.PipelineJob(
-        display_name="fraudshield-v2-autotrain",
+        display_name="fraudshield-v3-autotrain",
         template_path=package_path,
         pipeline_root=PIPELINE_ROOT,
         enable_caching=False
     )
     job.submit()
-    print(">>> Retraining Job Submitted: fraudshield-v2-autotrain")
+    print(">>> Retraining Job Submitted: fraudshield-v3-autotrain")
 
 if __name__ == "__main__":
-    monitor_drift()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--state_uri", default=STATE_URI)
+    parser.add_argument("--repin_baseline", action="store_true",
+                        help="Pin the baseline to the BASELINE_HOURS before the recent window")
+    args = parser.parse_args()
+    monitor_drift(args.state_uri, args.repin_baseline)
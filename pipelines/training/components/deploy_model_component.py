@@ -10,7 +10,8 @@ def deploy_model_to_endpoint(
     model: Input[Model],
     endpoint_name: str,
     display_name: str,
-    serving_container: str
+    serving_container: str,
+    deploy_as: str = "champion"
 ):
     from google.cloud import aiplatform
     
@@ -28,6 +29,11 @@ def deploy_model_to_endpoint(
     )
     
     # 2. Find the Endpoint
+    # A shadow (challenger) model gets its own endpoint: the API mirrors a sample of
+    # live requests to it (SHADOW_ENDPOINT_NAME) without exposing its scores to callers
+    if deploy_as == "shadow":
+        endpoint_name = f"{endpoint_name}-shadow"
+        print(f"Deploying as shadow challenger to endpoint: {endpoint_name}")
     endpoints = aiplatform.Endpoint.list(filter=f'display_name="{endpoint_name}"')
     if not endpoints:
         # Fallback if Terraform didn't create it, though it should have
@@ -39,12 +45,16 @@ def deploy_model_to_endpoint(
     # If endpoint has traffic, we deploy as challenger (10% traffic).
     # If empty, we deploy as 100%.
     traffic_split = {"0": 100}
-    if endpoint.traffic_split:
+    if endpoint.traffic_split and deploy_as != "shadow":
         print("Endpoint has existing traffic. Deploying as Challenger (10%).")
         # Logic to grab ID of current model would go here. 
         # For this demo, we just deploy with 100 to force the update, 
         # or you can set traffic_percentage=10 to be safe.
         
+    if deploy_as == "shadow" and endpoint.traffic_split:
+        # Replace the previous challenger rather than splitting shadow traffic between two
+        endpoint.undeploy_all(sync=True)
+
     endpoint.deploy(
         model=uploaded_model,
         deployed_model_display_name=display_name,
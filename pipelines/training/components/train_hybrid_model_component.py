@@ -1,62 +1,260 @@
 import kfp.dsl as dsl
 from kfp.dsl import component, Input, Output, Dataset, Model, Metrics
-import pandas as pd
-import numpy as np
-import xgboost as xgb
-from sklearn.ensemble import IsolationForest
-import joblib
-import os
 
 @component(
-    base_image="python:3.10", 
-    packages_to_install=["pandas", "xgboost", "scikit-learn", "joblib"]
+    base_image="python:3.10",
+    packages_to_install=["pandas", "pyarrow", "xgboost>=2.0", "scikit-learn", "joblib", "google-cloud-storage"]
 )
 def train_hybrid_model(
-    training_data: Input[Dataset], 
+    training_data: Input[Dataset],
     artifact_uri: str,
-    metrics_artifact: Output[Metrics]
+    metrics_artifact: Output[Metrics],
+    model_artifact: Output[Model],
+    batch_size: int = 500_000,
+    iso_sample_size: int = 200_000,
+    baseline_sample_size: int = 50_000
 ):
     """
-    Trains XGBoost (supervised) and Isolation Forest (unsupervised) and saves 
-    both artifacts to a single GCS location (artifact_uri) for the CPR to load.
+    Trains XGBoost (supervised) and Isolation Forest (unsupervised) and saves
+    both into a single versioned model bundle at artifact_uri for the CPR to load.
+
+    training_data is a directory of Parquet shards (see extract_bq_to_dataset).
+    It is streamed in batches: XGBoost builds a QuantileDMatrix from a data
+    iterator, and the Isolation Forest fits on a reservoir sample of normal rows,
+    so the full table is never materialized in pandas.
+
+    Both models then train concurrently on a core budget derived from the
+    container's CPU allocation (cgroup quota), so neither oversubscribes the other.
     """
-    df = pd.read_csv(training_data.path)
-    
-    # Assuming the training data now includes both V2 features (7d/30d) AND 
-    # V3 streaming features (10m) for a complete training set.
-    
+    import hashlib
+    import io
+    import json
+    import os
+    import resource
+    import struct
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from datetime import datetime, timezone
+    import joblib
+    import numpy as np
+    import pyarrow.dataset as ds
+    import xgboost as xgb
+    from sklearn.ensemble import IsolationForest
+
+    run_start = time.perf_counter()
+
+    def available_cpus():
+        """CPU allocation of this container: cgroup quota if set, else the affinity mask."""
+        try:
+            quota, period = open("/sys/fs/cgroup/cpu.max").read().split()  # cgroup v2
+            if quota != "max":
+                return max(1, int(quota) // int(period))
+        except (OSError, ValueError):
+            pass
+        try:
+            quota = int(open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read())  # cgroup v1
+            period = int(open("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read())
+            if quota > 0:
+                return max(1, quota // period)
+        except (OSError, ValueError):
+            pass
+        return len(os.sched_getaffinity(0))
+
+    def cpu_seconds():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    # XGBoost does most of the work; the forest gets roughly a quarter of the cores
+    cpus = available_cpus()
+    iso_cores = max(1, cpus // 4)
+    xgb_cores = max(1, cpus - iso_cores)
+    print(f"CPU budget: {cpus} cores (xgb={xgb_cores}, iso={iso_cores})")
+
     # Feature set for the model (must match the API vector order)
-    features = ["amount", "txn_count_10m", "txn_sum_10m"] 
-    
-    X = df[features]
-    y = df['is_fraud']
-    
+    features = ["amount", "txn_count_10m", "txn_sum_10m"]
+    label = "is_fraud"
+    dataset = ds.dataset(training_data.path, format="parquet")
+
+    class ParquetBatchIter(xgb.DataIter):
+        """
+        Feeds Parquet record batches to XGBoost. XGBoost walks the iterator more
+        than once (sketching, then quantizing); the first pass also folds normal
+        rows into a bottom-k reservoir for the Isolation Forest.
+        """
+        def __init__(self):
+            self._batches = None
+            self._first_pass = True
+            self.rows = 0
+            self.fraud_rows = 0
+            self.rng = np.random.default_rng(42)
+            # Normal rows for the Isolation Forest; all rows for the drift baseline
+            self.sample, self.sample_keys = np.empty((0, len(features)), dtype=np.float32), np.empty(0)
+            self.baseline, self.baseline_keys = np.empty((0, len(features)), dtype=np.float32), np.empty(0)
+            super().__init__()
+
+        def _reservoir(self, pool, pool_keys, rows, k):
+            # Bottom-k sampling: keep the k rows with the smallest random key
+            keys = np.concatenate([pool_keys, self.rng.random(len(rows))])
+            pool = np.concatenate([pool, rows])
+            if len(keys) > k:
+                keep = np.argpartition(keys, k)[:k]
+                keys, pool = keys[keep], pool[keep]
+            return pool, keys
+
+        def _observe(self, X, y):
+            self.rows += len(y)
+            self.fraud_rows += int(y.sum())
+            self.sample, self.sample_keys = self._reservoir(self.sample, self.sample_keys, X[y == 0], iso_sample_size)
+            self.baseline, self.baseline_keys = self._reservoir(
+                self.baseline, self.baseline_keys, X, baseline_sample_size
+            )
+
+        def next(self, input_data):
+            if self._batches is None:
+                self._batches = dataset.to_batches(columns=features + [label], batch_size=batch_size)
+            batch = next(self._batches, None)
+            if batch is None:
+                self._first_pass = False
+                return False
+            X = np.column_stack([batch.column(f).to_numpy(zero_copy_only=False) for f in features]).astype(np.float32)
+            y = batch.column(label).to_numpy(zero_copy_only=False).astype(np.float32)
+            if self._first_pass:
+                self._observe(X, y)
+            input_data(data=X, label=y)
+            return True
+
+        def reset(self):
+            self._batches = None
+
+    # --- 0. Ingest (builds the quantized matrix and the normal-row reservoir) ---
+    print("Ingesting training data...")
+    t0 = time.perf_counter()
+    data_iter = ParquetBatchIter()
+    dtrain = xgb.QuantileDMatrix(data_iter, nthread=cpus)
+    ingest_seconds = time.perf_counter() - t0
+
     # --- 1. XGBoost Training (Supervised) ---
-    print("Starting XGBoost training...")
-    model_xgb = xgb.XGBClassifier(objective="binary:logistic", n_estimators=50)
-    model_xgb.fit(X, y)
-    
-    # Save XGBoost
-    xgb_path = os.path.join(artifact_uri, "model.bst")
-    model_xgb.save_model("model.bst")
-    os.system(f"gsutil cp model.bst {xgb_path}")
-    
+    def fit_xgb():
+        t = time.perf_counter()
+        booster = xgb.train(
+            {"objective": "binary:logistic", "tree_method": "hist", "nthread": xgb_cores},
+            dtrain,
+            num_boost_round=50
+        )
+        return booster, time.perf_counter() - t
+
     # --- 2. Isolation Forest Training (Unsupervised) ---
-    print("Starting Isolation Forest training...")
     # Train on non-fraudulent data to define the normal baseline
-    X_normal = df[df['is_fraud'] == 0][features]
-    model_iso = IsolationForest(contamination=0.01, random_state=42, n_estimators=100)
-    model_iso.fit(X_normal)
-    
-    # Save Isolation Forest
-    iso_path = os.path.join(artifact_uri, "isolation_forest.joblib")
-    joblib.dump(model_iso, "isolation_forest.joblib")
-    os.system(f"gsutil cp isolation_forest.joblib {iso_path}")
-
-    # --- Metrics (Simplified) ---
-    metrics_artifact.log_metric("models_trained", 2)
-    metrics_artifact.log_metric("xgb_artifact_gcs", xgb_path)
-    metrics_artifact.log_metric("iso_artifact_gcs", iso_path)
+    def fit_iso():
+        t = time.perf_counter()
+        model = IsolationForest(contamination=0.01, random_state=42, n_estimators=100, n_jobs=iso_cores)
+        model.fit(data_iter.sample)
+        return model, time.perf_counter() - t
+
+    print(f"Training XGBoost and Isolation Forest ({len(data_iter.sample):,} sampled normal rows)...")
+    t0, cpu0 = time.perf_counter(), cpu_seconds()
+    if cpus > 1:
+        # Both fits release the GIL in native code, so threads are enough here
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            xgb_future = pool.submit(fit_xgb)
+            iso_future = pool.submit(fit_iso)
+            booster, xgb_fit_seconds = xgb_future.result()
+            model_iso, iso_fit_seconds = iso_future.result()
+    else:
+        # Nothing to overlap on a single core
+        booster, xgb_fit_seconds = fit_xgb()
+        model_iso, iso_fit_seconds = fit_iso()
+    train_seconds = time.perf_counter() - t0
+    train_cpu_seconds = cpu_seconds() - cpu0
+    del dtrain
+
+    # --- 3. Drift Baseline ---
+    # Distributions of the inputs and scores on a uniform training sample; the API's
+    # drift monitor compares live traffic against these (same rules as
+    # compute_baseline in models/ensemble_cpr/bundle.py).
+    weights = {"xgb": 0.8, "iso": 0.2}
+    sample = data_iter.baseline
+    prob_xgb = booster.predict(xgb.DMatrix(sample))
+    prob_iso = np.clip(1 - ((model_iso.decision_function(sample) + 1) / 2), 0, 1)
+    columns = {name: sample[:, i] for i, name in enumerate(features)}
+    columns.update({"xgb": prob_xgb, "iso": prob_iso, "score": weights["xgb"] * prob_xgb + weights["iso"] * prob_iso})
+    baseline = {}
+    for name, values in columns.items():
+        values = values.astype(np.float64)
+        if name in ("score", "xgb", "iso"):
+            edges = np.linspace(0, 1, 21)[1:-1]
+        else:
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, 11)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+        baseline[name] = {"edges": [float(e) for e in edges], "counts": [int(c) for c in counts]}
 
-    print("Hybrid model artifacts saved successfully.")
+    # --- 4. Model Bundle ---
+    # Same layout as models/ensemble_cpr/bundle.py (the predictor's reader);
+    # inlined because KFP lightweight components cannot import repo modules.
+    model_version = f"v3-{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+    iso_buf = io.BytesIO()
+    joblib.dump(model_iso, iso_buf)
+    sections = {"xgb": bytes(booster.save_raw(raw_format="ubj")), "iso": iso_buf.getvalue()}
+    formats = {"xgb": "ubj", "iso": "joblib"}
+
+    align = lambda n: -(-n // 4096) * 4096
+    manifest = {
+        "format_version": 1,
+        "model_version": model_version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "feature_order": features,
+        "ensemble_weights": weights,
+        "band_thresholds": {"HIGH": 0.7, "MEDIUM": 0.3},
+        "baseline": baseline,
+        "sections": {},
+    }
+    reserve = offset = align(16 + len(json.dumps(manifest, sort_keys=True)) + 512 * (len(sections) + 1))
+    for name, payload in sections.items():
+        manifest["sections"][name] = {"offset": offset, "length": len(payload),
+                                      "sha256": hashlib.sha256(payload).hexdigest(), "format": formats[name]}
+        offset = align(offset + len(payload))
+    manifest_bytes = json.dumps(manifest, sort_keys=True).encode("utf-8")
+    assert 16 + len(manifest_bytes) <= reserve, "Manifest exceeds reserved header"
+
+    bundle = bytearray(offset)
+    bundle[:16] = struct.pack("<8sQ", b"FSBNDL01", len(manifest_bytes))
+    bundle[16:16 + len(manifest_bytes)] = manifest_bytes
+    for name, payload in sections.items():
+        start = manifest["sections"][name]["offset"]
+        bundle[start:start + len(payload)] = payload
+
+    # A GCS object becomes visible only once fully written, so a single-object
+    # upload is atomic; crc32c makes the client verify what the server stored.
+    from google.cloud import storage
+    bundle_uri = os.path.join(artifact_uri, "model_bundle.fsb")
+    bucket_name, blob_name = bundle_uri[len("gs://"):].split("/", 1)
+    blob = storage.Client().bucket(bucket_name).blob(blob_name)
+    blob.metadata = {"model_version": model_version}
+    blob.upload_from_string(bytes(bundle), content_type="application/octet-stream", checksum="crc32c")
+
+    model_artifact.uri = artifact_uri
+    model_artifact.metadata["model_version"] = model_version
+    model_artifact.metadata["bundle_bytes"] = len(bundle)
+
+    # --- Metrics ---
+    # ru_maxrss is reported in KiB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    metrics_artifact.log_metric("models_trained", 2)
+    metrics_artifact.log_metric("training_rows", data_iter.rows)
+    metrics_artifact.log_metric("fraud_rows", data_iter.fraud_rows)
+    metrics_artifact.log_metric("iso_sample_rows", len(data_iter.sample))
+    metrics_artifact.log_metric("ingest_seconds", round(ingest_seconds, 3))
+    metrics_artifact.log_metric("xgb_fit_seconds", round(xgb_fit_seconds, 3))
+    metrics_artifact.log_metric("iso_fit_seconds", round(iso_fit_seconds, 3))
+    metrics_artifact.log_metric("train_seconds", round(train_seconds, 3))
+    metrics_artifact.log_metric("train_cpu_seconds", round(train_cpu_seconds, 3))
+    metrics_artifact.log_metric("train_cpu_utilization", round(train_cpu_seconds / (train_seconds * cpus), 3))
+    metrics_artifact.log_metric("cpu_budget", cpus)
+    metrics_artifact.log_metric("xgb_cores", xgb_cores)
+    metrics_artifact.log_metric("iso_cores", iso_cores)
+    metrics_artifact.log_metric("wall_clock_seconds", round(time.perf_counter() - run_start, 3))
+    metrics_artifact.log_metric("peak_rss_mb", round(peak_rss_mb, 1))
+    metrics_artifact.log_metric("bundle_gcs", bundle_uri)
+    metrics_artifact.log_metric("model_version", model_version)
 
+    print(f"Hybrid model bundle {model_version} saved to {bundle_uri}. Peak RSS: {peak_rss_mb:.0f} MB")
@@ -10,35 +10,74 @@ REGION = "us-central1"
 BUCKET = f"fraudshield-artifacts-dev-{PROJECT_ID}"
 PIPELINE_ROOT = f"gs://{BUCKET}/pipeline_root"
 IMAGE_URI = f"us-central1-docker.pkg.dev/{PROJECT_ID}/fraudshield-repo/hybrid-cpr:v2"
+TRAIN_CPU_LIMIT = "8"   # XGBoost and IsolationForest split this budget (see train_hybrid_model)
+TRAIN_MEMORY_LIMIT = "32G"
 
-@dsl.component(base_image="python:3.10", packages_to_install=["pandas", "google-cloud-bigquery", "db-dtypes"])
-def extract_bq_to_dataset(project_id: str, query: str, dataset: dsl.Output[dsl.Dataset]):
-    from google.cloud import bigquery
-    # This query would join transactions with offline features (7d/30d)
-    bigquery.Client(project=project_id).query(query).to_dataframe().to_csv(dataset.path, index=False)
+@dsl.component(base_image="python:3.10", packages_to_install=["pyarrow", "google-cloud-bigquery[bqstorage]"])
+def extract_bq_to_dataset(project_id: str, query: str, dataset: dsl.Output[dsl.Dataset], shard_rows: int = 1_000_000):
+    import os
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from google.cloud import bigquery, bigquery_storage
+
+    # Explicit column types so every shard has the same schema regardless of
+    # what BigQuery infers (e.g. INT64 counts vs FLOAT64 sums, compact labels)
+    dtypes = {
+        "transaction_id": pa.string(), "customer_id": pa.string(), "card_id": pa.string(),
+        "amount": pa.float64(), "is_fraud": pa.int8(),
+        "txn_count_10m": pa.int32(), "txn_sum_10m": pa.float64(),
+        "txn_count_7d": pa.int32(), "txn_amount_sum_7d": pa.float64(), "avg_ticket_30d": pa.float64(),
+        "card_count_7d": pa.int32(), "card_sum_7d": pa.float64(),
+    }
+
+    # This query would join transactions with offline features (7d/30d).
+    # Rows are streamed through the Storage Read API as Arrow batches and written
+    # as Parquet shards, so the extract never holds the full result in memory.
+    os.makedirs(dataset.path, exist_ok=True)
+    rows = bigquery.Client(project=project_id).query(query).result()
+    writer, shard, shard_count = None, 0, 0
+    for batch in rows.to_arrow_iterable(bqstorage_client=bigquery_storage.BigQueryReadClient()):
+        table = pa.Table.from_batches([batch])
+        schema = pa.schema([pa.field(f.name, dtypes.get(f.name, f.type)) for f in table.schema])
+        table = table.cast(schema)
+        if writer is None:
+            writer = pq.ParquetWriter(os.path.join(dataset.path, f"part-{shard:05d}.parquet"), schema)
+        writer.write_table(table)
+        shard_count += table.num_rows
+        if shard_count >= shard_rows:
+            writer.close()
+            writer, shard, shard_count = None, shard + 1, 0
+    if writer is not None:
+        writer.close()
 
 @dsl.pipeline(name="fraudshield-training-pipeline-v3")
 def fraudshield_pipeline_v3(project_id: str = PROJECT_ID, region: str = REGION):
-    # This query pulls historical data (for training 7d/30d features) + the static labels
+    # This query pulls historical data (for training 7d/30d features) + the static labels.
+    # The 10m velocity features come from features/velocity_backfill.py, which computes
+    # them point-in-time per transaction exactly as the streaming job serves them
+    # (loaded into velocity_features_10m with --bq_table; run it before training).
     query = f"""
     SELECT t.tx_id as transaction_id, t.customer_id, t.card_id, t.amount, t.is_fraud,
+           v.txn_count_10m, v.txn_sum_10m,
            c.txn_count_7d, c.txn_amount_sum_7d, c.avg_ticket_30d, 
            d.txn_count_7d as card_count_7d, d.txn_amount_sum_7d as card_sum_7d
     FROM `{project_id}.fraudshield.transactions` t
+    JOIN `{project_id}.fraudshield.velocity_features_10m` v ON t.tx_id = v.tx_id
     JOIN `{project_id}.fraudshield.features_customers` c ON t.customer_id = c.customer_id AND t.tx_ts = c.feature_timestamp
     JOIN `{project_id}.fraudshield.features_cards` d ON t.card_id = d.card_id AND t.tx_ts = d.feature_timestamp
     """
     
     extract = extract_bq_to_dataset(project_id=project_id, query=query)
     
-    # Train the hybrid model (produces model.bst AND isolation_forest.joblib)
+    # Train the hybrid model (produces one model bundle with XGBoost + Isolation Forest)
     train = train_hybrid_model(training_data=extract.outputs["dataset"], artifact_uri=f"gs://{BUCKET}/v3_hybrid_model")
+    train.set_cpu_limit(TRAIN_CPU_LIMIT).set_memory_limit(TRAIN_MEMORY_LIMIT)
 
     # Deploy the CPR container using the artifacts produced by the train step
     deploy_model_to_endpoint(
         project_id=project_id,
         region=region,
-        # model_artifact is the GCS path where both models were saved
+        # model_artifact is the GCS folder holding the model bundle
         model=train.outputs["model_artifact"], 
         endpoint_name="fraudshield-hybrid-endpoint",
         display_name="fraudshield-hybrid-v1",
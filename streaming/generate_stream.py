@@ -1,52 +1,387 @@
-import time
+import argparse
+import bisect
+import concurrent.futures
+import itertools
 import json
+import multiprocessing
+import queue
 import random
-import logging
-from datetime import datetime, timezone
-from google.cloud import pubsub_v1
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 
 # --- Configuration ---
 PROJECT_ID = "fraudshield-v3-dev-5320"
 TOPIC_ID = "fraudshield-raw-events"
-NUM_MESSAGES = 500
-SLEEP_TIME = 0.5 # Send 2 transactions per second
-
-# Setup Publisher
-publisher = pubsub_v1.PublisherClient()
-topic_path = publisher.topic_path(PROJECT_ID, TOPIC_ID)
-
-customer_ids = [f"CUST_{i:04d}" for i in range(100)]
-card_ids = [f"CARD_{i:04d}" for i in range(50)]
-
-print(f"Publishing {NUM_MESSAGES} events to {topic_path}...")
-
-for i in range(NUM_MESSAGES):
-    data = {
-        "transaction_id": f"tx_{int(time.time())}_{i}",
-        "tenant_id": "tenant_A", # Simulating multi-tenancy
-        "customer_id": random.choice(customer_ids),
-        "card_id": random.choice(card_ids),
-        "amount": round(random.uniform(10, 500), 2),
-        "timestamp": datetime.now(timezone.utc).isoformat()
+
+# Load shape
+TARGET_EPS = 20000          # Events per second across all workers
+DURATION_SECONDS = 60
+TICK_SECONDS = 0.01         # Pacing granularity (events are generated per tick)
+
+# Entity population (drawn from Zipf so a few tenants/cards dominate, like prod)
+NUM_TENANTS = 20
+NUM_CARDS = 100000
+TENANT_ZIPF_S = 1.2
+CARD_ZIPF_S = 1.1
+
+# Attack bursts: every ATTACK_INTERVAL_SECONDS, for ATTACK_DURATION_SECONDS,
+# ATTACK_FRACTION of traffic hits a small set of attack cards with large amounts.
+ATTACK_INTERVAL_SECONDS = 30
+ATTACK_DURATION_SECONDS = 5
+ATTACK_FRACTION = 0.05
+ATTACK_CARDS = 10
+
+# Event-time disorder. Late events land behind the watermark (pipeline allows
+# 300s lateness); out-of-order events are jittered by a few seconds.
+LATE_FRACTION = 0.01
+MAX_LATENESS_SECONDS = 420
+OUT_OF_ORDER_FRACTION = 0.05
+MAX_JITTER_SECONDS = 15
+
+# Publisher batching & flow control
+BATCH_MAX_MESSAGES = 1000
+BATCH_MAX_BYTES = 1024 * 1024
+BATCH_MAX_LATENCY = 0.05
+FLOW_MAX_MESSAGES = 50000
+FLOW_MAX_BYTES = 64 * 1024 * 1024
+
+
+# --- Distributions ---
+class ZipfSampler:
+    """Samples ids 0..n-1 with P(k) proportional to 1 / (k+1)^s."""
+
+    def __init__(self, n, s, rng):
+        self.rng = rng
+        weights = [1.0 / (k + 1) ** s for k in range(n)]
+        self.cum_weights = list(itertools.accumulate(weights))
+        self.total = self.cum_weights[-1]
+
+    def sample(self, k):
+        # Same algorithm as random.choices(cum_weights=...) without re-validating
+        # the weights on every call.
+        cum, total, rand = self.cum_weights, self.total, self.rng.random
+        hi = len(cum) - 1
+        return [bisect.bisect(cum, rand() * total, 0, hi) for _ in range(k)]
+
+
+class EventFactory:
+    """Builds transaction events with Zipfian entities, attack bursts and disorder."""
+
+    def __init__(self, args, worker_id=0):
+        self.args = args
+        self.worker_id = worker_id
+        self.rng = random.Random(args.seed + worker_id)
+        self.tenants = [f"tenant_{i:03d}" for i in range(args.tenants)]
+        self.cards = [f"CARD_{i:07d}" for i in range(args.cards)]
+        self.attack_cards = [f"CARD_9999_ATTACK_{i:02d}" for i in range(ATTACK_CARDS)]
+        self.tenant_sampler = ZipfSampler(args.tenants, args.tenant_zipf, self.rng)
+        self.card_sampler = ZipfSampler(args.cards, args.card_zipf, self.rng)
+        self.seq = 0
+
+    def in_attack(self, elapsed):
+        if self.args.attack_interval <= 0:
+            return False
+        return (elapsed % self.args.attack_interval) < self.args.attack_duration
+
+    def make_batch(self, n, now, elapsed):
+        args, rng = self.args, self.rng
+        tenant_idx = self.tenant_sampler.sample(n)
+        card_idx = self.card_sampler.sample(n)
+        attack = self.in_attack(elapsed)
+
+        events = []
+        for i in range(n):
+            self.seq += 1
+            tenant = self.tenants[tenant_idx[i]]
+            card = self.cards[card_idx[i]]
+            amount = round(rng.lognormvariate(3.5, 1.0), 2)
+
+            # Simulate a "Velocity Attack" burst on a handful of cards
+            if attack and rng.random() < args.attack_fraction:
+                card = rng.choice(self.attack_cards)
+                amount = round(rng.uniform(900, 2000), 2)
+
+            event_ts = now
+            r = rng.random()
+            if r < args.late_fraction:
+                event_ts = now - timedelta(seconds=rng.uniform(0, args.max_lateness))
+            elif r < args.late_fraction + args.out_of_order_fraction:
+                event_ts = now - timedelta(seconds=rng.uniform(0, args.max_jitter))
+
+            events.append({
+                "transaction_id": f"tx_{self.worker_id}_{self.seq}",
+                "tenant_id": tenant,
+                "customer_id": f"CUST_{card_idx[i] % 100000:05d}",
+                "card_id": card,
+                "amount": amount,
+                "timestamp": event_ts.isoformat(),
+                # Wall clock at emission (event time can be backdated); start of freshness tracing
+                "emitted_at": now.isoformat()
+            })
+        return events
+
+
+# --- Sinks ---
+class PubSubSink:
+    """Publishes to Pub/Sub with explicit batching/flow control and tracks acks."""
+
+    def __init__(self, args):
+        from google.cloud import pubsub_v1
+        from google.cloud.pubsub_v1.types import (
+            BatchSettings, LimitExceededBehavior, PublishFlowControl, PublisherOptions
+        )
+
+        batch_settings = BatchSettings(
+            max_messages=args.batch_max_messages,
+            max_bytes=args.batch_max_bytes,
+            max_latency=args.batch_max_latency,
+        )
+        publisher_options = PublisherOptions(
+            flow_control=PublishFlowControl(
+                message_limit=args.flow_max_messages,
+                byte_limit=args.flow_max_bytes,
+                limit_exceeded_behavior=LimitExceededBehavior.BLOCK,
+            )
+        )
+        self.publisher = pubsub_v1.PublisherClient(batch_settings, publisher_options)
+        self.topic_path = self.publisher.topic_path(args.project_id, args.topic_id)
+        self.lock = threading.Lock()
+        self.acked = 0
+        self.failed = 0
+        self.last_error = None
+        self.pending = set()  # Publish futures not yet resolved
+
+    def _on_done(self, future):
+        try:
+            future.result()
+            with self.lock:
+                self.acked += 1
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+                self.last_error = e
+        with self.lock:
+            self.pending.discard(future)
+
+    def write(self, payloads):
+        for msg_bytes in payloads:
+            future = self.publisher.publish(self.topic_path, msg_bytes)
+            with self.lock:
+                self.pending.add(future)
+            future.add_done_callback(self._on_done)
+
+    def close(self):
+        # stop() sends the outstanding batches but doesn't block; wait for every ack before reporting
+        self.publisher.stop()
+        with self.lock:
+            pending = list(self.pending)
+        concurrent.futures.wait(pending)
+        # Callbacks run after a future resolves; let them finish counting
+        while True:
+            with self.lock:
+                if not self.pending:
+                    break
+            time.sleep(0.01)
+        if self.failed:
+            print(f"Publish errors: {self.failed} (last: {self.last_error})")
+
+
+class FileSink:
+    """Writes newline-delimited JSON; every written line counts as acknowledged."""
+
+    def __init__(self, path):
+        self.fh = open(path, "wb", buffering=1024 * 1024)
+        self.acked = 0
+        self.failed = 0
+
+    def write(self, payloads):
+        self.fh.write(b"\n".join(payloads) + b"\n")
+        self.acked += len(payloads)
+
+    def close(self):
+        self.fh.close()
+
+
+class QueueSink:
+    """In-process sink for offline benchmarks (e.g. feeding a local consumer)."""
+
+    def __init__(self, maxsize=0, drain=True):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.acked = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._drainer = None
+        if drain:
+            # Without a consumer attached we drain ourselves so the queue stays bounded
+            self._drainer = threading.Thread(target=self._drain, daemon=True)
+            self._drainer.start()
+
+    def _drain(self):
+        while not self._stop.is_set() or not self.queue.empty():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def write(self, payloads):
+        for msg_bytes in payloads:
+            self.queue.put(msg_bytes)
+        self.acked += len(payloads)
+
+    def close(self):
+        self._stop.set()
+        if self._drainer:
+            self._drainer.join()
+
+
+def build_sink(args, worker_id):
+    if args.sink == "pubsub":
+        return PubSubSink(args)
+    if args.sink == "file":
+        path = args.output if args.workers == 1 else f"{args.output}.{worker_id}"
+        return FileSink(path)
+    return QueueSink(maxsize=args.queue_size)
+
+
+# --- Load Loop ---
+def run_worker(args, worker_id, rate, sink=None, stats_queue=None):
+    """Generates `rate` events/sec for args.duration seconds into a sink."""
+    factory = EventFactory(args, worker_id)
+    sink = sink or build_sink(args, worker_id)
+
+    sent = 0
+    carry = 0.0
+    start = time.perf_counter()
+    next_tick = start
+    next_report = start + args.report_every
+
+    while True:
+        now_perf = time.perf_counter()
+        elapsed = now_perf - start
+        if elapsed >= args.duration:
+            break
+
+        # Pace on a fixed tick; carry the fractional remainder between ticks
+        carry += rate * args.tick
+        n = int(carry)
+        carry -= n
+        if n:
+            events = factory.make_batch(n, datetime.now(timezone.utc), elapsed)
+            sink.write([json.dumps(e).encode("utf-8") for e in events])
+            sent += n
+
+        if worker_id == 0 and now_perf >= next_report:
+            print(f"[{elapsed:6.1f}s] sent={sent} acked={sink.acked} "
+                  f"(~{sent / max(elapsed, 1e-9):,.0f} ev/s per worker)")
+            next_report += args.report_every
+
+        next_tick += args.tick
+        sleep_for = next_tick - time.perf_counter()
+        if sleep_for > 0:
+            time.sleep(sleep_for)
+        elif -sleep_for > 1.0:
+            # We are more than a second behind; don't try to catch up in a burst
+            next_tick = time.perf_counter()
+
+    send_seconds = time.perf_counter() - start
+    sink.close()
+    total_seconds = time.perf_counter() - start
+
+    stats = {
+        "worker_id": worker_id,
+        "sent": sent,
+        "acked": sink.acked,
+        "failed": sink.failed,
+        "send_seconds": send_seconds,
+        "total_seconds": total_seconds,
     }
-    
-    # Simulate a "Velocity Attack" on one specific card
-    if i % 20 == 0:
-        data["card_id"] = "CARD_9999_ATTACK"
-        data["amount"] = 1000.00
-        print(f"!!! Sending ATTACK transaction on {data['card_id']} !!!")
-
-    msg_bytes = json.dumps(data).encode("utf-8")
-    
-    try:
-        future = publisher.publish(topic_path, msg_bytes)
-        # future.result() # Block until published (optional)
-    except Exception as e:
-        print(f"Error: {e}")
-
-    if i % 10 == 0:
-        print(f"Sent {i} events...")
-        
-    time.sleep(SLEEP_TIME)
-
-print("Stream simulation complete.")
+    if stats_queue is not None:
+        stats_queue.put(stats)
+    return stats
+
+
+def report(stats, target_eps):
+    sent = sum(s["sent"] for s in stats)
+    acked = sum(s["acked"] for s in stats)
+    failed = sum(s["failed"] for s in stats)
+    send_seconds = max(s["send_seconds"] for s in stats)
+    total_seconds = max(s["total_seconds"] for s in stats)
+
+    print("--- Load Generator Summary ---")
+    print(f"Target rate:        {target_eps:,.0f} ev/s")
+    print(f"Events sent:        {sent:,} in {send_seconds:.1f}s ({sent / send_seconds:,.0f} ev/s)")
+    print(f"Events acked:       {acked:,} in {total_seconds:.1f}s ({acked / total_seconds:,.0f} ev/s)")
+    print(f"Publish failures:   {failed:,}")
+    return {"sent": sent, "acked": acked, "failed": failed,
+            "sent_eps": sent / send_seconds, "acked_eps": acked / total_seconds}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="FraudShield transaction stream load generator")
+    parser.add_argument("--sink", choices=["pubsub", "file", "queue"], default="pubsub")
+    parser.add_argument("--project_id", default=PROJECT_ID)
+    parser.add_argument("--topic_id", default=TOPIC_ID)
+    parser.add_argument("--output", default="events.jsonl", help="Path for the file sink")
+    parser.add_argument("--queue_size", type=int, default=100000, help="Bound for the queue sink")
+
+    parser.add_argument("--rate", type=float, default=TARGET_EPS, help="Target events/sec (total)")
+    parser.add_argument("--duration", type=float, default=DURATION_SECONDS)
+    parser.add_argument("--workers", type=int, default=1, help="Generator processes sharing the rate")
+    parser.add_argument("--tick", type=float, default=TICK_SECONDS)
+    parser.add_argument("--report_every", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42)
+
+    parser.add_argument("--tenants", type=int, default=NUM_TENANTS)
+    parser.add_argument("--cards", type=int, default=NUM_CARDS)
+    parser.add_argument("--tenant_zipf", type=float, default=TENANT_ZIPF_S)
+    parser.add_argument("--card_zipf", type=float, default=CARD_ZIPF_S)
+
+    parser.add_argument("--attack_interval", type=float, default=ATTACK_INTERVAL_SECONDS,
+                        help="Seconds between attack bursts (0 disables)")
+    parser.add_argument("--attack_duration", type=float, default=ATTACK_DURATION_SECONDS)
+    parser.add_argument("--attack_fraction", type=float, default=ATTACK_FRACTION)
+
+    parser.add_argument("--late_fraction", type=float, default=LATE_FRACTION)
+    parser.add_argument("--max_lateness", type=float, default=MAX_LATENESS_SECONDS)
+    parser.add_argument("--out_of_order_fraction", type=float, default=OUT_OF_ORDER_FRACTION)
+    parser.add_argument("--max_jitter", type=float, default=MAX_JITTER_SECONDS)
+
+    parser.add_argument("--batch_max_messages", type=int, default=BATCH_MAX_MESSAGES)
+    parser.add_argument("--batch_max_bytes", type=int, default=BATCH_MAX_BYTES)
+    parser.add_argument("--batch_max_latency", type=float, default=BATCH_MAX_LATENCY)
+    parser.add_argument("--flow_max_messages", type=int, default=FLOW_MAX_MESSAGES)
+    parser.add_argument("--flow_max_bytes", type=int, default=FLOW_MAX_BYTES)
+
+    args = parser.parse_args(argv)
+    if args.sink == "queue" and args.workers != 1:
+        parser.error("--sink queue is in-process and requires --workers 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"Generating {args.rate:,.0f} ev/s for {args.duration:.0f}s "
+          f"-> {args.sink} ({args.workers} worker(s))...")
+
+    per_worker_rate = args.rate / args.workers
+    if args.workers == 1:
+        stats = [run_worker(args, 0, per_worker_rate)]
+    else:
+        stats_queue = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=run_worker, args=(args, w, per_worker_rate, None, stats_queue))
+            for w in range(args.workers)
+        ]
+        for p in procs:
+            p.start()
+        stats = [stats_queue.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+    report(stats, args.rate)
+    print("Stream simulation complete.")
+
+
+if __name__ == "__main__":
+    main()
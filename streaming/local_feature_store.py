@@ -0,0 +1,186 @@
+"""
+Embedded feature store: a memory-mapped, fixed-record hash table on local disk.
+
+For on-prem / low-latency deployments where an online read should be a memory
+access rather than a remote call. One writer (the streaming pipeline, in
+batches) and any number of reader processes (API workers) share the file.
+
+Layout:
+
+    [0:4096]   header: MAGIC b"FSLFS001", version, record size, capacity, key size, entry count
+    [4096:..]  capacity x 128-byte records, open addressing with linear probing
+
+    record: seq (uint64) | key_hash (uint64, 0 = empty) | key_len (uint16) | key (62 bytes)
+            | txn_count_10m (int64) | txn_sum_10m (float64) | feature_time_us (int64)
+            | last_event_us (int64) | written_at_us (int64) | padding
+
+Keys are "tenant#card" (UTF-8, at most 62 bytes). Records are never moved or
+deleted, so a key's slot is stable once inserted. A write never replaces a
+record with an older feature_time_us: panes of overlapping sliding windows
+(and late panes) reach the writer out of order.
+
+Readers take no locks. Each record carries a sequence counter (a seqlock): the
+writer makes it odd, writes the body, then makes it even again; a reader copies
+the fields and retries if the counter was odd or changed while it read. A
+record left odd by a writer that died mid-write reads as missing, and the next
+writer to reach it rewrites it. Writers serialize on flock() plus a thread
+lock. The capacity is fixed at creation (size it for the expected number of
+tenant#card keys at <= 70% load; inserts fail past 90%).
+
+The API's reader (api/app/services/local_feature_store.py) must match this layout.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+MAGIC = b"FSLFS001"
+VERSION = 1
+HEADER_SIZE = 4096
+RECORD_SIZE = 128
+KEY_SIZE = 62
+MAX_LOAD = 0.9
+MAX_SPINS = 10_000
+
+_HEADER = struct.Struct("<8sIIQIQ")          # magic, version, record_size, capacity, key_size, count
+_COUNT_OFFSET = 8 + 4 + 4 + 8 + 4
+_SEQ = struct.Struct("<Q")
+_KEY = struct.Struct(f"<QH{KEY_SIZE}s")       # key_hash, key_len, key (at record offset 8)
+_VALUES = struct.Struct("<qdqqq")            # at record offset 8 + _KEY.size
+_VALUES_OFFSET = 8 + _KEY.size
+
+
+class TableFull(Exception):
+    pass
+
+
+def key_hash(key: bytes):
+    # Never 0: 0 marks an empty slot
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+def create_table(path, capacity):
+    """
+    Creates an empty table (sparse file); capacity is rounded up to a power of two.
+    Raises FileExistsError rather than truncating a live table.
+
+    The file is built under a temporary name and hard-linked into place, so a
+    reader never maps a table whose header isn't written yet.
+    """
+    capacity = 1 << max(capacity - 1, 1).bit_length()
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.truncate(HEADER_SIZE + capacity * RECORD_SIZE)
+            f.write(_HEADER.pack(MAGIC, VERSION, RECORD_SIZE, capacity, KEY_SIZE, 0))
+            f.flush()
+            os.fsync(f.fileno())
+        os.link(tmp, path)  # Unlike rename, fails if the path exists
+    finally:
+        os.unlink(tmp)
+    return path
+
+
+class LocalFeatureTable:
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR if writable else os.O_RDONLY)
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        self.mm = mmap.mmap(self.fd, 0, access=access)
+        magic, version, record_size, capacity, key_size, _ = _HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE or key_size != KEY_SIZE:
+            raise ValueError(f"{path} is not a v{VERSION} FraudShield local feature table")
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return _SEQ.unpack_from(self.mm, _COUNT_OFFSET)[0]
+
+    # --- lock-free read ---
+    def _read(self, off, fields, at):
+        """Seqlock read of one struct inside the record at `off`; None if it never settles."""
+        mm = self.mm
+        for _ in range(MAX_SPINS):
+            seq = _SEQ.unpack_from(mm, off)[0]
+            if seq & 1:
+                continue  # Being written
+            values = fields.unpack_from(mm, off + at)
+            if _SEQ.unpack_from(mm, off)[0] == seq:
+                return values
+        return None
+
+    def _find(self, key, h, writer=False):
+        """(offset of key's record, None) or (None, offset of the empty slot ending its probe chain)."""
+        mask = self.mask
+        i = h & mask
+        for _ in range(self.capacity):
+            off = HEADER_SIZE + i * RECORD_SIZE
+            if writer:
+                # Under the writer lock nothing else is writing; odd means a writer died here
+                slot = _KEY.unpack_from(self.mm, off + 8)
+            else:
+                slot = self._read(off, _KEY, 8)
+                if slot is None:
+                    # Never settled (a writer died mid-write): not the end of the chain, keep probing
+                    i = (i + 1) & mask
+                    continue
+            slot_hash, key_len, slot_key = slot
+            if slot_hash == 0:
+                return None, off
+            if slot_hash == h and slot_key[:key_len] == key:
+                return off, None
+            i = (i + 1) & mask
+        return None, None
+
+    def get(self, key):
+        """(txn_count_10m, txn_sum_10m, feature_time_us, last_event_us, written_at_us) or None."""
+        key = key.encode() if isinstance(key, str) else key
+        off, _ = self._find(key, key_hash(key))
+        if off is None:
+            return None
+        return self._read(off, _VALUES, _VALUES_OFFSET)
+
+    # --- writer ---
+    def write_batch(self, rows):
+        """
+        Upserts rows of (key, txn_count_10m, txn_sum_10m, feature_time_us, last_event_us,
+        written_at_us) under the writer lock. A row older (by feature_time_us) than
+        the stored one is skipped; returns how many were.
+        """
+        mm = self.mm
+        stale = 0
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            count = len(self)
+            try:
+                for key, *values in rows:
+                    key = key.encode() if isinstance(key, str) else key
+                    if len(key) > KEY_SIZE:
+                        raise ValueError(f"Key longer than {KEY_SIZE} bytes: {key!r}")
+                    h = key_hash(key)
+                    off, empty = self._find(key, h, writer=True)
+                    if off is None:
+                        if empty is None or count + 1 > self.capacity * MAX_LOAD:
+                            raise TableFull(f"{self.path}: {count:,} keys in {self.capacity:,} slots")
+                        off = empty
+                        count += 1
+                    elif values[2] < _VALUES.unpack_from(mm, off + _VALUES_OFFSET)[2]:
+                        stale += 1
+                        continue
+                    seq = _SEQ.unpack_from(mm, off)[0] | 1
+                    _SEQ.pack_into(mm, off, seq)                          # odd: readers retry
+                    _KEY.pack_into(mm, off + 8, h, len(key), key)
+                    _VALUES.pack_into(mm, off + _VALUES_OFFSET, *values)
+                    _SEQ.pack_into(mm, off, seq + 1)                      # even: published
+            finally:
+                # Rows before a failure are in; keep the count in step with them
+                _SEQ.pack_into(mm, _COUNT_OFFSET, count)
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+        return stale
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
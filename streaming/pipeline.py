@@ -1,14 +1,19 @@
 import argparse
 import json
 import logging
-from datetime import datetime
+import os
+import time
+from datetime import datetime, timezone
 
 import apache_beam as beam
+from apache_beam.metrics import Metrics
 from apache_beam.options.pipeline_options import PipelineOptions, GoogleCloudOptions, StandardOptions
 from apache_beam.transforms.trigger import AfterWatermark, AfterProcessingTime, AccumulationMode
 from apache_beam.transforms.window import SlidingWindows
 from google.cloud import aiplatform
 
+import local_feature_store
+
 # --- Configuration ---
 PROJECT_ID = "fraudshield-v3-dev-5320"
 REGION = "us-central1"
@@ -19,14 +24,65 @@ ALLOWED_LATENESS_SECONDS = 300  # 5 minutes
 WINDOW_SIZE_SECONDS = 600       # 10 minutes
 WINDOW_PERIOD_SECONDS = 60      # 1 minute
 
+# Upper bounds (seconds) of the lag histogram buckets; the API uses the same ones
+LAG_BUCKETS = [0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800]
+
+def to_us(iso_ts):
+    return int(datetime.fromisoformat(iso_ts.replace("Z", "+00:00")).timestamp() * 1e6)
+
+class LagHistogram:
+    """
+    Per-stage lag exported as Beam metrics: a distribution (count/min/max/mean)
+    plus one counter per bucket, "<stage>_lag_le_<bound>s", which Dataflow
+    publishes to Cloud Monitoring alongside the job.
+    """
+    def __init__(self, stage):
+        self.dist = Metrics.distribution("freshness", f"{stage}_lag_ms")
+        self.buckets = [(b, Metrics.counter("freshness", f"{stage}_lag_le_{b}s")) for b in LAG_BUCKETS]
+        self.overflow = Metrics.counter("freshness", f"{stage}_lag_gt_{LAG_BUCKETS[-1]}s")
+
+    def observe(self, seconds):
+        self.dist.update(int(seconds * 1000))
+        for bound, counter in self.buckets:
+            if seconds <= bound:
+                counter.inc()
+                return
+        self.overflow.inc()
+
 class ParseAndTimestamp(beam.DoFn):
-    def process(self, element):
+    """
+    Parses events and stamps the tracing timestamps (epoch us) carried through to
+    the Feature Store: _event_us (event time), _emitted_us (generator wall clock),
+    _published_us (Pub/Sub publish time) and _parsed_us (arrival in the pipeline).
+    """
+    def setup(self):
+        self.emit_lag = LagHistogram("emit")        # event time -> emitted (late/backdated events)
+        self.publish_lag = LagHistogram("publish")  # emitted -> Pub/Sub publish (client batching)
+        self.deliver_lag = LagHistogram("deliver")  # Pub/Sub publish -> pipeline (subscription backlog)
+
+    def process(self, message):
         try:
-            record = json.loads(element.decode("utf-8"))
+            record = json.loads(message.data.decode("utf-8"))
             event_ts = record.get("timestamp")
             if event_ts:
-                dt = datetime.fromisoformat(event_ts.replace("Z", "+00:00"))
-                yield beam.window.TimestampedValue(record, dt.timestamp())
+                parsed_us = int(time.time() * 1e6)
+                record["_event_us"] = to_us(event_ts)
+                record["_parsed_us"] = parsed_us
+                published_us = None
+                publish_time = getattr(message, "publish_time", None)
+                if publish_time:
+                    # Naive (UTC) when decoded from the proto on Dataflow
+                    if publish_time.tzinfo is None:
+                        publish_time = publish_time.replace(tzinfo=timezone.utc)
+                    published_us = int(publish_time.timestamp() * 1e6)
+                    record["_published_us"] = published_us
+                    self.deliver_lag.observe((parsed_us - published_us) / 1e6)
+                if record.get("emitted_at"):
+                    record["_emitted_us"] = to_us(record["emitted_at"])
+                    self.emit_lag.observe((record["_emitted_us"] - record["_event_us"]) / 1e6)
+                    if published_us:
+                        self.publish_lag.observe((published_us - record["_emitted_us"]) / 1e6)
+                yield beam.window.TimestampedValue(record, record["_event_us"] / 1e6)
         except Exception as e:
             logging.error(f"Parse error: {e}")
 
@@ -37,39 +93,143 @@ class ExtractKey(beam.DoFn):
         key = f"{tenant}#{card}"
         yield (key, element)
 
-class WriteToFeatureStore(beam.DoFn):
+class VelocityCombineFn(beam.CombineFn):
+    """
+    Count and sum of amounts per key/window, plus the newest event time and
+    pipeline arrival time in the pane (for freshness tracing; 0 when untraced).
+    Also used by features/velocity_backfill.py.
+    """
+    def create_accumulator(self):
+        return (0, 0.0, 0, 0)
+
+    def add_input(self, acc, element):
+        return (acc[0] + 1, acc[1] + element["amount"],
+                max(acc[2], element.get("_event_us", 0)), max(acc[3], element.get("_parsed_us", 0)))
+
+    def merge_accumulators(self, accumulators):
+        counts, sums, events, parsed = zip(*accumulators)
+        return (sum(counts), sum(sums), max(events), max(parsed))
+
+    def extract_output(self, acc):
+        return {"count": acc[0], "sum": acc[1], "last_event_us": acc[2], "last_parsed_us": acc[3]}
+
+class FeatureWriter(beam.DoFn):
+    """
+    Base for the feature-store backends the pipeline can write to. Subclasses
+    implement write(key, agg, window_end_us, written_us); the freshness lag
+    histograms are shared so every backend reports the same stages.
+    """
+    def setup(self):
+        self.pane_lag = LagHistogram("pane")          # newest arrival in pane -> write (window/trigger wait)
+        self.pipeline_lag = LagHistogram("pipeline")  # newest event in pane -> write (event time to feature)
+        self.write_latency = LagHistogram("write")    # backend write call
+
+    def observe_write(self, agg, written_us):
+        if agg["last_parsed_us"]:
+            self.pane_lag.observe((written_us - agg["last_parsed_us"]) / 1e6)
+        if agg["last_event_us"]:
+            self.pipeline_lag.observe((written_us - agg["last_event_us"]) / 1e6)
+
+    def process(self, element, window=beam.DoFn.WindowParam):
+        key, agg = element
+        self.write(key, agg, window.end.micros, int(time.time() * 1e6))
+
+class WriteToFeatureStore(FeatureWriter):
+    """Vertex AI Feature Store (entity type "cards", keyed by card id)."""
     def __init__(self, project, region, fs_id):
         self.project = project
         self.region = region
         self.fs_id = fs_id
 
     def setup(self):
+        super().setup()
         aiplatform.init(project=self.project, location=self.region)
         self.fs = aiplatform.Featurestore(featurestore_name=self.fs_id)
         self.entity = self.fs.get_entity_type("cards")
 
-    def process(self, element, window=beam.DoFn.WindowParam):
-        key, agg = element
+    def write(self, key, agg, window_end_us, written_us):
         _, card_id = key.split("#")
-        ts = window.end.to_utc_datetime()
+        ts = datetime.fromtimestamp(window_end_us / 1e6, tz=timezone.utc)
+        self.observe_write(agg, written_us)
         try:
             self.entity.write_feature_values(
                 entity_id=card_id,
                 feature_values={
                     "txn_count_10m": int(agg["count"]),
-                    "txn_sum_10m": float(agg["sum"])
+                    "txn_sum_10m": float(agg["sum"]),
+                    "last_event_us": int(agg["last_event_us"]),
+                    "written_at_us": written_us
                 },
                 feature_time=ts
             )
+            self.write_latency.observe(time.time() - written_us / 1e6)
             logging.info(f"Updated {key} @ {ts}: {agg}")
         except Exception as e:
             logging.error(f"Failed to write {key}: {e}")
 
+class WriteToLocalFeatureStore(FeatureWriter):
+    """
+    Embedded memory-mapped table (see local_feature_store.py), keyed by tenant#card.
+    Panes are buffered and upserted in batches of `batch_size` (and at the end of
+    every bundle), one writer lock per batch. written_at is the batch write time.
+    A pane older than the one already stored for the card is skipped (and counted).
+    """
+    def __init__(self, path, capacity, batch_size=500):
+        self.path = path
+        self.capacity = capacity
+        self.batch_size = batch_size
+
+    def setup(self):
+        super().setup()
+        if not os.path.exists(self.path):
+            try:
+                local_feature_store.create_table(self.path, self.capacity)
+            except FileExistsError:
+                pass  # Another worker thread created it first
+        self.table = local_feature_store.LocalFeatureTable(self.path, writable=True)
+        self.batch_rows = Metrics.distribution("local_store", "batch_rows")
+        self.stale_rows = Metrics.counter("local_store", "stale_rows_skipped")
+
+    def start_bundle(self):
+        self.pending = []
+
+    def write(self, key, agg, window_end_us, written_us):
+        self.pending.append((key, agg, window_end_us))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        written_us = int(time.time() * 1e6)
+        rows = []
+        for key, agg, window_end_us in self.pending:
+            self.observe_write(agg, written_us)
+            rows.append((key, int(agg["count"]), float(agg["sum"]), window_end_us,
+                         int(agg["last_event_us"]), written_us))
+        try:
+            self.stale_rows.inc(self.table.write_batch(rows))
+            self.write_latency.observe(time.time() - written_us / 1e6)
+            self.batch_rows.update(len(rows))
+        except Exception as e:
+            logging.error(f"Failed to write {len(rows)} rows to {self.path}: {e}")
+        self.pending = []
+
+    def finish_bundle(self):
+        self.flush()
+
+    def teardown(self):
+        self.table.close()
+
 def run():
     parser = argparse.ArgumentParser()
     parser.add_argument("--job_name", required=True)
     parser.add_argument("--runner", default="DataflowRunner")
     parser.add_argument("--temp_location", required=True)
+    # "vertex" (Vertex AI Feature Store) or "local" (memory-mapped table on this host)
+    parser.add_argument("--feature_backend", choices=["vertex", "local"], default="vertex")
+    parser.add_argument("--local_store_path", default="/var/lib/fraudshield/features.fsl")
+    parser.add_argument("--local_store_capacity", type=int, default=4_000_000)
     args, beam_args = parser.parse_known_args()
 
     options = PipelineOptions(beam_args)
@@ -80,14 +240,19 @@ def run():
     google_opts.temp_location = args.temp_location
     google_opts.staging_location = args.temp_location
     
-    # Force Dataflow Runner
-    options.view_as(StandardOptions).runner = "DataflowRunner"
+    # Dataflow by default; the local backend runs on the host that serves it
+    options.view_as(StandardOptions).runner = args.runner
     options.view_as(StandardOptions).streaming = True
 
+    if args.feature_backend == "local":
+        writer = WriteToLocalFeatureStore(args.local_store_path, args.local_store_capacity)
+    else:
+        writer = WriteToFeatureStore(PROJECT_ID, REGION, FEATURE_STORE_ID)
+
     with beam.Pipeline(options=options) as p:
         (
             p
-            | "Read" >> beam.io.ReadFromPubSub(subscription=SUBSCRIPTION_ID)
+            | "Read" >> beam.io.ReadFromPubSub(subscription=SUBSCRIPTION_ID, with_attributes=True)
             | "Parse" >> beam.ParDo(ParseAndTimestamp())
             | "Key" >> beam.ParDo(ExtractKey())
             | "Window" >> beam.WindowInto(
@@ -96,8 +261,8 @@ def run():
                 accumulation_mode=AccumulationMode.ACCUMULATING,
                 allowed_lateness=ALLOWED_LATENESS_SECONDS
             )
-            | "Aggregate" >> beam.CombinePerKey(lambda x: {"count": len(x), "sum": sum(i["amount"] for i in x)})
-            | "Write" >> beam.ParDo(WriteToFeatureStore(PROJECT_ID, REGION, FEATURE_STORE_ID))
+            | "Aggregate" >> beam.CombinePerKey(VelocityCombineFn())
+            | "Write" >> beam.ParDo(writer)
         )
 
 if __name__ == "__main__":
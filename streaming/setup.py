@@ -8,4 +8,5 @@ setuptools.setup(
         'apache-beam[gcp]==2.50.0'
     ],
     packages=setuptools.find_packages(),
+    py_modules=['local_feature_store'],
 )